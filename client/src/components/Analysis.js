@@ -36,7 +36,7 @@ const Analysis = () => {
     setLoading(true);
     try {
       const response = await api.post('/socialmedia/api/analysis', {
-        keywords: values.keywords,
+        keywords: values.keywords || [],
         start_date: values.dateRange ? values.dateRange[0].format('YYYY-MM-DD') : null,
         end_date: values.dateRange ? values.dateRange[1].format('YYYY-MM-DD') : null,
         platforms: values.platforms,
@@ -78,11 +78,11 @@ const Analysis = () => {
               <Form.Item
                 label="分析关键词"
                 name="keywords"
-                rules={[{ required: true, message: '请输入关键词' }]}
+                extra="不填关键词时按时间和平台分析全部评论"
               >
                 <Select
                   mode="tags"
-                  placeholder="请输入关键词，支持多个"
+                  placeholder="可选，支持多个关键词"
                   style={{ width: '100%' }}
                 >
                   <Option value="petlibro">petlibro</Option>
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+问卷AI长任务后台执行
+开放题翻译、标准打标、参考标签打标可能持续数十分钟，请求带 background 标志时改为提交到后台线程池执行，
+接口立即返回；处理过程中按批次上报进度（已完成/总批次、预计剩余时间、API调用次数、部分结果），
+按分析ID汇总为事件流，供 SSE 接口推送或轮询接口查询；
+某分析ID的任务全部结束超过保留时间后，任务（含结果）和事件流一起从内存中移除
+"""
+
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+
+# 每个分析ID保留的最近事件数（SSE 断线重连时按事件ID补发）
+MAX_EVENTS_PER_ANALYSIS = 500
+
+
+class AnalysisEventChannel:
+    """单个分析ID的事件流，事件按递增序号保存"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=MAX_EVENTS_PER_ANALYSIS)
+        self._next_id = 1
+
+    def publish(self, event_type, data):
+        with self._condition:
+            self._events.append({'id': self._next_id, 'event': event_type, 'data': data})
+            self._next_id += 1
+            self._condition.notify_all()
+
+    def wait_for_events(self, after_id, timeout):
+        """返回序号大于 after_id 的事件，没有新事件时最多等待 timeout 秒"""
+        with self._condition:
+            if not self._events or self._events[-1]['id'] <= after_id:
+                self._condition.wait(timeout)
+            return [event for event in self._events if event['id'] > after_id]
+
+
+class AnalysisJob:
+    """一个后台任务的状态与进度"""
+
+    def __init__(self, analysis_id, job_type, channel):
+        self.job_id = uuid.uuid4().hex
+        self.analysis_id = analysis_id
+        self.job_type = job_type
+        self.status = JOB_QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = {
+            'stage': None,
+            'column': None,
+            'completed_batches': 0,
+            'total_batches': 0,
+            'api_calls': 0,
+            'eta_seconds': None
+        }
+        self.result = None
+        self.error = None
+        self.status_code = None
+        self._channel = channel
+        self._lock = threading.Lock()
+
+    def report(self, progress):
+        """
+        任务执行过程中的进度回调（由分类器按批次调用）
+
+        Args:
+            progress: {'stage', 'column', 'completed_batches', 'total_batches', 'api_calls', 'partial_results'}
+        """
+        partial_results = progress.pop('partial_results', None)
+        with self._lock:
+            self.progress.update(progress)
+            completed = self.progress['completed_batches']
+            total = self.progress['total_batches']
+            elapsed = time.time() - (self.started_at or self.created_at)
+            if completed and total:
+                self.progress['eta_seconds'] = round(elapsed / completed * (total - completed), 1)
+            snapshot = dict(self.progress)
+
+        data = {'jobId': self.job_id, 'jobType': self.job_type, **snapshot}
+        if partial_results:
+            data['partial_results'] = partial_results
+        self._channel.publish('progress', data)
+
+    def _set_status(self, status, **fields):
+        with self._lock:
+            self.status = status
+            for key, value in fields.items():
+                setattr(self, key, value)
+        event_data = {'jobId': self.job_id, 'jobType': self.job_type, 'status': status}
+        if status == JOB_FAILED:
+            event_data['error'] = self.error
+        self._channel.publish(status, event_data)
+
+    def is_finished(self):
+        return self.status in (JOB_COMPLETED, JOB_FAILED)
+
+    def to_dict(self, include_result=True):
+        with self._lock:
+            data = {
+                'jobId': self.job_id,
+                'analysisId': self.analysis_id,
+                'jobType': self.job_type,
+                'status': self.status,
+                'createdAt': self.created_at,
+                'startedAt': self.started_at,
+                'finishedAt': self.finished_at,
+                'progress': dict(self.progress),
+                'error': self.error
+            }
+            if include_result and self.status == JOB_COMPLETED:
+                data['result'] = self.result
+        return data
+
+
+class AnalysisJobManager:
+    """后台任务管理：有界线程池执行任务，按分析ID维护任务列表和事件流"""
+
+    def __init__(self, max_workers=None, retention_seconds=None):
+        """
+        Args:
+            max_workers: 并发任务数，默认读取环境变量 QUESTIONNAIRE_JOB_WORKERS
+            retention_seconds: 任务全部结束后保留任务结果和事件流的时间，默认读取环境变量
+                QUESTIONNAIRE_JOB_RETENTION_MINUTES（默认60分钟）
+        """
+        if max_workers is None:
+            max_workers = int(os.getenv('QUESTIONNAIRE_JOB_WORKERS', 2))
+        if retention_seconds is None:
+            retention_seconds = float(os.getenv('QUESTIONNAIRE_JOB_RETENTION_MINUTES', 60)) * 60
+        self.retention_seconds = max(0.0, retention_seconds)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='questionnaire-job')
+        self._lock = threading.Lock()
+        self._jobs = {}         # analysis_id -> {job_type: 最近一次任务}
+        self._channels = {}     # analysis_id -> AnalysisEventChannel
+
+    def channel(self, analysis_id):
+        with self._lock:
+            if analysis_id not in self._channels:
+                self._channels[analysis_id] = AnalysisEventChannel()
+            return self._channels[analysis_id]
+
+    def submit(self, analysis_id, job_type, task, *args, **kwargs):
+        """
+        提交后台任务；同一分析ID同类任务仍在执行时直接返回该任务，不重复提交
+
+        task 以 progress=AnalysisJob.report 关键字参数调用，返回 (结果字典, HTTP状态码)
+        """
+        self._evict_finished()
+        channel = self.channel(analysis_id)
+        with self._lock:
+            current = self._jobs.get(analysis_id, {}).get(job_type)
+            if current and not current.is_finished():
+                logger.info(f"⏳ 分析 {analysis_id} 的 {job_type} 任务正在执行，复用任务 {current.job_id}")
+                return current
+            job = AnalysisJob(analysis_id, job_type, channel)
+            self._jobs.setdefault(analysis_id, {})[job_type] = job
+
+        channel.publish(JOB_QUEUED, {'jobId': job.job_id, 'jobType': job_type, 'status': JOB_QUEUED})
+        self._executor.submit(self._run, job, task, args, kwargs)
+        logger.info(f"🚀 已提交后台任务 {job_type}，分析ID: {analysis_id}，任务ID: {job.job_id}")
+        return job
+
+    def _run(self, job, task, args, kwargs):
+        job._set_status(JOB_RUNNING, started_at=time.time())
+        try:
+            result, status_code = task(*args, progress=job.report, **kwargs)
+        except Exception as e:
+            logger.error(f"❌ 后台任务 {job.job_type} 异常，分析ID: {job.analysis_id}: {e}")
+            job._set_status(JOB_FAILED, error=str(e), status_code=500, finished_at=time.time())
+            return
+
+        if status_code >= 400:
+            job._set_status(JOB_FAILED, error=result.get('error'), status_code=status_code, finished_at=time.time())
+        else:
+            job._set_status(JOB_COMPLETED, result=result, status_code=status_code, finished_at=time.time())
+        logger.info(f"✅ 后台任务 {job.job_type} 结束，状态: {job.status}，分析ID: {job.analysis_id}")
+
+    def get_jobs(self, analysis_id):
+        self._evict_finished()
+        with self._lock:
+            return list(self._jobs.get(analysis_id, {}).values())
+
+    def _evict_finished(self):
+        """移除任务全部结束超过保留时间的分析ID（任务结果和事件流一起释放）"""
+        deadline = time.time() - self.retention_seconds
+        with self._lock:
+            expired = [
+                analysis_id for analysis_id, jobs in self._jobs.items()
+                if all(job.is_finished() and job.finished_at is not None and job.finished_at < deadline
+                       for job in jobs.values())
+            ]
+            for analysis_id in expired:
+                del self._jobs[analysis_id]
+                self._channels.pop(analysis_id, None)
+        if expired:
+            logger.info(f"🧹 释放 {len(expired)} 个分析ID的已结束后台任务和事件流")
+
+    def has_active_jobs(self, analysis_id):
+        return any(not job.is_finished() for job in self.get_jobs(analysis_id))
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+问卷分析会话存储
+替代 main.py 中模块级的 analysis_results 字典：
+- 每个分析会话的元数据（文件路径、题型、各步骤结果等）持久化到磁盘，服务重启后仍可访问
+- DataFrame 上传时写入磁盘（优先 Parquet 列式格式，不支持时回退为 pickle），
+  内存中按字节数做LRU淘汰，被淘汰的会话再次访问时惰性重新加载
+- 超过TTL未访问的会话自动清理
+
+接口与字典一致（in / [] / items / keys），路由代码无需改动
+"""
+
+import os
+import re
+import time
+import pickle
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import pyarrow  # 仅用于判断 Parquet 是否可用
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DATAFRAME_KEY = 'dataframe'
+META_FILENAME = 'meta.pkl'
+PARQUET_FILENAME = 'dataframe.parquet'
+PICKLE_FILENAME = 'dataframe.pkl'
+
+# 分析ID只允许字母、数字、下划线和连字符（uuid4），防止拼接路径越界
+_ANALYSIS_ID_PATTERN = re.compile(r'^[\w-]+$')
+
+
+class AnalysisSession(MutableMapping):
+    """单个分析会话：元数据常驻内存，DataFrame 由会话存储按需加载"""
+
+    def __init__(self, store, analysis_id, data, dataframe=None, dataframe_file=None):
+        self._store = store
+        self.analysis_id = analysis_id
+        self._data = data
+        self._dataframe = dataframe
+        self._dataframe_file = dataframe_file
+
+    def has_dataframe(self):
+        return self._dataframe is not None or self._dataframe_file is not None
+
+    def __getitem__(self, key):
+        if key == DATAFRAME_KEY:
+            if not self.has_dataframe():
+                raise KeyError(key)
+            return self._store._load_dataframe(self)
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        if key == DATAFRAME_KEY:
+            self._store._replace_dataframe(self, value)
+            return
+        self._data[key] = value
+        self._store.save(self.analysis_id)
+
+    def __delitem__(self, key):
+        if key == DATAFRAME_KEY:
+            self._store._replace_dataframe(self, None)
+            return
+        del self._data[key]
+        self._store.save(self.analysis_id)
+
+    def __contains__(self, key):
+        # 判断是否存在DataFrame时不触发加载
+        if key == DATAFRAME_KEY:
+            return self.has_dataframe()
+        return key in self._data
+
+    def __iter__(self):
+        yield from self._data
+        if self.has_dataframe():
+            yield DATAFRAME_KEY
+
+    def __len__(self):
+        return len(self._data) + (1 if self.has_dataframe() else 0)
+
+
+class AnalysisSessionStore(MutableMapping):
+    """按字节数限制内存占用、可持久化、带TTL清理的分析会话存储（线程安全）"""
+
+    def __init__(self, base_dir, max_memory_bytes=None, ttl_seconds=None, cleanup_interval=600):
+        """
+        Args:
+            base_dir: 会话落盘目录，每个会话一个子目录
+            max_memory_bytes: 内存中DataFrame总字节数上限，默认读取环境变量 QUESTIONNAIRE_SESSION_MEMORY_MB（默认512MB）
+            ttl_seconds: 会话最长未访问时间，默认读取环境变量 QUESTIONNAIRE_SESSION_TTL_HOURS（默认168小时），<=0 表示不清理
+            cleanup_interval: 两次TTL清理之间的最短间隔（秒），清理在访问会话时顺带执行
+        """
+        self.base_dir = Path(base_dir)
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+
+        if max_memory_bytes is None:
+            max_memory_bytes = int(float(os.getenv('QUESTIONNAIRE_SESSION_MEMORY_MB', 512)) * 1024 * 1024)
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv('QUESTIONNAIRE_SESSION_TTL_HOURS', 168)) * 3600
+        self.max_memory_bytes = max(0, int(max_memory_bytes))
+        self.ttl_seconds = float(ttl_seconds)
+        self.cleanup_interval = float(cleanup_interval)
+
+        self._lock = threading.RLock()
+        self._sessions = {}                # analysis_id -> AnalysisSession（已加载元数据的会话）
+        self._resident = OrderedDict()     # analysis_id -> DataFrame字节数（DataFrame在内存中的会话，按访问顺序）
+        self._memory_bytes = 0
+        self._last_cleanup = 0.0
+        self._last_touch = {}
+
+        self._stats = {
+            'dataframe_loads': 0,
+            'dataframe_evictions': 0,
+            'expired_sessions': 0
+        }
+
+        logger.info(f"📦 分析会话存储: {self.base_dir}，内存上限 {self.max_memory_bytes / 1024 / 1024:.0f}MB，"
+                    f"TTL {self.ttl_seconds / 3600:.0f}小时，Parquet {'可用' if PARQUET_AVAILABLE else '不可用（使用pickle）'}")
+
+    # ------------------------------------------------------------------
+    # 字典接口
+    # ------------------------------------------------------------------
+
+    def __contains__(self, analysis_id):
+        if not self._valid_id(analysis_id):
+            return False
+        with self._lock:
+            return analysis_id in self._sessions or (self._session_dir(analysis_id) / META_FILENAME).exists()
+
+    def __getitem__(self, analysis_id):
+        self._maybe_cleanup()
+        if not self._valid_id(analysis_id):
+            raise KeyError(analysis_id)
+        with self._lock:
+            session = self._sessions.get(analysis_id)
+            if session is None:
+                session = self._load_session(analysis_id)
+            self._touch(analysis_id)
+            return session
+
+    def __setitem__(self, analysis_id, data):
+        """新建（或整体替换）会话；data 中的 dataframe 会立即落盘"""
+        self._maybe_cleanup()
+        if not self._valid_id(analysis_id):
+            raise KeyError(f"非法的分析ID: {analysis_id}")
+
+        data = dict(data)
+        dataframe = data.pop(DATAFRAME_KEY, None)
+        with self._lock:
+            if analysis_id in self._sessions or self._session_dir(analysis_id).exists():
+                self._remove(analysis_id)
+            self._session_dir(analysis_id).mkdir(parents=True, exist_ok=True)
+
+            session = AnalysisSession(self, analysis_id, data)
+            self._sessions[analysis_id] = session
+            if dataframe is not None:
+                self._replace_dataframe(session, dataframe)
+            self.save(analysis_id)
+            self._touch(analysis_id, force=True)
+
+    def __delitem__(self, analysis_id):
+        with self._lock:
+            if analysis_id not in self:
+                raise KeyError(analysis_id)
+            self._remove(analysis_id)
+
+    def __iter__(self):
+        with self._lock:
+            ids = set(self._sessions)
+            ids.update(path.parent.name for path in self.base_dir.glob(f'*/{META_FILENAME}'))
+        return iter(sorted(ids))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def list_metadata(self):
+        """
+        列出全部会话的元数据（不含DataFrame），用于历史列表等只读场景
+
+        与 items() 不同：不更新访问时间（不会重置TTL），也不把未加载的会话缓存到内存
+
+        Returns:
+            [(分析ID, 元数据字典的浅拷贝)]，按分析ID排序；元数据文件损坏的会话跳过
+        """
+        self._maybe_cleanup()
+        result = []
+        for analysis_id in self:
+            with self._lock:
+                session = self._sessions.get(analysis_id)
+                if session is not None:
+                    result.append((analysis_id, dict(session._data)))
+                    continue
+            try:
+                with open(self._session_dir(analysis_id) / META_FILENAME, 'rb') as f:
+                    meta = pickle.load(f)
+                result.append((analysis_id, dict(meta.get('data', {}))))
+            except Exception as e:
+                logger.warning(f"⚠️ 读取分析会话 {analysis_id} 元数据失败: {e}")
+        return result
+
+    # ------------------------------------------------------------------
+    # 持久化
+    # ------------------------------------------------------------------
+
+    def save(self, analysis_id):
+        """把会话元数据写入磁盘（先写临时文件再替换，避免写一半时崩溃损坏文件）"""
+        with self._lock:
+            session = self._sessions.get(analysis_id)
+            if session is None:
+                return
+            meta = {
+                'data': session._data,
+                'dataframe_file': session._dataframe_file.name if session._dataframe_file else None
+            }
+            meta_path = self._session_dir(analysis_id) / META_FILENAME
+            tmp_path = meta_path.with_suffix('.tmp')
+            try:
+                with open(tmp_path, 'wb') as f:
+                    pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, meta_path)
+            except Exception as e:
+                logger.warning(f"⚠️ 分析会话 {analysis_id} 元数据落盘失败（仅保留在内存中）: {e}")
+
+    def _load_session(self, analysis_id):
+        """从磁盘加载会话元数据（DataFrame 在首次访问时再加载）"""
+        meta_path = self._session_dir(analysis_id) / META_FILENAME
+        if not meta_path.exists():
+            raise KeyError(analysis_id)
+        with open(meta_path, 'rb') as f:
+            meta = pickle.load(f)
+
+        dataframe_file = meta.get('dataframe_file')
+        session = AnalysisSession(
+            self, analysis_id, meta.get('data', {}),
+            dataframe_file=self._session_dir(analysis_id) / dataframe_file if dataframe_file else None
+        )
+        self._sessions[analysis_id] = session
+        logger.info(f"📂 从磁盘恢复分析会话: {analysis_id}")
+        return session
+
+    def _write_dataframe(self, analysis_id, dataframe):
+        """DataFrame 落盘：优先 Parquet，列类型不支持时回退为 pickle"""
+        session_dir = self._session_dir(analysis_id)
+        if PARQUET_AVAILABLE:
+            path = session_dir / PARQUET_FILENAME
+            try:
+                dataframe.to_parquet(path)
+                return path
+            except Exception as e:
+                logger.info(f"ℹ️ DataFrame 无法保存为Parquet，改用pickle: {e}")
+                path.unlink(missing_ok=True)
+        path = session_dir / PICKLE_FILENAME
+        dataframe.to_pickle(path)
+        return path
+
+    @staticmethod
+    def _read_dataframe(path):
+        if path.suffix == '.parquet':
+            return pd.read_parquet(path)
+        return pd.read_pickle(path)
+
+    # ------------------------------------------------------------------
+    # DataFrame 内存管理
+    # ------------------------------------------------------------------
+
+    def _replace_dataframe(self, session, dataframe):
+        """设置会话的DataFrame：写入磁盘并计入内存占用"""
+        with self._lock:
+            self._release(session.analysis_id)
+            if session._dataframe_file is not None:
+                session._dataframe_file.unlink(missing_ok=True)
+            session._dataframe = None
+            session._dataframe_file = None
+
+            if dataframe is not None:
+                try:
+                    session._dataframe_file = self._write_dataframe(session.analysis_id, dataframe)
+                except Exception as e:
+                    # 落盘失败时只保留在内存中，且不参与淘汰
+                    logger.warning(f"⚠️ 分析会话 {session.analysis_id} 的DataFrame落盘失败（仅保留在内存中）: {e}")
+                session._dataframe = dataframe
+                self._admit(session)
+            self.save(session.analysis_id)
+
+    def _load_dataframe(self, session):
+        """返回会话的DataFrame，已被淘汰时从磁盘重新加载"""
+        with self._lock:
+            if session._dataframe is None:
+                session._dataframe = self._read_dataframe(session._dataframe_file)
+                self._stats['dataframe_loads'] += 1
+                logger.info(f"📂 从磁盘加载分析会话 {session.analysis_id} 的DataFrame: {session._dataframe_file.name}")
+                self._admit(session)
+            elif session.analysis_id in self._resident:
+                self._resident.move_to_end(session.analysis_id)
+            return session._dataframe
+
+    def _admit(self, session):
+        """登记内存中的DataFrame，超出上限时淘汰最久未访问的其他会话"""
+        if session._dataframe_file is None:
+            return
+        size = int(session._dataframe.memory_usage(index=True, deep=True).sum())
+        self._resident[session.analysis_id] = size
+        self._memory_bytes += size
+
+        while self._memory_bytes > self.max_memory_bytes and len(self._resident) > 1:
+            evict_id, _ = next(iter(self._resident.items()))
+            if evict_id == session.analysis_id:
+                self._resident.move_to_end(evict_id)
+                continue
+            self._release(evict_id)
+            self._sessions[evict_id]._dataframe = None
+            self._stats['dataframe_evictions'] += 1
+            logger.info(f"💾 内存超出上限，释放分析会话 {evict_id} 的DataFrame（已在磁盘）")
+
+    def _release(self, analysis_id):
+        size = self._resident.pop(analysis_id, None)
+        if size is not None:
+            self._memory_bytes -= size
+
+    # ------------------------------------------------------------------
+    # TTL 清理
+    # ------------------------------------------------------------------
+
+    def _touch(self, analysis_id, force=False):
+        """记录访问时间（元数据文件的修改时间即最近访问时间，每分钟最多更新一次）"""
+        now = time.time()
+        if not force and now - self._last_touch.get(analysis_id, 0) < 60:
+            return
+        self._last_touch[analysis_id] = now
+        try:
+            os.utime(self._session_dir(analysis_id) / META_FILENAME, (now, now))
+        except OSError:
+            pass
+
+    def _maybe_cleanup(self):
+        if self.ttl_seconds > 0 and time.time() - self._last_cleanup >= self.cleanup_interval:
+            self.cleanup_expired()
+
+    def cleanup_expired(self):
+        """删除超过TTL未访问的会话，返回删除的会话数"""
+        with self._lock:
+            self._last_cleanup = time.time()
+            if self.ttl_seconds <= 0:
+                return 0
+            deadline = time.time() - self.ttl_seconds
+            expired = []
+            for meta_path in self.base_dir.glob(f'*/{META_FILENAME}'):
+                try:
+                    if meta_path.stat().st_mtime < deadline:
+                        expired.append(meta_path.parent.name)
+                except OSError:
+                    continue
+            for analysis_id in expired:
+                self._remove(analysis_id)
+            if expired:
+                self._stats['expired_sessions'] += len(expired)
+                logger.info(f"🧹 清理 {len(expired)} 个超过 {self.ttl_seconds / 3600:.0f} 小时未访问的分析会话")
+            return len(expired)
+
+    def _remove(self, analysis_id):
+        self._release(analysis_id)
+        self._sessions.pop(analysis_id, None)
+        self._last_touch.pop(analysis_id, None)
+        shutil.rmtree(self._session_dir(analysis_id), ignore_errors=True)
+
+    # ------------------------------------------------------------------
+    # 工具方法
+    # ------------------------------------------------------------------
+
+    def _session_dir(self, analysis_id):
+        return self.base_dir / analysis_id
+
+    @staticmethod
+    def _valid_id(analysis_id):
+        return isinstance(analysis_id, str) and bool(_ANALYSIS_ID_PATTERN.match(analysis_id))
+
+    def get_stats(self):
+        """获取会话存储统计"""
+        with self._lock:
+            return {
+                'sessions': len(self),
+                'loaded_sessions': len(self._sessions),
+                'resident_dataframes': len(self._resident),
+                'memory_bytes': self._memory_bytes,
+                'max_memory_bytes': self.max_memory_bytes,
+                'ttl_hours': self.ttl_seconds / 3600,
+                'parquet_available': PARQUET_AVAILABLE,
+                **self._stats
+            }
@@ -6,7 +6,9 @@ import re
 import random
 import sys
 import logging
+import threading
 from collections import defaultdict, Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.cluster import KMeans
@@ -57,6 +59,19 @@ except ImportError as e:
     logger.error("请确保 universal_questionnaire_analyzer.py 文件在同一目录下")
     sys.exit(1)
 
+# 导入共享的OpenAI限流器（server/utils/openai_rate_limiter.py，与社交媒体分析服务共用）
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'utils'))
+from openai_rate_limiter import get_openai_rate_limiter, estimate_tokens
+
+from translation_memory import get_translation_memory, normalize_answer
+
+# 翻译记忆库中 _translate_batch 使用的语言对（英译中）
+TRANSLATION_SOURCE_LANG = 'en'
+TRANSLATION_TARGET_LANG = 'zh'
+
+# batch_translate_and_tag 出错时在译文位置返回的标记，带这些标记的批次不写入检查点
+BATCH_ERROR_MARKERS = {"MODEL_ERROR", "RATE_LIMIT_ERROR", "NETWORK_ERROR", "AUTH_ERROR", "API_ERROR", "UNKNOWN_ERROR"}
+
 # 加载.env文件中的环境变量（可选）
 def load_env_variables():
     """加载环境变量，支持多种方式"""
@@ -102,6 +117,25 @@ class QuestionnaireTranslationClassifier:
         self.reference_tags = []
         self.use_reference_mode = False
         
+        # 进程内共享的RPM/TPM限流器（按429反馈自适应调整速率，取代批次间固定等待）
+        self.rate_limiter = get_openai_rate_limiter()
+        
+        # 并发翻译：同时在途的翻译批次数，以及单个批次失败后的重试次数
+        self.translation_workers = max(1, int(os.getenv("TRANSLATION_WORKERS", 4)))
+        self.translation_retries = max(0, int(os.getenv("TRANSLATION_BATCH_RETRIES", 2)))
+        
+        # 去重统计：相同的开放题回答只调用一次API，按列记录去重效果
+        self.dedupe_stats = {}
+        
+        # 翻译记忆库：翻译前先查询历史译文，命中的回答不再调用API
+        self.translation_memory = get_translation_memory()
+        self.translation_memory_stats = {'lookups': 0, 'hits': 0}
+        
+        # 进度回调（后台任务使用）：按批次上报进度和API调用次数
+        self.progress_callback = None
+        self.api_calls = 0
+        self._api_calls_lock = threading.Lock()
+        
         # 检查OpenAI是否可用
         if not OPENAI_AVAILABLE:
             logger.warning("⚠️ OpenAI库未安装，翻译和分类功能将被禁用")
@@ -141,13 +175,13 @@ class QuestionnaireTranslationClassifier:
             logger.warning("⚠️ httpx库未安装，将使用默认HTTP客户端")
             http_client = None
         
-        # 设置OpenAI API - 添加更多重试机制
+        # 设置OpenAI API（连接级重试由 httpx 传输层负责，限流重试由共享限流器负责）
         try:
             self.client = OpenAI(
                 api_key=os.getenv("OPENAI_API_KEY"),
                 base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
                 http_client=http_client,
-                max_retries=5  # 添加客户端级别的重试
+                max_retries=0  # 429 由共享限流器统一退避重试，SDK内置重试会吞掉限流信号
             )
             logger.info("✅ OpenAI客户端初始化成功")
         except Exception as e:
@@ -157,7 +191,7 @@ class QuestionnaireTranslationClassifier:
                 api_key=os.getenv("OPENAI_API_KEY"),
                 base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
                 http_client=http_client,
-                max_retries=5  # 添加客户端级别的重试
+                max_retries=0  # 429 由共享限流器统一退避重试，SDK内置重试会吞掉限流信号
             )
             # self.client = None
     
@@ -241,14 +275,18 @@ class QuestionnaireTranslationClassifier:
                 logger.error("未找到OPENAI_MODEL环境变量")
                 return self._rule_based_tag_assignment(translated_texts)
             
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "你是专业的文本分类专家，严格按照给定的标签体系进行分类。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                max_tokens=min(100 * len(translated_texts), 16384)
+            max_tokens = min(100 * len(translated_texts), 16384)
+            response = self._rate_limited_call(
+                lambda: self.client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": "你是专业的文本分类专家，严格按照给定的标签体系进行分类。"},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.1,
+                    max_tokens=max_tokens
+                ),
+                tokens=estimate_tokens(prompt) + max_tokens
             )
             
             # 解析结果
@@ -333,6 +371,145 @@ class QuestionnaireTranslationClassifier:
         
         return results
     
+    def _normalize_answer(self, text):
+        """归一化回答文本用于去重（与翻译记忆库的键一致）"""
+        return normalize_answer(text)
+    
+    def _dedupe_texts(self, texts):
+        """
+        对回答去重，返回 (唯一回答列表, 每条原始回答对应的唯一回答下标)
+        每组相同回答保留首次出现的原文发送给API
+        """
+        unique_texts = []
+        inverse = []
+        key_to_index = {}
+        for text in texts:
+            key = self._normalize_answer(text)
+            if key not in key_to_index:
+                key_to_index[key] = len(unique_texts)
+                unique_texts.append(text)
+            inverse.append(key_to_index[key])
+        return unique_texts, inverse
+    
+    def _record_dedupe_stats(self, stage, column_name, total, unique, batch_size):
+        """记录某列的去重效果（节省的API调用按批次数估算）"""
+        saved_calls = -(-total // batch_size) - -(-unique // batch_size)
+        self.dedupe_stats[f"{stage}:{column_name}"] = {
+            'stage': stage,
+            'column': column_name,
+            'total_answers': total,
+            'unique_answers': unique,
+            'dedupe_ratio': round(1 - unique / total, 4) if total else 0.0,
+            'saved_calls': saved_calls
+        }
+        logger.info(f"♻️ 列 {column_name} 去重: {total} 条 -> {unique} 条唯一回答 "
+                    f"(去重率 {(1 - unique / total) * 100 if total else 0:.1f}%, 节省约 {saved_calls} 次API调用)")
+    
+    def get_dedupe_summary(self):
+        """汇总本次处理的去重效果，供接口返回"""
+        total = sum(item['total_answers'] for item in self.dedupe_stats.values())
+        unique = sum(item['unique_answers'] for item in self.dedupe_stats.values())
+        return {
+            'total_answers': total,
+            'unique_answers': unique,
+            'dedupe_ratio': round(1 - unique / total, 4) if total else 0.0,
+            'saved_calls': sum(item['saved_calls'] for item in self.dedupe_stats.values()),
+            'columns': list(self.dedupe_stats.values())
+        }
+    
+    def _lookup_translation_memory(self, texts, results):
+        """
+        查询翻译记忆库，命中的译文直接写入 results
+        
+        Returns:
+            未命中、仍需调用API翻译的下标列表（空文本不需要翻译）
+        """
+        indices = [i for i, text in enumerate(texts) if str(text).strip()]
+        if not self.translation_memory or not indices:
+            return indices
+        
+        try:
+            hits = self.translation_memory.lookup_many(
+                [texts[i] for i in indices], TRANSLATION_SOURCE_LANG, TRANSLATION_TARGET_LANG
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ 查询翻译记忆库失败，全部调用API翻译: {e}")
+            return indices
+        
+        miss_indices = []
+        for i in indices:
+            translation = hits.get(self._normalize_answer(texts[i]))
+            if translation is None:
+                miss_indices.append(i)
+            else:
+                results[i] = translation
+        
+        self.translation_memory_stats['lookups'] += len(indices)
+        self.translation_memory_stats['hits'] += len(indices) - len(miss_indices)
+        return miss_indices
+    
+    def _store_translation_memory(self, texts, translations):
+        """把API译文写回翻译记忆库（与原文相同的视为未翻译，不写入）"""
+        if not self.translation_memory:
+            return
+        pairs = [
+            (text, translation) for text, translation in zip(texts, translations)
+            if translation.strip() and translation != text
+        ]
+        try:
+            self.translation_memory.store_many(pairs, TRANSLATION_SOURCE_LANG, TRANSLATION_TARGET_LANG)
+        except Exception as e:
+            logger.warning(f"⚠️ 写入翻译记忆库失败: {e}")
+    
+    def get_translation_memory_summary(self):
+        """汇总本次处理的翻译记忆命中情况，供接口返回"""
+        lookups = self.translation_memory_stats['lookups']
+        hits = self.translation_memory_stats['hits']
+        return {
+            'enabled': self.translation_memory is not None,
+            'lookups': lookups,
+            'hits': hits,
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0
+        }
+    
+    def _rate_limited_call(self, func, tokens):
+        """经共享限流器调用API，并累计API调用次数"""
+        with self._api_calls_lock:
+            self.api_calls += 1
+        return self.rate_limiter.call(func, tokens=tokens)
+    
+    def _report_progress(self, stage, completed_batches, total_batches, column=None, partial_results=None):
+        """按批次上报进度（未设置 progress_callback 时不做任何事）"""
+        if not self.progress_callback:
+            return
+        try:
+            self.progress_callback({
+                'stage': stage,
+                'column': column,
+                'completed_batches': completed_batches,
+                'total_batches': total_batches,
+                'api_calls': self.api_calls,
+                'partial_results': partial_results
+            })
+        except Exception as e:
+            logger.warning(f"⚠️ 上报进度失败: {e}")
+    
+    def _tag_batch_with_checkpoint(self, checkpoint, column_name, batch_idx, batch, **kwargs):
+        """
+        调用 batch_translate_and_tag 处理一个批次，有检查点时先复用已完成的结果，成功后写入检查点
+        """
+        if checkpoint:
+            cached = checkpoint.get(column_name, batch_idx, batch)
+            if cached is not None:
+                logger.info(f"📍 批次 {batch_idx + 1} 已在检查点中完成，跳过API调用")
+                return [tuple(result) for result in cached]
+        
+        results = self.batch_translate_and_tag(batch, column_name, **kwargs)
+        
+        if checkpoint and not any(translation in BATCH_ERROR_MARKERS for translation, _ in results):
+            checkpoint.save(column_name, batch_idx, batch, results)
+        return results
+    
     def _need_translation(self, texts):
         """
         判断是否需要翻译（简单的中英文检测）
@@ -348,24 +525,104 @@ class QuestionnaireTranslationClassifier:
         """
         纯翻译功能，不涉及打标
         """
-        translations = []
+        return self._translate_columns_concurrently([(column_name, texts)], batch_size)[0]
+    
+    def _translate_columns_concurrently(self, jobs, batch_size=10, checkpoint=None):
+        """
+        并发翻译多列文本
         
-        batches = [texts[i:i+batch_size] for i in range(0, len(texts), batch_size)]
+        先查询翻译记忆库，只有未命中的文本按 batch_size 切分为批次，统一交给有界线程池执行
+        （请求速率由共享限流器控制），单个批次失败时独立重试，重试耗尽后该批次保留原文；
+        成功的译文写回翻译记忆库，结果按原始行顺序重新组装
         
-        for batch_idx, batch in enumerate(batches):
-            logger.info(f"🔄 翻译批次 {batch_idx + 1}/{len(batches)}")
-            batch_translations = self._translate_batch(batch, column_name)
-            translations.extend(batch_translations)
+        Args:
+            jobs: [(列名, 文本列表)]
+            batch_size: 每批文本数
+            checkpoint: 可选的 RunCheckpoint，已完成的批次直接复用，新完成的批次写入检查点
             
-            # 批次间等待
-            if batch_idx < len(batches) - 1:
-                time.sleep(1.0)
+        Returns:
+            与 jobs 一一对应的译文列表
+        """
+        results = [list(texts) for _, texts in jobs]
+        batches = []
+        for job_idx, (column_name, texts) in enumerate(jobs):
+            miss_indices = self._lookup_translation_memory(texts, results[job_idx])
+            if len(miss_indices) < len(texts):
+                logger.info(f"📚 列 {column_name} 翻译记忆命中 {len(texts) - len(miss_indices)} 条，"
+                            f"需调用API翻译 {len(miss_indices)} 条")
+            for batch_idx, start in enumerate(range(0, len(miss_indices), batch_size)):
+                indices = miss_indices[start:start + batch_size]
+                batch_texts = [texts[i] for i in indices]
+                cached = checkpoint.get(column_name, batch_idx, batch_texts) if checkpoint else None
+                if cached is not None:
+                    for i, translation in zip(indices, cached):
+                        results[job_idx][i] = translation
+                    continue
+                batches.append((job_idx, batch_idx, indices, column_name, batch_texts))
+        resumed_count = checkpoint.resumed_batches if checkpoint else 0
+        if resumed_count:
+            logger.info(f"📍 从检查点恢复 {resumed_count} 个已完成的翻译批次")
+        total_batches = resumed_count + len(batches)
+        self._report_progress('translate', resumed_count, total_batches)
+        if not batches:
+            return results
+        
+        workers = min(self.translation_workers, len(batches))
+        logger.info(f"🚀 并发翻译: {len(jobs)} 列，{len(batches)} 个批次，并发数 {workers}")
         
-        return translations
+        done_count = 0
+        failed_count = 0
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='translate') as executor:
+            futures = {
+                executor.submit(self._translate_batch_with_retry, batch_texts, column_name): (job_idx, batch_idx, indices, column_name, batch_texts)
+                for job_idx, batch_idx, indices, column_name, batch_texts in batches
+            }
+            for future in as_completed(futures):
+                job_idx, batch_idx, indices, column_name, batch_texts = futures[future]
+                batch_translations, ok = future.result()
+                for i, translation in zip(indices, batch_translations):
+                    results[job_idx][i] = translation
+                done_count += 1
+                if ok:
+                    self._store_translation_memory(batch_texts, batch_translations)
+                    if checkpoint:
+                        checkpoint.save(column_name, batch_idx, batch_texts, batch_translations)
+                else:
+                    failed_count += 1
+                self._report_progress(
+                    'translate', resumed_count + done_count, total_batches, column_name,
+                    [{'source': text, 'translation': translation} for text, translation in zip(batch_texts, batch_translations)]
+                )
+                logger.info(f"🔄 翻译进度: {done_count}/{len(batches)} 个批次")
+        
+        if failed_count:
+            logger.warning(f"⚠️ {failed_count} 个批次重试后仍翻译失败，已保留原文")
+        return results
     
-    def _translate_batch(self, texts, column_name):
+    def _translate_batch_with_retry(self, texts, column_name):
+        """
+        翻译单个批次，失败时按指数退避独立重试
+        
+        Returns:
+            (译文列表, 是否成功)；重试耗尽时返回原文
+        """
+        for attempt in range(self.translation_retries + 1):
+            try:
+                return self._translate_batch(texts, column_name, raise_on_error=True), True
+            except Exception as e:
+                if attempt < self.translation_retries:
+                    wait_time = 2 ** attempt
+                    logger.warning(f"⚠️ 翻译批次失败（第{attempt + 1}次），{wait_time}秒后重试: {e}")
+                    time.sleep(wait_time)
+                else:
+                    logger.error(f"❌ 翻译批次重试{self.translation_retries}次后仍失败: {e}")
+        return list(texts), False
+    
+    def _translate_batch(self, texts, column_name, raise_on_error=False):
         """
         批量翻译单个批次
+        
+        raise_on_error 为 True 时API调用失败直接抛出异常（由调用方重试），否则返回原文
         """
         # 创建编号映射，保持所有文本的位置
         text_mapping = []
@@ -410,14 +667,18 @@ class QuestionnaireTranslationClassifier:
                 logger.error("未找到OPENAI_MODEL环境变量")
                 return texts
             
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "你是专业的翻译助手，专注于准确翻译。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                max_tokens=min(200 * len(text_mapping), 16384)  # 限制不超过模型最大值
+            max_tokens = min(200 * len(text_mapping), 16384)  # 限制不超过模型最大值
+            response = self._rate_limited_call(
+                lambda: self.client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": "你是专业的翻译助手，专注于准确翻译。"},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.1,
+                    max_tokens=max_tokens
+                ),
+                tokens=estimate_tokens(prompt) + max_tokens
             )
             
             # 解析翻译结果
@@ -483,6 +744,8 @@ class QuestionnaireTranslationClassifier:
             return results
             
         except Exception as e:
+            if raise_on_error:
+                raise
             logger.error(f"❌ 翻译失败: {e}")
             return texts  # 翻译失败时返回原文
     
@@ -533,6 +796,15 @@ class QuestionnaireTranslationClassifier:
             logger.warning("⚠️ OpenAI客户端不可用，返回原始文本")
             return [(text, "") for text in texts]
         
+        # 批次内相同回答只发送一次，结果按原顺序展开
+        unique_texts, inverse = self._dedupe_texts(texts)
+        if len(unique_texts) < len(texts):
+            logger.info(f"♻️ 批次内去重: {len(texts)} 条 -> {len(unique_texts)} 条")
+            unique_results = self.batch_translate_and_tag(
+                unique_texts, column_name, source_lang, target_lang, batch_size, retry_count
+            )
+            return [unique_results[j] for j in inverse]
+        
         # 如果启用了参考标签模式，分别处理翻译和打标
         if self.use_reference_mode and self.reference_tags:
             logger.info("🏷️  使用参考标签模式进行分别处理")
@@ -599,14 +871,18 @@ class QuestionnaireTranslationClassifier:
                 logger.error("未找到OPENAI_MODEL环境变量")
                 return [("MODEL_ERROR", "")] * len(texts)
                 
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "你是高效的批量翻译标签助手，专注于保持顺序的准确翻译和分类。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                max_tokens=min(200 * len(text_mapping), 16384)  # 限制不超过模型最大值
+            max_tokens = min(200 * len(text_mapping), 16384)  # 限制不超过模型最大值
+            response = self._rate_limited_call(
+                lambda: self.client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": "你是高效的批量翻译标签助手，专注于保持顺序的准确翻译和分类。"},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.1,
+                    max_tokens=max_tokens
+                ),
+                tokens=estimate_tokens(prompt) + max_tokens
             )
             logger.info(f"🔍 AI打标API返回长度: {len(response.choices[0].message.content) if response.choices[0].message.content else 0}")
             
@@ -647,16 +923,9 @@ class QuestionnaireTranslationClassifier:
             return results
         
         except RateLimitError as e:
-            # 速率限制错误处理
-            retry_count += 1
-            if retry_count > 3:
-                logger.error(f"⚠️ 批量翻译标签连续3次遇到速率限制错误，跳过此批次")
-                return [("RATE_LIMIT_ERROR", "")] * len(texts)
-            
-            wait_time = min(60, 10 * retry_count) + random.uniform(0, 5)  # 限制最大等待时间
-            logger.warning(f"⏳ 批量翻译标签遇到速率限制错误: {e}, 将在 {wait_time:.1f} 秒后重试 (尝试 #{retry_count})")
-            time.sleep(wait_time)
-            return self.batch_translate_and_tag(texts, column_name, source_lang, target_lang, batch_size, retry_count)
+            # 速率限制错误：限流器已按 Retry-After 等待并重试，仍失败时跳过此批次
+            logger.error(f"⚠️ 批量翻译标签多次重试后仍遇到速率限制错误: {e}，跳过此批次")
+            return [("RATE_LIMIT_ERROR", "")] * len(texts)
         
         except APIConnectionError as e:
             # 网络连接错误处理
@@ -767,14 +1036,17 @@ class QuestionnaireTranslationClassifier:
                 logger.error("未找到OPENAI_MODEL环境变量")
                 return self.fallback_topic_generation(unique_tags, num_topics)
                 
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "你是专业的主题分类专家，擅长将细分类别归纳为更高层次的主题。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-                max_tokens=200
+            response = self._rate_limited_call(
+                lambda: self.client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": "你是专业的主题分类专家，擅长将细分类别归纳为更高层次的主题。"},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.3,
+                    max_tokens=200
+                ),
+                tokens=estimate_tokens(prompt) + 200
             )
             
             content = response.choices[0].message.content
@@ -989,8 +1261,11 @@ class QuestionnaireTranslationClassifier:
             logger.error("4. 使用了错误的API端点")
             return False
     
-    def process_table(self, input_path=None, output_path=None):
-        """处理表格：翻译内容并生成分类标签，支持CSV和Excel格式"""
+    def process_table(self, input_path=None, output_path=None, checkpoint=None):
+        """处理表格：翻译内容并生成分类标签，支持CSV和Excel格式
+        
+        checkpoint: 可选的 RunCheckpoint，每完成一个批次即写入，重新调用时跳过已完成的批次
+        """
         
         # 如果没有提供输入文件路径，使用交互式选择
         if input_path is None:
@@ -1127,6 +1402,8 @@ class QuestionnaireTranslationClassifier:
         
         # 处理所有列
         all_results = {}
+        self.dedupe_stats = {}
+        self.translation_memory_stats = {'lookups': 0, 'hits': 0}
         
         logger.info(f"📊 开始处理 {len(columns_to_process)} 个列")
         
@@ -1138,19 +1415,20 @@ class QuestionnaireTranslationClassifier:
             logger.info(f"📋 列 {col} 的文本数据量: {len(texts)}")
             logger.info(f"📋 前5个文本示例: {texts[:5]}")
             
+            # 相同回答只处理一次，处理完后按原行展开
+            unique_texts, inverse = self._dedupe_texts(texts)
+            self._record_dedupe_stats('process_table', col, len(texts), len(unique_texts), BATCH_SIZE)
+            total_unique = len(unique_texts)
+            
             translations = []
             sub_tags = []
             
             # 批量处理（翻译+二级标签）
-            batches = [texts[i:i+BATCH_SIZE] 
-                       for i in range(0, len(texts), BATCH_SIZE)]
+            batches = [unique_texts[i:i+BATCH_SIZE] 
+                       for i in range(0, len(unique_texts), BATCH_SIZE)]
             logger.info(f"📊 分成 {len(batches)} 个批次处理，批次大小: {BATCH_SIZE}")
             
             for batch_idx, batch in enumerate(batches):
-                # 添加延迟以避免API速率限制
-                if batch_idx > 0:
-                    time.sleep(1)  # 批次间延迟1秒
-                
                 # 动态调整批处理大小（如果文本过长）
                 max_text_len = max(len(text) for text in batch)
                 current_batch_size = min(BATCH_SIZE, 5) if max_text_len > 500 else BATCH_SIZE
@@ -1161,7 +1439,7 @@ class QuestionnaireTranslationClassifier:
                 
                 # 处理当前批次（翻译+二级标签）
                 logger.info(f"🚀 即将调用 batch_translate_and_tag 方法")
-                results = self.batch_translate_and_tag(batch, col, batch_size=current_batch_size)
+                results = self._tag_batch_with_checkpoint(checkpoint, col, batch_idx, batch, batch_size=current_batch_size)
                 logger.info(f"✅ batch_translate_and_tag 调用完成，返回结果数量: {len(results)}")
                 
                 # 分离翻译和二级标签
@@ -1172,17 +1450,17 @@ class QuestionnaireTranslationClassifier:
                 sub_tags.extend(batch_sub_tags)
                 
                 # 进度报告
-                processed = min((batch_idx + 1) * BATCH_SIZE, total_rows)
+                processed = min((batch_idx + 1) * BATCH_SIZE, total_unique)
                 elapsed = time.time() - start_time
                 rows_per_min = processed / (elapsed / 60) if elapsed > 0 else 0
                 remaining = (len(batches) - batch_idx - 1) * (elapsed / (batch_idx + 1)) / 60 if batch_idx > 0 else 0
                 
-                logger.info(f"🔄 {col}处理进度: {processed}/{total_rows} 行 ({processed/total_rows*100:.1f}%) | "
-                            f"速度: {rows_per_min:.1f} 行/分钟 | 预计剩余: {remaining:.1f} 分钟")
-                
-                # 批次间等待
-                wait_time = 2.0 + random.uniform(0, 1.0)
-                time.sleep(wait_time)
+                logger.info(f"🔄 {col}处理进度: {processed}/{total_unique} 条唯一回答 ({processed/total_unique*100:.1f}%) | "
+                            f"速度: {rows_per_min:.1f} 条/分钟 | 预计剩余: {remaining:.1f} 分钟")
+            
+            # 唯一回答的结果展开回所有行
+            translations = [translations[j] for j in inverse]
+            sub_tags = [sub_tags[j] for j in inverse]
             
             # 保存结果
             all_results[col] = {
@@ -1292,6 +1570,10 @@ class QuestionnaireTranslationClassifier:
             logger.error(f"❌ 保存结果失败: {e}")
             return False
         
+        # 处理成功，检查点不再需要
+        if checkpoint:
+            checkpoint.clear()
+        
         # 处理成功，返回True
         return True
 
@@ -1313,8 +1595,11 @@ class QuestionnaireTranslationClassifier:
         total_chars = len([char for char in text if char.strip()])
         return total_chars > 0 and (chinese_chars / total_chars) > 0.3  # 中文字符占比超过30%
 
-    def translate_only(self, input_path, output_path, open_ended_fields):
-        """只进行翻译，不进行AI分类 - 为后续的标准打标或参考标签打标做准备"""
+    def translate_only(self, input_path, output_path, open_ended_fields, checkpoint=None):
+        """只进行翻译，不进行AI分类 - 为后续的标准打标或参考标签打标做准备
+        
+        checkpoint: 可选的 RunCheckpoint，每完成一个批次即写入，重新调用时跳过已完成的批次
+        """
         try:
             logger.info(f"🔧 开始只翻译处理: {input_path} -> {output_path}")
             logger.info(f"📋 待翻译的开放题字段: {open_ended_fields}")
@@ -1350,11 +1635,15 @@ class QuestionnaireTranslationClassifier:
             BATCH_SIZE = 10
             total_rows = len(df)
             
+            # 先收集所有列需要翻译的英文内容，再统一并发翻译
+            column_plans = []
+            self.dedupe_stats = {}
+            self.translation_memory_stats = {'lookups': 0, 'hits': 0}
             for col in open_ended_fields:
                 if col not in df.columns:
                     continue
                     
-                logger.info(f"\n🚀 开始翻译列: {col}")
+                logger.info(f"\n🚀 准备翻译列: {col}")
                 cn_col = f"{col}-CN"
                 
                 # 准备文本数据
@@ -1382,17 +1671,28 @@ class QuestionnaireTranslationClassifier:
                 for i in chinese_indices:
                     translations[i] = texts[i]
                 
-                # 英文内容进行翻译
+                if not english_texts:
+                    logger.info("📋 无英文内容需要翻译，全部为中文")
+                
+                # 相同的英文回答只翻译一次
+                unique_texts, inverse = self._dedupe_texts(english_texts)
                 if english_texts:
-                    logger.info(f"🚀 开始翻译英文内容: {len(english_texts)} 条")
-                    english_translations = self._batch_translate_texts(english_texts, col, BATCH_SIZE)
+                    self._record_dedupe_stats('translate', col, len(english_texts), len(unique_texts), BATCH_SIZE)
+                column_plans.append((col, cn_col, translations, english_indices, unique_texts, inverse))
+            
+            # 英文内容跨列并发翻译
+            translate_jobs = [(col, unique_texts) for col, _, _, _, unique_texts, _ in column_plans if unique_texts]
+            logger.info(f"🚀 开始翻译英文内容: {len(translate_jobs)} 列，共 {sum(len(texts) for _, texts in translate_jobs)} 条")
+            job_translations = iter(self._translate_columns_concurrently(translate_jobs, BATCH_SIZE, checkpoint))
+            
+            for col, cn_col, translations, english_indices, unique_texts, inverse in column_plans:
+                if unique_texts:
+                    unique_translations = next(job_translations)
                     
-                    # 将翻译结果放回对应位置
+                    # 将翻译结果展开放回对应位置
                     for i, english_idx in enumerate(english_indices):
-                        if i < len(english_translations):
-                            translations[english_idx] = english_translations[i]
-                else:
-                    logger.info("📋 无英文内容需要翻译，全部为中文")
+                        if inverse[i] < len(unique_translations):
+                            translations[english_idx] = unique_translations[inverse[i]]
                 
                 # 更新DataFrame
                 df[cn_col] = translations
@@ -1401,6 +1701,8 @@ class QuestionnaireTranslationClassifier:
             # 保存结果
             df.to_excel(output_path, index=False)
             logger.info(f"✅ 翻译结果已保存: {output_path}")
+            if checkpoint:
+                checkpoint.clear()
             return True
             
         except Exception as e:
@@ -1409,8 +1711,11 @@ class QuestionnaireTranslationClassifier:
             logger.error(traceback.format_exc())
             return False
     
-    def standard_labeling_only(self, input_path, output_path):
-        """只进行标准AI分类，基于已翻译的数据"""
+    def standard_labeling_only(self, input_path, output_path, checkpoint=None):
+        """只进行标准AI分类，基于已翻译的数据
+        
+        checkpoint: 可选的 RunCheckpoint，每完成一个批次即写入，重新调用时跳过已完成的批次
+        """
         try:
             logger.info(f"🔧 开始标准AI分类处理: {input_path} -> {output_path}")
             
@@ -1457,34 +1762,48 @@ class QuestionnaireTranslationClassifier:
             
             # 批量分类处理 (降低批次大小以避免API超时)
             BATCH_SIZE = 10  # 从50降低到10，减少API压力
+            self.dedupe_stats = {}
             
+            # 先为所有列准备批次，以便按总批次数上报进度
+            column_plans = []
             for cn_col in cn_columns:
                 original_col = cn_col.replace('-CN', '')
+                
+                # 准备已翻译的文本数据
+                texts = df[cn_col].fillna('').astype(str).tolist()
+                logger.info(f"📋 {cn_col} 已翻译文本数据量: {len(texts)}")
+                
+                # 相同回答只打标一次，完成后按原行展开
+                unique_texts, inverse = self._dedupe_texts(texts)
+                self._record_dedupe_stats('standard_labeling', original_col, len(texts), len(unique_texts), BATCH_SIZE)
+                
+                batches = [unique_texts[i:i+BATCH_SIZE] for i in range(0, len(unique_texts), BATCH_SIZE)]
+                column_plans.append((cn_col, original_col, batches, inverse))
+            
+            total_batches = sum(len(batches) for _, _, batches, _ in column_plans)
+            completed_batches = 0
+            self._report_progress('standard_labeling', completed_batches, total_batches)
+            
+            for cn_col, original_col, batches, inverse in column_plans:
                 sub_tags_col = f"{original_col}二级标签"
                 main_topic_col = f"{original_col}一级主题"
                 
                 logger.info(f"\n🚀 开始为 {cn_col} 进行AI分类")
                 
-                # 准备已翻译的文本数据
-                texts = df[cn_col].fillna('').astype(str).tolist()
-                logger.info(f"📋 已翻译文本数据量: {len(texts)}")
-                
                 sub_tags = []
                 main_topics = []
                 
                 # 批量分类
-                batches = [texts[i:i+BATCH_SIZE] for i in range(0, len(texts), BATCH_SIZE)]
                 logger.info(f"📊 分成 {len(batches)} 个批次分类，批次大小: {BATCH_SIZE}")
                 
                 for batch_idx, batch in enumerate(batches):
                     logger.info(f"🔄 分类批次 {batch_idx + 1}/{len(batches)}")
                     
-                    # 添加延迟以避免API速率限制
-                    if batch_idx > 0:
-                        time.sleep(1)  # 批次间延迟1秒
-                    
                     # 批量翻译+分类 (使用更小的批次大小避免超时)
-                    batch_results = self.batch_translate_and_tag(batch, original_col, "中文", "中文", 8)
+                    batch_results = self._tag_batch_with_checkpoint(
+                        checkpoint, original_col, batch_idx, batch,
+                        source_lang="中文", target_lang="中文", batch_size=8
+                    )
                     
                     # 提取结果 - batch_translate_and_tag 返回 [(translation, tags), ...]
                     for translation, tags in batch_results:
@@ -1498,18 +1817,22 @@ class QuestionnaireTranslationClassifier:
                         main_topic = tag_list[0] if tag_list else ''
                         main_topics.append(main_topic)
                     
-                    # 添加延迟避免API限制
-                    if batch_idx < len(batches) - 1:
-                        time.sleep(1)
+                    completed_batches += 1
+                    self._report_progress(
+                        'standard_labeling', completed_batches, total_batches, original_col,
+                        [{'text': text, 'tags': tags} for text, (_, tags) in zip(batch, batch_results)]
+                    )
                 
                 # 更新DataFrame
-                df[sub_tags_col] = sub_tags
-                df[main_topic_col] = main_topics
+                df[sub_tags_col] = [sub_tags[j] for j in inverse]
+                df[main_topic_col] = [main_topics[j] for j in inverse]
                 logger.info(f"✅ {cn_col} AI分类完成")
             
             # 保存结果
             df.to_excel(output_path, index=False)
             logger.info(f"✅ 标准AI分类结果已保存: {output_path}")
+            if checkpoint:
+                checkpoint.clear()
             return True
             
         except Exception as e:
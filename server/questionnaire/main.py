@@ -15,13 +15,18 @@ import re
 import glob
 from pathlib import Path
 from datetime import datetime
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import pandas as pd
 import numpy as np
 import traceback
 
+from analysis_session_store import AnalysisSessionStore
+from translation_memory import get_translation_memory
+from run_checkpoint import RunCheckpoint
+from analysis_jobs import AnalysisJobManager
+
 # 数据库连接相关导入
 try:
     import pymysql
@@ -74,8 +79,50 @@ TRANSLATE_CUSTOM_MANUAL_FOLDER.mkdir(exist_ok=True)
 # 配置允许的文件类型
 ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls', 'txt'}
 
-# 存储分析结果的临时数据结构
-analysis_results = {}
+# 分析会话存储：元数据和DataFrame持久化到磁盘，内存中按字节数LRU淘汰，超过TTL未访问的会话自动清理
+SESSION_FOLDER = UPLOAD_FOLDER / 'sessions'
+analysis_results = AnalysisSessionStore(SESSION_FOLDER)
+
+
+# 翻译/打标长任务的后台执行器
+job_manager = AnalysisJobManager()
+
+# SSE 无事件时发送心跳的间隔（秒），避免代理断开空闲连接
+SSE_HEARTBEAT_SECONDS = 15
+
+# 参考标签打标每批文本数
+RETAG_BATCH_SIZE = 20
+
+
+def run_or_submit_job(job_type, task, data):
+    """
+    执行翻译/打标任务：请求带 background=true 时提交到后台并立即返回 202，否则同步执行
+
+    task(data, progress=None) 返回 (结果字典, HTTP状态码)
+    """
+    data = data or {}
+    if not data.get('background'):
+        result, status_code = task(data)
+        return jsonify(result), status_code
+    
+    analysis_id = data.get('analysisId')
+    if not analysis_id or analysis_id not in analysis_results:
+        return jsonify({'error': '无效的分析ID'}), 400
+    
+    job = job_manager.submit(analysis_id, job_type, task, data)
+    return jsonify({
+        'jobId': job.job_id,
+        'analysisId': analysis_id,
+        'jobType': job_type,
+        'status': job.status,
+        'eventsUrl': f'/jobs/{analysis_id}/events',
+        'statusUrl': f'/jobs/{analysis_id}'
+    }), 202
+
+
+def create_run_checkpoint(analysis_id, stage, resume):
+    """创建某分析ID某处理阶段的批次检查点（存放在会话目录下，随会话过期一起清理）"""
+    return RunCheckpoint(SESSION_FOLDER / analysis_id / 'checkpoints', analysis_id, stage, resume=resume)
 
 # 数据库连接配置
 DB_CONFIG = {
@@ -500,6 +547,7 @@ def analyze_text():
         
         data = request.get_json()
         analysis_id = data.get('analysisId')
+        resume = bool(data.get('resume', False))  # 是否从上次中断的批次继续
         
         if not analysis_id or analysis_id not in analysis_results:
             return jsonify({'error': '无效的分析ID'}), 400
@@ -528,7 +576,8 @@ def analyze_text():
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             classification_output = Path(input_file).parent / f"classification_{timestamp}.xlsx"
             
-            success = classifier.process_table(input_file, str(classification_output))
+            checkpoint = create_run_checkpoint(analysis_id, 'process_table', resume)
+            success = classifier.process_table(input_file, str(classification_output), checkpoint=checkpoint)
             
             if not success:
                 return jsonify({'error': 'classification处理失败'}), 500
@@ -566,7 +615,9 @@ def analyze_text():
                     'scale_questions': len(question_types['scale_questions']),
                     'single_choice': len(question_types['single_choice']),
                     'open_ended': len(question_types['open_ended']),
-                    'processing_time': datetime.now().isoformat()
+                    'processing_time': datetime.now().isoformat(),
+                    'dedupe': classifier.get_dedupe_summary(),  # 相同回答去重效果
+                    'checkpoint': checkpoint.get_summary()  # 断点续跑情况
                 },
                 'field_types': question_types['field_types'],  # 所有字段的题型信息
                 'scale_questions': question_types['scale_questions'],
@@ -620,13 +671,19 @@ def translate_open_questions():
     请求参数：
     - analysisId: 分析ID
     - selectedFields: 可选，用户选择的开放题字段列表
+    - resume: 可选，为 true 时跳过上次中断前已完成的翻译批次
+    - background: 可选，为 true 时后台执行并立即返回，进度通过 /jobs/<analysisId>/events 获取
     """
+    return run_or_submit_job('translate', _translate_open_questions_task, request.get_json())
+
+def _translate_open_questions_task(data, progress=None):
+    """执行开放题翻译，返回 (结果, HTTP状态码)"""
     try:
         logger.info("🔍 收到开放题翻译请求 - 新版本代码已加载！")
         
-        data = request.get_json()
         analysis_id = data.get('analysisId')
         selected_fields = data.get('selectedFields', None)  # 新增：获取用户选择的字段
+        resume = bool(data.get('resume', False))  # 是否从上次中断的批次继续
         
         # 添加详细的调试日志
         logger.info(f"📥 接收到请求数据: {data}")
@@ -637,7 +694,7 @@ def translate_open_questions():
             logger.info(f"📋 用户选择字段长度: {len(selected_fields)}")
         
         if not analysis_id or analysis_id not in analysis_results:
-            return jsonify({'error': '无效的分析ID'}), 400
+            return {'error': '无效的分析ID'}, 400
         
         analysis_info = analysis_results[analysis_id]
         input_file = analysis_info['file_path']
@@ -681,7 +738,7 @@ def translate_open_questions():
             logger.info(f"🔍 使用全部识别到的 {len(open_ended_fields)} 个开放题字段: {open_ended_fields}")
         
         if not open_ended_fields:
-            return jsonify({'error': '没有找到有效的开放题字段'}), 400
+            return {'error': '没有找到有效的开放题字段'}, 400
         
         try:
             # 导入classification模块进行翻译
@@ -690,9 +747,10 @@ def translate_open_questions():
                 logger.info("✅ 成功导入 QuestionnaireTranslationClassifier")
             except ImportError as e:
                 logger.error(f"❌ 导入 QuestionnaireTranslationClassifier 失败: {e}")
-                return jsonify({'error': f'导入 classification 模块失败: {str(e)}'}), 500
+                return {'error': f'导入 classification 模块失败: {str(e)}'}, 500
             
             classifier = QuestionnaireTranslationClassifier()
+            classifier.progress_callback = progress
             
             # 生成翻译输出文件路径
             base_name, original_timestamp = extract_file_info(input_file)
@@ -701,10 +759,11 @@ def translate_open_questions():
             # 执行翻译（只翻译，不进行AI分类）
             logger.info(f"🔧 开始执行开放题翻译: {input_file} -> {translate_output}")
             
-            success = classifier.translate_only(input_file, str(translate_output), open_ended_fields)
+            checkpoint = create_run_checkpoint(analysis_id, 'translate', resume)
+            success = classifier.translate_only(input_file, str(translate_output), open_ended_fields, checkpoint=checkpoint)
             
             if not success:
-                return jsonify({'error': '开放题翻译处理失败'}), 500
+                return {'error': '开放题翻译处理失败'}, 500
             
             logger.info(f"✅ 开放题翻译完成: {translate_output}")
             
@@ -720,7 +779,10 @@ def translate_open_questions():
                     'processing_time': datetime.now().isoformat(),
                     'output_file': str(translate_output),
                     'selection_mode': 'user_selected' if selected_fields else 'auto_all',  # 新增：标识选择模式
-                    'selected_by_user': bool(selected_fields and len(selected_fields) > 0)  # 新增：是否为用户选择
+                    'selected_by_user': bool(selected_fields and len(selected_fields) > 0),  # 新增：是否为用户选择
+                    'dedupe': classifier.get_dedupe_summary(),  # 相同回答去重效果
+                    'translation_memory': classifier.get_translation_memory_summary(),  # 翻译记忆命中率
+                    'checkpoint': checkpoint.get_summary()  # 断点续跑情况
                 },
                 'translated_data': [],
                 'open_ended_fields': open_ended_fields,
@@ -741,40 +803,44 @@ def translate_open_questions():
             analysis_results[analysis_id]['translation_output'] = str(translate_output)
             
             logger.info(f"✅ 开放题翻译完成，分析ID: {analysis_id}")
-            return jsonify(convert_pandas_types(result))
+            return convert_pandas_types(result), 200
             
         except Exception as e:
             logger.error(f"❌ 开放题翻译失败: {e}")
             logger.error(f"❌ 异常类型: {type(e)}")
             import traceback
             logger.error(f"❌ 异常堆栈: {traceback.format_exc()}")
-            return jsonify({'error': f'开放题翻译失败: {str(e)}'}), 500
+            return {'error': f'开放题翻译失败: {str(e)}'}, 500
             
     except Exception as e:
         logger.error(f"❌ 翻译请求处理失败: {e}")
-        return jsonify({'error': f'翻译请求处理失败: {str(e)}'}), 500
+        return {'error': f'翻译请求处理失败: {str(e)}'}, 500
 
 @app.route('/standard-labeling', methods=['POST'])
 def handle_standard_labeling():
-    """标准AI打标 - 基于翻译后的数据进行AI自动分类"""
+    """标准AI打标 - 基于翻译后的数据进行AI自动分类（background 为 true 时后台执行）"""
+    return run_or_submit_job('standard_labeling', _standard_labeling_task, request.get_json())
+
+def _standard_labeling_task(data, progress=None):
+    """执行标准AI打标，返回 (结果, HTTP状态码)"""
     try:
         logger.info("🔍 收到标准AI打标请求")
         
-        data = request.get_json()
         analysis_id = data.get('analysisId')
+        resume = bool(data.get('resume', False))  # 是否从上次中断的批次继续
         
         if not analysis_id or analysis_id not in analysis_results:
-            return jsonify({'error': '无效的分析ID'}), 400
+            return {'error': '无效的分析ID'}, 400
         
         analysis_info = analysis_results[analysis_id]
         
         # 检查是否已完成翻译
         if 'translation_output' not in analysis_info:
-            return jsonify({'error': '请先完成开放题翻译'}), 400
+            return {'error': '请先完成开放题翻译'}, 400
         
         translation_output = analysis_info['translation_output']
         if not os.path.exists(translation_output):
-            return jsonify({'error': '翻译结果文件不存在'}), 400
+            return {'error': '翻译结果文件不存在'}, 400
         
         logger.info(f"📊 基于翻译文件进行标准AI打标: {translation_output}")
         
@@ -785,9 +851,10 @@ def handle_standard_labeling():
                 logger.info("✅ 成功导入 QuestionnaireTranslationClassifier")
             except ImportError as e:
                 logger.error(f"❌ 导入 QuestionnaireTranslationClassifier 失败: {e}")
-                return jsonify({'error': f'导入 classification 模块失败: {str(e)}'}), 500
+                return {'error': f'导入 classification 模块失败: {str(e)}'}, 500
             
             classifier = QuestionnaireTranslationClassifier()
+            classifier.progress_callback = progress
             
             # 生成标准打标输出文件路径
             base_name, original_timestamp = extract_file_info(translation_output)
@@ -796,10 +863,11 @@ def handle_standard_labeling():
             # 执行标准AI打标（基于已翻译的数据）
             logger.info(f"🔧 开始执行标准AI打标: {translation_output} -> {standard_labeling_output}")
             
-            success = classifier.standard_labeling_only(str(translation_output), str(standard_labeling_output))
+            checkpoint = create_run_checkpoint(analysis_id, 'standard_labeling', resume)
+            success = classifier.standard_labeling_only(str(translation_output), str(standard_labeling_output), checkpoint=checkpoint)
             
             if not success:
-                return jsonify({'error': '标准AI打标处理失败'}), 500
+                return {'error': '标准AI打标处理失败'}, 500
             
             logger.info(f"✅ 标准AI打标完成: {standard_labeling_output}")
             
@@ -816,7 +884,9 @@ def handle_standard_labeling():
                     'processed_fields': len(open_ended_fields),
                     'processing_time': datetime.now().isoformat(),
                     'output_file': str(standard_labeling_output),
-                    'labeling_type': 'standard_ai'
+                    'labeling_type': 'standard_ai',
+                    'dedupe': classifier.get_dedupe_summary(),  # 相同回答去重效果
+                    'checkpoint': checkpoint.get_summary()  # 断点续跑情况
                 },
                 'processed_data': [],
                 'field_analysis': {},
@@ -866,50 +936,53 @@ def handle_standard_labeling():
             analysis_results[analysis_id]['standard_labeling_output'] = str(standard_labeling_output)
             
             logger.info(f"✅ 标准AI打标完成，分析ID: {analysis_id}")
-            return jsonify(convert_pandas_types(result))
+            return convert_pandas_types(result), 200
             
         except Exception as e:
             logger.error(f"❌ 标准AI打标失败: {e}")
             logger.error(f"❌ 异常类型: {type(e)}")
             import traceback
             logger.error(f"❌ 异常堆栈: {traceback.format_exc()}")
-            return jsonify({'error': f'标准AI打标失败: {str(e)}'}), 500
+            return {'error': f'标准AI打标失败: {str(e)}'}, 500
             
     except Exception as e:
         logger.error(f"❌ 标准AI打标请求处理失败: {e}")
-        return jsonify({'error': f'标准AI打标请求处理失败: {str(e)}'}), 500
+        return {'error': f'标准AI打标请求处理失败: {str(e)}'}, 500
 
 
 @app.route('/retag-with-reference', methods=['POST'])
 def retag_with_reference():
-    """基于参考标签重新打标"""
+    """基于参考标签重新打标（background 为 true 时后台执行）"""
+    return run_or_submit_job('retag_with_reference', _retag_with_reference_task, request.get_json())
+
+def _retag_with_reference_task(data, progress=None):
+    """执行参考标签重新打标，返回 (结果, HTTP状态码)"""
     try:
         logger.info("🏷️  收到参考标签重新打标请求")
         
-        data = request.get_json()
         analysis_id = data.get('analysisId')
         reference_tags = data.get('reference_tags', [])
         
         if not analysis_id or analysis_id not in analysis_results:
-            return jsonify({'error': '无效的分析ID'}), 400
+            return {'error': '无效的分析ID'}, 400
         
         if not reference_tags:
-            return jsonify({'error': '请提供参考标签'}), 400
+            return {'error': '请提供参考标签'}, 400
         
         # 验证参考标签格式
         for tag in reference_tags:
             if not isinstance(tag, dict) or 'name' not in tag or 'definition' not in tag:
-                return jsonify({'error': '参考标签格式错误，需要包含name和definition字段'}), 400
+                return {'error': '参考标签格式错误，需要包含name和definition字段'}, 400
         
         analysis_info = analysis_results[analysis_id]
         
         # 检查是否已完成翻译
         if 'translation_output' not in analysis_info:
-            return jsonify({'error': '请先完成开放题翻译'}), 400
+            return {'error': '请先完成开放题翻译'}, 400
         
         translation_output = analysis_info['translation_output']
         if not os.path.exists(translation_output):
-            return jsonify({'error': '翻译结果文件不存在'}), 400
+            return {'error': '翻译结果文件不存在'}, 400
         
         input_file = translation_output
         logger.info(f"📁 基于翻译文件进行参考标签打标: {input_file}")
@@ -926,9 +999,10 @@ def retag_with_reference():
                 logger.info("✅ 成功导入 QuestionnaireTranslationClassifier")
             except ImportError as e:
                 logger.error(f"❌ 导入 QuestionnaireTranslationClassifier 失败: {e}")
-                return jsonify({'error': f'导入 classification 模块失败: {str(e)}'}), 500
+                return {'error': f'导入 classification 模块失败: {str(e)}'}, 500
             
             classifier = QuestionnaireTranslationClassifier()
+            classifier.progress_callback = progress
             
             # 生成输出文件路径到translate_custom子目录
             # 从翻译文件路径提取基础信息
@@ -948,26 +1022,43 @@ def retag_with_reference():
                 logger.info(f"🔍 发现 {len(cn_columns)} 个已翻译的-CN字段: {cn_columns}")
                 
                 if not cn_columns:
-                    return jsonify({'error': '未找到已翻译的-CN字段，请先进行初始分类'}), 400
+                    return {'error': '未找到已翻译的-CN字段，请先进行初始分类'}, 400
                 
                 # 设置参考标签
                 classifier.set_reference_tags(reference_tags)
                 
-                # 为每个-CN字段重新打标
+                # 分批打标，便于按批次上报进度（相同回答只打标一次）
+                column_plans = []
                 for cn_col in cn_columns:
+                    cn_texts = df[cn_col].fillna('').astype(str).tolist()
+                    unique_texts, inverse = classifier._dedupe_texts(cn_texts)
+                    batches = [unique_texts[i:i + RETAG_BATCH_SIZE] for i in range(0, len(unique_texts), RETAG_BATCH_SIZE)]
+                    column_plans.append((cn_col, batches, inverse))
+                
+                total_batches = sum(len(batches) for _, batches, _ in column_plans)
+                completed_batches = 0
+                classifier._report_progress('retag_with_reference', completed_batches, total_batches)
+                
+                # 为每个-CN字段重新打标
+                for cn_col, batches, inverse in column_plans:
                     original_col = cn_col.replace('-CN', '')
                     tag_col = f"{original_col}标签"
                     
-                    logger.info(f"🏷️  正在为 {cn_col} 重新打标...")
-                    
-                    # 获取已翻译的中文文本
-                    cn_texts = df[cn_col].fillna('').astype(str).tolist()
+                    logger.info(f"🏷️  正在为 {cn_col} 重新打标，共 {len(batches)} 个批次...")
                     
                     # 基于参考标签打标
-                    assigned_tags = classifier.assign_tags_based_on_reference(cn_texts)
+                    unique_tags = []
+                    for batch in batches:
+                        batch_tags = classifier.assign_tags_based_on_reference(batch)
+                        unique_tags.extend(batch_tags)
+                        completed_batches += 1
+                        classifier._report_progress(
+                            'retag_with_reference', completed_batches, total_batches, original_col,
+                            [{'text': text, 'tags': tags} for text, tags in zip(batch, batch_tags)]
+                        )
                     
                     # 更新DataFrame - 只生成一个标签字段
-                    df[tag_col] = assigned_tags
+                    df[tag_col] = [unique_tags[j] for j in inverse]
                     
                     logger.info(f"✅ {cn_col} 重新打标完成")
                 
@@ -982,7 +1073,7 @@ def retag_with_reference():
                 logger.error(f"❌ 异常类型: {type(process_error)}")
                 import traceback
                 logger.error(f"❌ 异常堆栈: {traceback.format_exc()}")
-                return jsonify({'error': f'参考标签重新打标异常: {str(process_error)}'}), 500
+                return {'error': f'参考标签重新打标异常: {str(process_error)}'}, 500
             
             logger.info(f"✅ 参考标签重新打标完成: {output_file}")
             
@@ -1015,21 +1106,70 @@ def retag_with_reference():
             analysis_results[analysis_id]['custom_labeling_output'] = str(output_file)
             
             logger.info(f"✅ 参考标签重新打标完成，分析ID: {analysis_id}")
-            return jsonify(convert_pandas_types(result))
+            return convert_pandas_types(result), 200
             
         except Exception as e:
             logger.error(f"❌ 参考标签重新打标失败: {e}")
             logger.error(f"❌ 异常类型: {type(e)}")
             import traceback
             logger.error(f"❌ 异常堆栈: {traceback.format_exc()}")
-            return jsonify({'error': f'参考标签重新打标失败: {str(e)}'}), 500
+            return {'error': f'参考标签重新打标失败: {str(e)}'}, 500
             
     except Exception as e:
         logger.error(f"❌ 参考标签重新打标请求处理失败: {e}")
         logger.error(f"❌ 异常类型: {type(e)}")
         import traceback
         logger.error(f"❌ 异常堆栈: {traceback.format_exc()}")
-        return jsonify({'error': f'参考标签重新打标请求处理失败: {str(e)}'}), 500
+        return {'error': f'参考标签重新打标请求处理失败: {str(e)}'}, 500
+
+@app.route('/jobs/<analysis_id>', methods=['GET'])
+def get_analysis_jobs(analysis_id):
+    """查询某分析ID的后台任务状态（轮询方式），任务完成后包含结果"""
+    jobs = job_manager.get_jobs(analysis_id)
+    if not jobs:
+        return jsonify({'error': '该分析ID没有后台任务'}), 404
+    return jsonify({
+        'analysisId': analysis_id,
+        'jobs': [convert_pandas_types(job.to_dict()) for job in jobs]
+    })
+
+@app.route('/jobs/<analysis_id>/events', methods=['GET'])
+def stream_analysis_job_events(analysis_id):
+    """
+    以 Server-Sent Events 推送某分析ID后台任务的批次进度
+    
+    事件类型：queued / running / progress / completed / failed；
+    断线重连时浏览器会带上 Last-Event-ID，从该事件之后继续推送。所有任务结束后关闭连接
+    """
+    if not job_manager.get_jobs(analysis_id):
+        return jsonify({'error': '该分析ID没有后台任务'}), 404
+    
+    channel = job_manager.channel(analysis_id)
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId') or 0
+    try:
+        last_event_id = int(last_event_id)
+    except ValueError:
+        last_event_id = 0
+    
+    def generate(last_id):
+        while True:
+            events = channel.wait_for_events(last_id, SSE_HEARTBEAT_SECONDS)
+            for event in events:
+                last_id = event['id']
+                payload = json.dumps(convert_pandas_types(event['data']), ensure_ascii=False)
+                yield f"id: {event['id']}\nevent: {event['event']}\ndata: {payload}\n\n"
+            if not events:
+                if not job_manager.has_active_jobs(analysis_id):
+                    break
+                yield ": heartbeat\n\n"
+            elif not job_manager.has_active_jobs(analysis_id) and events[-1]['event'] in ('completed', 'failed'):
+                break
+    
+    return Response(
+        stream_with_context(generate(last_event_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/analysis-results/<analysis_id>', methods=['GET'])
 def get_analysis_results(analysis_id):
@@ -2267,7 +2407,8 @@ def get_analysis_history():
     """获取分析历史"""
     try:
         history = []
-        for analysis_id, info in analysis_results.items():
+        # 只读元数据：不重置各会话的TTL，也不把全部会话加载进内存
+        for analysis_id, info in analysis_results.list_metadata():
             history.append({
                 'analysisId': analysis_id,
                 'filename': info.get('filename', 'Unknown'),
@@ -2281,13 +2422,67 @@ def get_analysis_history():
         logger.error(f"❌ 获取分析历史失败: {e}")
         return jsonify({'error': f'获取分析历史失败: {str(e)}'}), 500
 
+# 翻译记忆库管理接口
+@app.route('/translation-memory', methods=['GET'])
+def translation_memory_stats():
+    """获取翻译记忆库统计"""
+    memory = get_translation_memory()
+    if memory is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **memory.get_stats()})
+
+@app.route('/translation-memory/export', methods=['GET'])
+def export_translation_memory():
+    """导出翻译记忆库为JSON文件"""
+    try:
+        memory = get_translation_memory()
+        if memory is None:
+            return jsonify({'error': '翻译记忆库未启用'}), 400
+        
+        export_path = UPLOAD_FOLDER / f"translation_memory_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        memory.export_to_file(str(export_path))
+        return send_file(
+            str(export_path),
+            as_attachment=True,
+            download_name=export_path.name,
+            mimetype='application/json'
+        )
+    except Exception as e:
+        logger.error(f"❌ 导出翻译记忆库失败: {e}")
+        return jsonify({'error': f'导出翻译记忆库失败: {str(e)}'}), 500
+
+@app.route('/translation-memory/import', methods=['POST'])
+def import_translation_memory():
+    """导入翻译记忆库JSON文件（overwrite=false 时保留已有译文）"""
+    try:
+        memory = get_translation_memory()
+        if memory is None:
+            return jsonify({'error': '翻译记忆库未启用'}), 400
+        
+        if 'file' not in request.files or not request.files['file'].filename:
+            return jsonify({'error': '没有上传文件'}), 400
+        
+        overwrite = request.form.get('overwrite', 'true').lower() in ('true', '1', 'yes')
+        import_path = UPLOAD_FOLDER / f"translation_memory_import_{uuid.uuid4().hex}.json"
+        request.files['file'].save(str(import_path))
+        try:
+            imported = memory.import_from_file(str(import_path), overwrite=overwrite)
+        finally:
+            import_path.unlink(missing_ok=True)
+        
+        return jsonify({'success': True, 'imported': imported, **memory.get_stats()})
+    except Exception as e:
+        logger.error(f"❌ 导入翻译记忆库失败: {e}")
+        return jsonify({'error': f'导入翻译记忆库失败: {str(e)}'}), 500
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """健康检查接口"""
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'service': 'questionnaire-analysis-api'
+        'service': 'questionnaire-analysis-api',
+        'sessionStore': analysis_results.get_stats()
     })
 
 # 数据库相关API接口
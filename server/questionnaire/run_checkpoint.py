@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+问卷处理断点续跑
+process_table / translate_only / standard_labeling_only 每完成一个批次就把结果追加写入检查点文件，
+按 (列名, 批次序号) 索引；服务重启或网络中断后带 resume 标志重新调用，已完成的批次直接复用，
+不再重复调用API
+
+检查点文件位于会话目录 uploads/sessions/<analysis_id>/checkpoints/<stage>.jsonl，
+随会话一起过期清理。每个批次同时记录输入文本的指纹，输入变化的批次不会被误用
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class RunCheckpoint:
+    """单次处理（某分析ID的某个阶段）的批次检查点"""
+
+    def __init__(self, checkpoint_dir, analysis_id, stage, resume=False):
+        """
+        Args:
+            checkpoint_dir: 检查点目录
+            analysis_id: 分析ID（仅用于日志）
+            stage: 处理阶段，如 process_table / translate / standard_labeling
+            resume: True 时加载已有检查点继续处理；False 时清空已有检查点重新开始
+        """
+        self.analysis_id = analysis_id
+        self.stage = stage
+        self.path = Path(checkpoint_dir) / f"{stage}.jsonl"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._batches = {}
+        self.resumed_batches = 0
+        self.saved_batches = 0
+
+        if resume:
+            self._load()
+        else:
+            self.clear()
+
+    @staticmethod
+    def fingerprint(texts):
+        """批次输入文本的指纹"""
+        return hashlib.sha1(json.dumps(list(texts), ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def _load(self):
+        if not self.path.exists():
+            logger.info(f"📍 {self.analysis_id}/{self.stage} 没有可恢复的检查点，从头开始")
+            return
+
+        valid_lines = []
+        corrupted = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 写入中途中断留下的不完整行
+                    corrupted += 1
+                    continue
+                valid_lines.append(line.rstrip('\n') + '\n')
+                self._batches[(entry['column'], entry['batch'])] = (entry['fingerprint'], entry['results'])
+
+        if corrupted:
+            # 去掉不完整的行，避免后续追加的记录接在残行后面
+            logger.warning(f"⚠️ 跳过 {corrupted} 条损坏的检查点记录: {self.path}")
+            with open(self.path, 'w', encoding='utf-8') as f:
+                f.writelines(valid_lines)
+
+        logger.info(f"📍 {self.analysis_id}/{self.stage} 加载检查点 {len(self._batches)} 个已完成批次")
+
+    def get(self, column, batch_index, texts):
+        """
+        读取已完成批次的结果
+
+        Returns:
+            批次结果；未完成或输入已变化时返回 None
+        """
+        entry = self._batches.get((column, batch_index))
+        if entry is None or entry[0] != self.fingerprint(texts):
+            return None
+        with self._lock:
+            self.resumed_batches += 1
+        return entry[1]
+
+    def save(self, column, batch_index, texts, results):
+        """追加保存一个已完成批次（立即落盘）"""
+        fingerprint = self.fingerprint(texts)
+        line = json.dumps({
+            'column': column,
+            'batch': batch_index,
+            'fingerprint': fingerprint,
+            'results': [list(result) if isinstance(result, tuple) else result for result in results]
+        }, ensure_ascii=False)
+
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self._batches[(column, batch_index)] = (fingerprint, results)
+            self.saved_batches += 1
+
+    def clear(self):
+        """删除检查点文件（重新开始或处理成功后调用）"""
+        with self._lock:
+            self._batches = {}
+            if self.path.exists():
+                self.path.unlink()
+
+    def get_summary(self):
+        return {
+            'stage': self.stage,
+            'resumed_batches': self.resumed_batches,
+            'saved_batches': self.saved_batches
+        }
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+问卷翻译记忆库
+同一问卷模板会反复投放，回答大量重复；翻译前先按"归一化原文 + 语言对"查询本地 SQLite 记忆库，
+命中的回答直接复用历史译文，只有未命中的回答才调用API，翻译成功后写回记忆库
+
+- 精确匹配：原文经 normalize_answer 归一化后作为键
+- 淘汰：条目数超过上限时按最近使用时间淘汰；可选按天数过期
+- 导出/导入：JSON 文件，便于在环境之间迁移或人工校对后回灌
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = Path(__file__).parent / 'uploads' / 'translation_memory.sqlite3'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS translation_memory (
+    source_key TEXT NOT NULL,
+    source_lang TEXT NOT NULL,
+    target_lang TEXT NOT NULL,
+    source_text TEXT NOT NULL,
+    translation TEXT NOT NULL,
+    hit_count INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    PRIMARY KEY (source_key, source_lang, target_lang)
+);
+CREATE INDEX IF NOT EXISTS idx_tm_last_used ON translation_memory (last_used_at);
+"""
+
+# SQLite 单条语句的参数个数上限较低，批量查询时分块
+_LOOKUP_CHUNK_SIZE = 500
+
+
+def normalize_answer(text):
+    """归一化回答文本：去首尾空白、合并连续空白、统一小写、去掉末尾标点"""
+    text = ' '.join(str(text).split()).lower()
+    return text.rstrip('.。!！?？~～ ')
+
+
+class TranslationMemory:
+    """基于 SQLite 的翻译记忆库（线程安全）"""
+
+    def __init__(self, db_path=None, max_entries=None, ttl_days=None):
+        """
+        Args:
+            db_path: 数据库文件路径，默认 TRANSLATION_MEMORY_PATH 或 uploads/translation_memory.sqlite3
+            max_entries: 最多保留的条目数，超出时按最近使用时间淘汰（0 表示不限制）
+            ttl_days: 超过该天数未使用的条目被淘汰（0 表示不过期）
+        """
+        if db_path is None:
+            db_path = os.getenv('TRANSLATION_MEMORY_PATH') or DEFAULT_DB_PATH
+        if max_entries is None:
+            max_entries = int(os.getenv('TRANSLATION_MEMORY_MAX_ENTRIES', 200000))
+        if ttl_days is None:
+            ttl_days = float(os.getenv('TRANSLATION_MEMORY_TTL_DAYS', 0))
+
+        self.db_path = Path(db_path)
+        self.max_entries = max(0, max_entries)
+        self.ttl_seconds = max(0.0, ttl_days) * 86400
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+        logger.info(f"📚 翻译记忆库已加载: {self.db_path}，共 {self.count()} 条")
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM translation_memory').fetchone()[0]
+
+    def lookup_many(self, texts, source_lang, target_lang):
+        """
+        批量精确查询
+
+        Returns:
+            {归一化原文: 译文}，只包含命中的条目
+        """
+        keys = list({normalize_answer(text) for text in texts if str(text).strip()})
+        if not keys:
+            return {}
+
+        hits = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), _LOOKUP_CHUNK_SIZE):
+                chunk = keys[start:start + _LOOKUP_CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"""SELECT source_key, translation FROM translation_memory
+                        WHERE source_lang = ? AND target_lang = ? AND source_key IN ({placeholders})""",
+                    [source_lang, target_lang] + chunk
+                ).fetchall()
+                hits.update(rows)
+
+            if hits:
+                self._conn.executemany(
+                    """UPDATE translation_memory SET hit_count = hit_count + 1, last_used_at = ?
+                       WHERE source_key = ? AND source_lang = ? AND target_lang = ?""",
+                    [(now, key, source_lang, target_lang) for key in hits]
+                )
+                self._conn.commit()
+        return hits
+
+    def store_many(self, pairs, source_lang, target_lang):
+        """
+        写入译文（同键覆盖），写入后按上限淘汰
+
+        Args:
+            pairs: [(原文, 译文)]
+        """
+        now = time.time()
+        rows = [
+            (normalize_answer(source), source_lang, target_lang, source, translation, now, now)
+            for source, translation in pairs
+            if str(source).strip() and str(translation).strip()
+        ]
+        if not rows:
+            return 0
+
+        with self._lock:
+            self._conn.executemany(
+                """INSERT INTO translation_memory
+                       (source_key, source_lang, target_lang, source_text, translation, hit_count, created_at, last_used_at)
+                   VALUES (?, ?, ?, ?, ?, 0, ?, ?)
+                   ON CONFLICT (source_key, source_lang, target_lang)
+                   DO UPDATE SET translation = excluded.translation, last_used_at = excluded.last_used_at""",
+                rows
+            )
+            self._conn.commit()
+        self.evict()
+        return len(rows)
+
+    def evict(self, max_entries=None, ttl_days=None):
+        """
+        淘汰过期和超出上限的条目
+
+        Returns:
+            淘汰的条目数
+        """
+        max_entries = self.max_entries if max_entries is None else max_entries
+        ttl_seconds = self.ttl_seconds if ttl_days is None else ttl_days * 86400
+
+        deleted = 0
+        with self._lock:
+            if ttl_seconds:
+                deleted += self._conn.execute(
+                    'DELETE FROM translation_memory WHERE last_used_at < ?',
+                    (time.time() - ttl_seconds,)
+                ).rowcount
+            if max_entries:
+                total = self._conn.execute('SELECT COUNT(*) FROM translation_memory').fetchone()[0]
+                if total > max_entries:
+                    deleted += self._conn.execute(
+                        """DELETE FROM translation_memory WHERE rowid IN (
+                               SELECT rowid FROM translation_memory ORDER BY last_used_at LIMIT ?)""",
+                        (total - max_entries,)
+                    ).rowcount
+            self._conn.commit()
+
+        if deleted:
+            logger.info(f"🧹 翻译记忆库淘汰 {deleted} 条")
+        return deleted
+
+    def export_to_file(self, file_path):
+        """导出全部条目为 JSON 文件，返回导出条数"""
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT source_text, translation, source_lang, target_lang, hit_count, created_at, last_used_at
+                   FROM translation_memory ORDER BY created_at"""
+            ).fetchall()
+
+        entries = [
+            {
+                'source_text': source_text,
+                'translation': translation,
+                'source_lang': source_lang,
+                'target_lang': target_lang,
+                'hit_count': hit_count,
+                'created_at': created_at,
+                'last_used_at': last_used_at
+            }
+            for source_text, translation, source_lang, target_lang, hit_count, created_at, last_used_at in rows
+        ]
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'entries': entries}, f, ensure_ascii=False, indent=2)
+
+        logger.info(f"📤 翻译记忆库导出 {len(entries)} 条: {file_path}")
+        return len(entries)
+
+    def import_from_file(self, file_path, overwrite=True):
+        """
+        从 export_to_file 生成的 JSON 文件导入
+
+        Args:
+            overwrite: 已存在相同键时是否用导入的译文覆盖
+
+        Returns:
+            导入条数
+        """
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        entries = data.get('entries', []) if isinstance(data, dict) else data
+
+        now = time.time()
+        rows = []
+        for entry in entries:
+            source_text = str(entry.get('source_text', ''))
+            translation = str(entry.get('translation', ''))
+            if not source_text.strip() or not translation.strip():
+                continue
+            rows.append((
+                normalize_answer(source_text),
+                entry.get('source_lang', 'en'),
+                entry.get('target_lang', 'zh'),
+                source_text,
+                translation,
+                int(entry.get('hit_count', 0)),
+                float(entry.get('created_at', now)),
+                float(entry.get('last_used_at', now))
+            ))
+
+        conflict_action = (
+            'DO UPDATE SET translation = excluded.translation, source_text = excluded.source_text'
+            if overwrite else 'DO NOTHING'
+        )
+        with self._lock:
+            self._conn.executemany(
+                f"""INSERT INTO translation_memory
+                        (source_key, source_lang, target_lang, source_text, translation, hit_count, created_at, last_used_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (source_key, source_lang, target_lang) {conflict_action}""",
+                rows
+            )
+            self._conn.commit()
+        self.evict()
+
+        logger.info(f"📥 翻译记忆库导入 {len(rows)} 条: {file_path}")
+        return len(rows)
+
+    def get_stats(self):
+        with self._lock:
+            total, hits = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(hit_count), 0) FROM translation_memory'
+            ).fetchone()
+        return {
+            'path': str(self.db_path),
+            'entries': total,
+            'total_hits': hits,
+            'max_entries': self.max_entries,
+            'ttl_days': self.ttl_seconds / 86400
+        }
+
+
+_translation_memory = None
+_translation_memory_lock = threading.Lock()
+
+
+def get_translation_memory():
+    """
+    获取进程内共享的翻译记忆库
+
+    TRANSLATION_MEMORY_ENABLED=false 时返回 None；数据库无法打开时记录错误并返回 None
+    """
+    global _translation_memory
+    if os.getenv('TRANSLATION_MEMORY_ENABLED', 'true').lower() not in ('true', '1', 'yes'):
+        return None
+    if _translation_memory is None:
+        with _translation_memory_lock:
+            if _translation_memory is None:
+                try:
+                    _translation_memory = TranslationMemory()
+                except Exception as e:
+                    logger.error(f"❌ 翻译记忆库初始化失败，本次不使用翻译记忆: {e}")
+                    return None
+    return _translation_memory
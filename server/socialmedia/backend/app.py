@@ -77,6 +77,7 @@ def health_check():
         return jsonify({
             'status': 'healthy',
             'database': 'connected' if db_status else 'disconnected',
+            'connection_pool': db_config.get_pool_stats(),
             'timestamp': datetime.now().isoformat()
         })
     except Exception as e:
@@ -124,6 +125,7 @@ def get_processing_status():
         return jsonify({
             'success': True,
             'data': status,
+            'jobs': upload_controller.get_active_jobs(),
             'timestamp': datetime.now().isoformat()
         }), 200
     except Exception as e:
@@ -323,6 +325,36 @@ def etl_ods_to_dwd():
         logger.error(f"ODS到DWD处理失败：{e}")
         return jsonify({'success': False, 'error': f'处理失败：{str(e)}'}), 500
 
+@app.route('/api/etl/ods-to-dwd-partitioned', methods=['POST'])
+def etl_ods_to_dwd_partitioned():
+    """ODS到DWD分区并行处理API（历史数据回填，后台执行，通过 /api/etl/jobs/<job_id> 查询进度）"""
+    try:
+        result = etl_controller.process_ods_to_dwd_partitioned()
+        
+        if result['success']:
+            return jsonify(result), 202
+        else:
+            return jsonify(result), 400
+            
+    except Exception as e:
+        logger.error(f"ODS分区并行处理失败：{e}")
+        return jsonify({'success': False, 'error': f'处理失败：{str(e)}'}), 500
+
+@app.route('/api/etl/jobs/<job_id>', methods=['GET'])
+def etl_job_status(job_id):
+    """后台ETL任务状态查询API"""
+    try:
+        result = etl_controller.get_job(job_id)
+        
+        if result['success']:
+            return jsonify(result), 200
+        else:
+            return jsonify(result), 404
+            
+    except Exception as e:
+        logger.error(f"查询ETL任务状态失败：{e}")
+        return jsonify({'success': False, 'error': f'查询失败：{str(e)}'}), 500
+
 @app.route('/api/etl/dwd-to-ai', methods=['POST'])
 def etl_dwd_to_ai():
     """DWD到AI同步API"""
@@ -353,6 +385,21 @@ def etl_full_pipeline():
         logger.error(f"ETL流水线执行失败：{e}")
         return jsonify({'success': False, 'error': f'流水线执行失败：{str(e)}'}), 500
 
+@app.route('/api/etl/rebuild-rollup', methods=['POST'])
+def etl_rebuild_rollup():
+    """重建小时级情感汇总表API"""
+    try:
+        result = etl_controller.rebuild_sentiment_rollup()
+        
+        if result['success']:
+            return jsonify(result), 200
+        else:
+            return jsonify(result), 400
+            
+    except Exception as e:
+        logger.error(f"情感汇总表重建失败：{e}")
+        return jsonify({'success': False, 'error': f'重建失败：{str(e)}'}), 500
+
 @app.route('/api/etl/status', methods=['GET'])
 def etl_status():
     """ETL状态查询API"""
@@ -432,6 +479,36 @@ def ai_cleanup():
         logger.error(f"数据清理失败：{e}")
         return jsonify({'success': False, 'error': f'清理失败：{str(e)}'}), 500
 
+@app.route('/api/ai/prescreen/stats', methods=['GET'])
+def ai_prescreen_stats():
+    """获取本地情感预筛统计API"""
+    try:
+        result = ai_controller.get_prescreen_stats()
+        
+        if result['success']:
+            return jsonify(result), 200
+        else:
+            return jsonify(result), 400
+            
+    except Exception as e:
+        logger.error(f"获取情感预筛统计失败：{e}")
+        return jsonify({'success': False, 'error': f'统计查询失败：{str(e)}'}), 500
+
+@app.route('/api/ai/prescreen/train', methods=['POST'])
+def ai_prescreen_train():
+    """训练本地情感预筛模型API"""
+    try:
+        result = ai_controller.train_prescreen_model()
+        
+        if result['success']:
+            return jsonify(result), 200
+        else:
+            return jsonify(result), 400
+            
+    except Exception as e:
+        logger.error(f"情感预筛模型训练失败：{e}")
+        return jsonify({'success': False, 'error': f'训练失败：{str(e)}'}), 500
+
 if __name__ == '__main__':
     # 创建必要的目录
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
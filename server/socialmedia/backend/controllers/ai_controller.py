@@ -39,8 +39,17 @@ class AIController:
                     'data': None
                 }
             
+            # 并发请求数（可选），未指定时使用服务端配置
+            concurrency = request.json.get('concurrency') if request.json else None
+            if concurrency is not None and (not isinstance(concurrency, int) or not 1 <= concurrency <= 32):
+                return {
+                    'success': False,
+                    'error': '并发数必须是1到32之间的整数',
+                    'data': None
+                }
+            
             # 执行AI分析
-            result = self.batch_ai_analyzer.process_pending_ai_analysis(batch_size)
+            result = self.batch_ai_analyzer.process_pending_ai_analysis(batch_size, concurrency)
             
             return {
                 'success': True,
@@ -154,3 +163,80 @@ class AIController:
                 'error': error_msg,
                 'data': None
             }
+    
+    def get_prescreen_stats(self) -> Dict[str, Any]:
+        """获取本地情感预筛统计API（跳过比例、与OpenAI标签的一致率）"""
+        try:
+            result = self.batch_ai_analyzer.ai_analyzer.get_prescreen_stats()
+            
+            return {
+                'success': True,
+                'message': '情感预筛统计获取成功',
+                'data': result
+            }
+            
+        except Exception as e:
+            error_msg = f"获取情感预筛统计失败：{str(e)}"
+            logger.error(error_msg)
+            return {
+                'success': False,
+                'error': error_msg,
+                'data': None
+            }
+    
+    def train_prescreen_model(self) -> Dict[str, Any]:
+        """用已有的OpenAI情感标签训练本地预筛模型API"""
+        try:
+            prescreener = self.batch_ai_analyzer.ai_analyzer.prescreener
+            if prescreener is None:
+                return {
+                    'success': False,
+                    'error': '情感预筛未启用（SENTIMENT_PRESCREEN_MODE=off）',
+                    'data': None
+                }
+            
+            # 获取请求参数
+            limit = request.json.get('limit', 20000) if request.json else 20000
+            min_confidence = request.json.get('min_confidence', 0.7) if request.json else 0.7
+            
+            # 参数验证
+            if not isinstance(limit, int) or limit <= 0:
+                return {
+                    'success': False,
+                    'error': '训练样本数必须是正整数',
+                    'data': None
+                }
+            
+            if not isinstance(min_confidence, (int, float)) or not 0 <= min_confidence <= 1:
+                return {
+                    'success': False,
+                    'error': '最低置信度必须在0到1之间',
+                    'data': None
+                }
+            
+            result = prescreener.train_from_database(limit, float(min_confidence))
+            
+            if result.get('status') != 'completed':
+                return {
+                    'success': False,
+                    'error': result.get('message', '情感预筛模型训练失败'),
+                    'data': result
+                }
+            
+            # 模型变化后重新统计一致率
+            prescreener.reset_stats()
+            
+            return {
+                'success': True,
+                'message': f"情感预筛模型训练完成，共 {result['documents']} 条样本",
+                'data': result
+            }
+            
+        except Exception as e:
+            error_msg = f"情感预筛模型训练失败：{str(e)}"
+            logger.error(error_msg)
+            return {
+                'success': False,
+                'error': error_msg,
+                'data': None
+            }
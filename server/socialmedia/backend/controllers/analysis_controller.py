@@ -4,12 +4,14 @@
 处理数据分析相关的HTTP请求
 """
 
+import os
 import json
 from datetime import datetime, timedelta
 from flask import request, jsonify
 import logging
 
 from services.new_dash_analyzer import NewDashAnalyzer
+from services.dash_sql_aggregator import DashSQLAggregator
 from services.ai_sentiment_analyzer import AISentimentAnalyzer
 from services.etl_processor import ETLProcessor
 from services.batch_ai_analyzer import BatchAIAnalyzer
@@ -23,6 +25,9 @@ class AnalysisController:
     
     def __init__(self):
         self.analyzer = NewDashAnalyzer()  # 使用新的基于DWD_AI的分析器
+        self.sql_aggregator = DashSQLAggregator()  # 数据库端聚合分析器
+        # 分析模式：sql（数据库端GROUP BY聚合，默认）/ dataframe（拉取明细后在pandas中统计）
+        self.aggregation_mode = os.getenv('ANALYSIS_AGGREGATION_MODE', 'sql').strip().lower()
         self.ai_analyzer = AISentimentAnalyzer()
         self.etl_processor = ETLProcessor()  # ETL处理器
         self.batch_ai_analyzer = BatchAIAnalyzer()  # 批量AI分析器
@@ -56,9 +61,10 @@ class AnalysisController:
             platforms = data.get('platforms', [])
             analysis_types = data.get('analysis_types', ['brand_mentions', 'sentiment', 'bad_cases'])
             hourly_analysis_dates = data.get('hourly_analysis_dates', [])
+            use_sql_aggregation = str(data.get('aggregation_mode') or self.aggregation_mode).lower() == 'sql'
             
-            # 参数验证
-            if not keywords or len(keywords) == 0:
+            # 参数验证（SQL聚合模式下允许不带关键词，按时间和渠道分析全部评论）
+            if (not keywords or len(keywords) == 0) and not use_sql_aggregation:
                 return jsonify({
                     'success': False,
                     'error': '参数错误',
@@ -72,10 +78,25 @@ class AnalysisController:
             
             logger.info(f"开始分析: keywords={keywords}, date_range={start_date} to {end_date}")
             
-            # 查询数据
-            df = self.analyzer.query_data(keywords, start_date, end_date, platforms)
+            # 查询数据（SQL聚合模式只统计条数，明细统计下推到数据库）
+            df = None
+            query_filter = None
+            rollup_filter = None
+            if use_sql_aggregation:
+                query_filter = self.sql_aggregator.build_filter(keywords, start_date, end_date, platforms)
+                # 没有关键词过滤时，趋势/渠道/小时图表直接读取小时级汇总表
+                total_records = None
+                if not keywords:
+                    rollup_filter = self.sql_aggregator.build_rollup_filter(start_date, end_date, platforms)
+                    # 汇总表一致时直接用汇总表的评论数，避免每次请求统计明细表
+                    total_records = self.sql_aggregator.count_rollup_records(rollup_filter)
+                if total_records is None:
+                    total_records = self.sql_aggregator.count_records(query_filter)
+            else:
+                df = self.analyzer.query_data(keywords, start_date, end_date, platforms)
+                total_records = len(df)
             
-            if df.empty:
+            if total_records == 0:
                 # 即使没有数据，也要返回各分析类型的空结果结构
                 empty_results = {}
                 
@@ -145,7 +166,10 @@ class AnalysisController:
             # 1. Brand Mention 分析
             if 'brand_mentions' in analysis_types:
                 try:
-                    brand_results = self.analyzer.analyze_brand_mentions(df, keywords)
+                    if use_sql_aggregation:
+                        brand_results = self.sql_aggregator.analyze_brand_mentions(query_filter, keywords)
+                    else:
+                        brand_results = self.analyzer.analyze_brand_mentions(df, keywords)
                     analysis_results['brand_mentions'] = brand_results
                 except Exception as e:
                     logger.error(f"品牌提及分析失败: {e}")
@@ -155,7 +179,12 @@ class AnalysisController:
             if 'sentiment' in analysis_types:
                 try:
                     # 基础情感分析
-                    sentiment_results = self.analyzer.analyze_sentiment_details(df, hourly_analysis_dates)
+                    if use_sql_aggregation:
+                        sentiment_results = self.sql_aggregator.analyze_sentiment_details(
+                            query_filter, hourly_analysis_dates, rollup_filter
+                        )
+                    else:
+                        sentiment_results = self.analyzer.analyze_sentiment_details(df, hourly_analysis_dates)
                     
                     # 启用AI增强分析，生成AI总结
                     ai_available = self.ai_analyzer.is_available()
@@ -164,9 +193,14 @@ class AnalysisController:
                         logger.info("开始AI增强情感分析")
                         
                         # 准备样本评论用于AI总结
-                        positive_samples = df[df['sentiment'] == 'positive']['text'].head(5).tolist()
-                        negative_samples = df[df['sentiment'] == 'negative']['text'].head(5).tolist()
-                        neutral_samples = df[df['sentiment'] == 'neutral']['text'].head(3).tolist()
+                        if use_sql_aggregation:
+                            positive_samples = self.sql_aggregator.fetch_sample_texts(query_filter, 'sentiment', 'positive', 5)
+                            negative_samples = self.sql_aggregator.fetch_sample_texts(query_filter, 'sentiment', 'negative', 5)
+                            neutral_samples = self.sql_aggregator.fetch_sample_texts(query_filter, 'sentiment', 'neutral', 3)
+                        else:
+                            positive_samples = df[df['sentiment'] == 'positive']['text'].head(5).tolist()
+                            negative_samples = df[df['sentiment'] == 'negative']['text'].head(5).tolist()
+                            neutral_samples = df[df['sentiment'] == 'neutral']['text'].head(3).tolist()
                         
                         sample_comments = {
                             'positive': positive_samples,
@@ -213,7 +247,10 @@ class AnalysisController:
             # 3. Bad Case 分析
             if 'bad_cases' in analysis_types:
                 try:
-                    bad_case_results = self.analyzer.analyze_bad_cases(df)
+                    if use_sql_aggregation:
+                        bad_case_results = self.sql_aggregator.analyze_bad_cases(query_filter)
+                    else:
+                        bad_case_results = self.analyzer.analyze_bad_cases(df)
                     analysis_results['bad_cases'] = bad_case_results
                 except Exception as e:
                     logger.error(f"特殊情况分析失败: {e}")
@@ -226,13 +263,14 @@ class AnalysisController:
                 'end_date': end_date,
                 'platforms': platforms,
                 'analysis_types': analysis_types,
-                'total_records': len(df),
+                'total_records': total_records,
+                'aggregation_mode': 'sql' if use_sql_aggregation else 'dataframe',
                 'query_time': datetime.now().isoformat()
             }
             
             return jsonify({
                 'success': True,
-                'message': f'分析完成，共分析了 {len(df)} 条数据',
+                'message': f'分析完成，共分析了 {total_records} 条数据',
                 'query_info': query_info,
                 'data': analysis_results
             }), 200
@@ -276,16 +314,7 @@ class AnalysisController:
             # ========== 阶段2: AI情感分析 ==========
             logger.info("步骤2: 开始AI情感分析...")
             
-            # 重置可能卡住的processing状态
-            reset_sql = """
-                UPDATE dwd_dash_social_comments 
-                SET ai_processing_status = 'pending'
-                WHERE ai_processing_status = 'processing'
-            """
-            reset_count = self.db_config.execute_insert(reset_sql)
-            logger.info(f"重置了 {reset_count} 条processing状态的记录为pending")
-            
-            # 分批次处理AI情感分析
+            # 分批次处理AI情感分析（卡住的processing记录租约过期后会被重新认领，无需在此重置）
             ai_results = []
             batch_size = 50
             batch_number = 1
@@ -309,7 +338,7 @@ class AnalysisController:
             logger.info("步骤3: 开始极端负面分析...")
             
             # 首先处理非负面评论（直接设置为completed）
-            non_negative_result = self.extreme_analyzer.process_non_negative_records(batch_size=100)
+            non_negative_result = self.extreme_analyzer.process_non_negative_records()
             logger.info(f"非负面评论处理完成: {non_negative_result.get('message', '')}")
             
             # 重置可能卡住的processing状态
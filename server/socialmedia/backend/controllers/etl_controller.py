@@ -9,14 +9,22 @@ from flask import jsonify, request
 from typing import Dict, Any
 
 from services.etl_processor import ETLProcessor
+from services.job_queue import get_job_queue
 
 logger = logging.getLogger(__name__)
 
 class ETLController:
     """ETL控制器"""
     
+    # 分区并行回填任务类型
+    PARTITIONED_BACKFILL_JOB = 'ods_to_dwd_partitioned'
+    
     def __init__(self):
         self.etl_processor = ETLProcessor()
+        self.job_queue = get_job_queue()
+        if self.job_queue is not None:
+            self.job_queue.register_handler(self.PARTITIONED_BACKFILL_JOB, self._run_partitioned_backfill_job)
+            self.job_queue.start()
     
     def process_ods_to_dwd(self) -> Dict[str, Any]:
         """ODS到DWD处理API"""
@@ -24,6 +32,7 @@ class ETLController:
             # 获取请求参数
             batch_size = request.json.get('batch_size', 1000) if request.json else 1000
             force_reprocess = request.json.get('force_reprocess', False) if request.json else False
+            incremental = request.json.get('incremental') if request.json else None
             
             # 参数验证
             if not isinstance(batch_size, int) or batch_size <= 0:
@@ -41,7 +50,7 @@ class ETLController:
                 }
             
             # 执行处理
-            result = self.etl_processor.process_ods_to_dwd(batch_size, force_reprocess)
+            result = self.etl_processor.process_ods_to_dwd(batch_size, force_reprocess, incremental)
             
             return {
                 'success': True,
@@ -58,6 +67,110 @@ class ETLController:
                 'data': None
             }
     
+    def process_ods_to_dwd_partitioned(self) -> Dict[str, Any]:
+        """ODS到DWD分区并行处理API（历史数据回填，提交为后台任务，返回任务ID）"""
+        try:
+            # 获取请求参数
+            start_date = request.json.get('start_date') if request.json else None
+            end_date = request.json.get('end_date') if request.json else None
+            workers = request.json.get('workers') if request.json else None
+            partition_days = request.json.get('partition_days', 1) if request.json else 1
+            
+            # 参数验证
+            if workers is not None and (not isinstance(workers, int) or not 1 <= workers <= 32):
+                return {
+                    'success': False,
+                    'error': '进程数必须是1到32之间的整数',
+                    'data': None
+                }
+            
+            if not isinstance(partition_days, int) or not 1 <= partition_days <= 31:
+                return {
+                    'success': False,
+                    'error': '分区天数必须是1到31之间的整数',
+                    'data': None
+                }
+            
+            if self.job_queue is None:
+                return {
+                    'success': False,
+                    'error': '任务队列未启用，无法提交分区并行回填任务',
+                    'data': None
+                }
+            
+            # 提交后台任务（多进程回填可能持续较长时间，不在请求内执行）
+            job_id = self.job_queue.enqueue(
+                self.PARTITIONED_BACKFILL_JOB,
+                payload={
+                    'start_date': start_date,
+                    'end_date': end_date,
+                    'workers': workers,
+                    'partition_days': partition_days
+                }
+            )
+            
+            return {
+                'success': True,
+                'message': 'ODS分区并行处理任务已提交',
+                'data': {
+                    'job_id': job_id,
+                    'status': 'queued'
+                }
+            }
+            
+        except Exception as e:
+            error_msg = f"ODS分区并行处理失败：{str(e)}"
+            logger.error(error_msg)
+            return {
+                'success': False,
+                'error': error_msg,
+                'data': None
+            }
+    
+    def _run_partitioned_backfill_job(self, job, report_progress):
+        """分区并行回填任务（在后台工作线程中执行），每完成一个分区上报进度并续约"""
+        payload = job.get('payload', {})
+        report_progress('partitioned_backfill', 'running')
+        
+        def on_partition_done(completed, total):
+            report_progress('partitioned_backfill', 'running', completed_partitions=completed, total_partitions=total)
+        
+        result = self.etl_processor.process_ods_to_dwd_partitioned(
+            payload.get('start_date'), payload.get('end_date'), payload.get('workers'),
+            payload.get('partition_days', 1), progress_callback=on_partition_done
+        )
+        if result.get('status') == 'failed':
+            report_progress('partitioned_backfill', 'failed', error=result.get('error') or result.get('message'))
+            raise Exception(result.get('error') or result.get('message') or 'ODS分区并行处理失败')
+        
+        report_progress('partitioned_backfill', result.get('status', 'completed'),
+                        success_records=result.get('success_records', 0),
+                        failed_partition_count=result.get('failed_partition_count', 0))
+        return result
+    
+    def get_job(self, job_id: str) -> Dict[str, Any]:
+        """查询后台ETL任务状态API"""
+        if self.job_queue is None:
+            return {
+                'success': False,
+                'error': '任务队列未启用',
+                'data': None
+            }
+        
+        job = self.job_queue.get_job(job_id)
+        if job is None:
+            return {
+                'success': False,
+                'error': f'任务 {job_id} 不存在',
+                'data': None
+            }
+        
+        return {
+            'success': True,
+            'message': '任务状态获取成功',
+            'data': job
+        }
+    
     def process_dwd_to_ai(self) -> Dict[str, Any]:
         """DWD到DWD_AI处理API"""
         try:
@@ -97,11 +210,43 @@ class ETLController:
                 'data': None
             }
     
+    def rebuild_sentiment_rollup(self) -> Dict[str, Any]:
+        """重建小时级情感汇总表API"""
+        try:
+            # 获取请求参数（为空表示全量重建）
+            start_date = request.json.get('start_date') if request.json else None
+            end_date = request.json.get('end_date') if request.json else None
+            
+            result = self.etl_processor.rebuild_sentiment_rollup(start_date, end_date)
+            
+            if result.get('status') != 'completed':
+                return {
+                    'success': False,
+                    'error': result.get('error', '情感汇总表重建失败'),
+                    'data': result
+                }
+            
+            return {
+                'success': True,
+                'message': '情感汇总表重建完成',
+                'data': result
+            }
+            
+        except Exception as e:
+            error_msg = f"情感汇总表重建失败：{str(e)}"
+            logger.error(error_msg)
+            return {
+                'success': False,
+                'error': error_msg,
+                'data': None
+            }
+    
     def run_full_pipeline(self) -> Dict[str, Any]:
         """运行完整ETL流水线API"""
         try:
             # 获取请求参数
             batch_size = request.json.get('batch_size', 1000) if request.json else 1000
+            max_steps = request.json.get('max_steps') if request.json else None
             
             # 参数验证
             if not isinstance(batch_size, int) or batch_size <= 0:
@@ -118,8 +263,15 @@ class ETLController:
                     'data': None
                 }
             
-            # 执行完整流水线
-            result = self.etl_processor.run_full_etl_pipeline(batch_size)
+            if max_steps is not None and (not isinstance(max_steps, int) or not 1 <= max_steps <= 100):
+                return {
+                    'success': False,
+                    'error': '批次数必须是1到100之间的整数',
+                    'data': None
+                }
+            
+            # 执行完整流水线（积压较多时分批执行，has_more 为真时可再次调用继续处理）
+            result = self.etl_processor.run_full_etl_pipeline(batch_size, max_steps)
             
             return {
                 'success': True,
@@ -14,6 +14,8 @@ import logging
 from services.simple_file_processor import SimpleFileProcessor
 from services.etl_processor import ETLProcessor
 from services.batch_ai_analyzer import BatchAIAnalyzer
+from services.batch_extreme_negative_analyzer import BatchExtremeNegativeAnalyzer
+from services.job_queue import get_job_queue
 from config.database_config import get_db_config
 
 logger = logging.getLogger(__name__)
@@ -21,16 +23,31 @@ logger = logging.getLogger(__name__)
 class UploadController:
     """文件上传控制器 - 支持多用户并发上传"""
     
-    # 类级别的进度跟踪，按用户隔离
-    _processing_status = {}  # {user_id: {batch_id: {'status': 'processing', 'step': 'upload/etl/ai', 'timestamp': datetime}}}
+    # 上传后处理任务类型
+    POST_UPLOAD_JOB = 'post_upload'
+    # 上传后处理每个阶段最多循环的批次数（防止无限循环）
+    POST_UPLOAD_MAX_BATCHES = 20
+    # 达到批次上限仍有待处理数据时，最多追加提交的后续任务数
+    POST_UPLOAD_MAX_CONTINUATIONS = int(os.getenv('POST_UPLOAD_MAX_CONTINUATIONS', 50))
+    
+    # 类级别的上传进度跟踪（仅用于请求内的ODS导入冲突检测），按用户隔离
+    _processing_status = {}  # {user_id: {batch_id: {'status': 'processing', 'step': 'upload', 'timestamp': datetime}}}
     
     def __init__(self):
         self.file_processor = SimpleFileProcessor()
         self.etl_processor = ETLProcessor()
         self.ai_analyzer = BatchAIAnalyzer()
+        self.extreme_analyzer = BatchExtremeNegativeAnalyzer()
         self.db_config = get_db_config()
         self.allowed_extensions = {'xlsx', 'xls', 'csv'}
         
+        # 上传成功后是否自动提交后台处理任务（ETL + AI分析）
+        self.auto_process_enabled = os.getenv('UPLOAD_AUTO_PROCESS', 'true').strip().lower() not in ('0', 'false', 'no', 'off')
+        self.job_queue = get_job_queue()
+        if self.job_queue is not None:
+            self.job_queue.register_handler(self.POST_UPLOAD_JOB, self._run_post_upload_job)
+            self.job_queue.start()
+        
     def _allowed_file(self, filename: str) -> bool:
         """检查文件扩展名是否允许"""
         return '.' in filename and \
@@ -115,6 +132,27 @@ class UploadController:
         """获取所有处理状态（调试接口）"""
         return cls._processing_status
     
+    def get_active_jobs(self, limit: int = 50):
+        """获取排队中和运行中的后台任务（调试接口）"""
+        if self.job_queue is None:
+            return []
+        return self.job_queue.list_jobs(statuses=self.job_queue.ACTIVE_STATUSES, limit=limit)
+    
+    def _enqueue_post_upload_job(self, batch_id: str, user_id: str, upload_success_rows: int, continuation: int = 0):
+        """提交上传后处理任务，返回任务ID（未启用任务队列时返回None）"""
+        if self.job_queue is None or not self.auto_process_enabled or upload_success_rows <= 0:
+            return None
+        try:
+            return self.job_queue.enqueue(
+                self.POST_UPLOAD_JOB,
+                payload={'upload_success_rows': upload_success_rows, 'continuation': continuation},
+                batch_id=batch_id,
+                user_id=user_id
+            )
+        except Exception as e:
+            logger.error(f"提交上传后处理任务失败: {e}")
+            return None
+    
     def handle_upload(self, request):
         """
         处理文件上传请求（支持多用户并发）
@@ -216,7 +254,10 @@ class UploadController:
                 logger.info(f"文件上传到ODS成功: {result['batch_id']}")
                 logger.info(f"处理结果: 原始行数={result.get('original_rows', 0)}, 成功行数={result.get('success_rows', 0)}, 错误行数={result.get('error_rows', 0)}")
                 
-                # 构建响应数据（只包含上传结果）
+                # 提交后台处理任务（ETL + AI分析），请求立即返回
+                job_id = self._enqueue_post_upload_job(result['batch_id'], user_id, result.get('success_rows', 0))
+                
+                # 构建响应数据（只包含上传结果和后台任务ID）
                 response_data = {
                     'batch_id': result['batch_id'],
                     'filename': result['filename'],
@@ -226,29 +267,39 @@ class UploadController:
                     'duplicate_rows': result['duplicate_rows'],
                     'error_rows': result['error_rows'],
                     'upload_time': datetime.now().isoformat(),
+                    'job_id': job_id,
                     'processing_status': {
                         'ods_upload': 'completed',
-                        'etl_processing': 'not_started',
-                        'ai_analysis': 'not_started'
+                        'etl_processing': 'queued' if job_id else 'not_started',
+                        'ai_analysis': 'queued' if job_id else 'not_started'
                     }
                 }
                 
                 # 处理完成，清除状态
                 self._clear_processing_status(user_id, batch_id)
                 
+                if job_id:
+                    next_step = {
+                        'action': 'poll_status',
+                        'status_url': f"/api/upload/status/{result['batch_id']}",
+                        'description': '数据去重和AI分析已在后台排队处理，可通过状态接口查看进度'
+                    }
+                else:
+                    next_step = {
+                        'action': 'start_analysis',
+                        'description': '点击"开始分析"按钮进行数据去重和AI分析'
+                    }
+                
                 return jsonify({
                     'success': True,
-                    'message': '文件上传成功，可以开始分析处理',
+                    'message': '文件上传成功，已提交后台分析处理' if job_id else '文件上传成功，可以开始分析处理',
                     'data': response_data,
                     'summary': {
                         'success_count': result['success_rows'],
                         'duplicate_count': result['duplicate_rows'],
                         'error_count': result['error_rows']
                     },
-                    'next_step': {
-                        'action': 'start_analysis',
-                        'description': '点击"开始分析"按钮进行数据去重和AI分析'
-                    }
+                    'next_step': next_step
                 }), 200
             else:
                 # 如果处理失败，清除状态并删除已上传的文件
@@ -337,11 +388,8 @@ class UploadController:
             JSON响应
         """
         try:
-            # 查询上传历史 - 使用database_config的get_connection方法
-            connection = None
+            # 查询上传历史 - 从连接池借用连接，用完自动归还
             try:
-                connection = self.db_config.get_connection()
-                
                 sql = """
                     SELECT id, filename, file_size, original_rows, processed_rows, 
                            success_rows, error_rows, upload_time, process_start_time,
@@ -351,9 +399,10 @@ class UploadController:
                     LIMIT %s
                 """
                 
-                with connection.cursor() as cursor:
-                    cursor.execute(sql, (limit,))
-                    result = cursor.fetchall()
+                with self.db_config.pooled_connection() as connection:
+                    with connection.cursor() as cursor:
+                        cursor.execute(sql, (limit,))
+                        result = cursor.fetchall()
                     
             except Exception as db_error:
                 logger.error(f"数据库连接或查询失败: {db_error}")
@@ -362,13 +411,6 @@ class UploadController:
                     'error': '数据库连接失败',
                     'message': f'无法连接到数据库: {str(db_error)}'
                 }), 500
-            finally:
-                # 安全关闭连接
-                if connection:
-                    try:
-                        connection.close()
-                    except Exception as close_error:
-                        logger.warning(f"关闭数据库连接时出错: {close_error}")
             
             # 处理DataFrame或字典列表
             if result is None:
@@ -508,95 +550,128 @@ class UploadController:
                 'message': str(e)
             }), 500
     
-    def _trigger_post_upload_processing(self, upload_success_rows: int):
+    def _run_post_upload_job(self, job, report_progress):
         """
-        触发上传后的处理流程：ETL处理 + AI分析
+        上传后处理任务（在后台工作线程中执行）：
+        1. ETL去重（ODS → DWD）
+        2. AI情感分析
+        3. 极端负面分析
+        4. 同步到DWD_AI表
+        
+        任一阶段失败时抛出异常（任务标记为失败）；某阶段达到 POST_UPLOAD_MAX_BATCHES 仍有待处理数据时，
+        该阶段标记为 partial，并提交后续任务继续处理
         
         Args:
-            upload_success_rows: 上传成功的行数
+            job: 任务信息
+            report_progress: 阶段进度回调 report_progress(stage, status, **details)
             
         Returns:
-            处理结果状态字典
+            各阶段处理结果汇总
         """
-        processing_results = {
-            'etl_processing': 'failed',
-            'ai_analysis': 'failed',
-            'etl_details': {},
-            'ai_details': {}
-        }
+        payload = job.get('payload', {})
+        upload_success_rows = int(payload.get('upload_success_rows', 0))
+        continuation = int(payload.get('continuation', 0))
+        partial_stages = []
         
-        try:
-            # 1. 执行ETL处理（ODS → DWD → DWD_AI数据同步）
-            logger.info("开始执行ETL处理...")
-            
-            # 更新状态为ETL处理中（注意：这个方法需要user_id参数）
-            batch_id = f"etl_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            # 这里暂时使用系统用户ID，实际应该传入具体用户ID
-            system_user_id = "system_etl"
-            self._update_processing_status(system_user_id, batch_id, 'processing', 'etl')
-            
-            # 根据上传数据量调整批处理大小
-            etl_batch_size = min(max(upload_success_rows, 100), 2000)
-            
-            etl_result = self.etl_processor.run_full_etl_pipeline(batch_size=etl_batch_size)
-            
-            if etl_result.get('pipeline_status') == 'completed':
-                processing_results['etl_processing'] = 'completed'
-                processing_results['etl_details'] = {
-                    'dwd_new_records': etl_result.get('ods_to_dwd_success', 0),
-                    'ai_sync_records': etl_result.get('dwd_to_ai_success', 0),
-                    'total_failed': etl_result.get('total_failed_records', 0),
-                    'message': etl_result.get('message', 'ETL处理完成')
-                }
-                logger.info(f"ETL处理成功: {etl_result.get('message')}")
-                
-                # 2. 执行AI分析（如果ETL成功）
-                logger.info("开始执行AI分析...")
-                
-                # 更新状态为AI分析中
-                self._update_processing_status(system_user_id, batch_id, 'processing', 'ai')
-                
-                # 根据处理成功的数据量调整AI批处理大小
-                ai_batch_size = min(max(etl_result.get('dwd_to_ai_success', 0), 50), 500)
-                
-                if ai_batch_size > 0:
-                    ai_result = self.ai_analyzer.process_pending_ai_analysis(batch_size=ai_batch_size)
-                    
-                    if ai_result.get('status') in ['completed', 'partial']:
-                        processing_results['ai_analysis'] = ai_result.get('status')
-                        processing_results['ai_details'] = {
-                            'success_records': ai_result.get('success_records', 0),
-                            'failed_records': ai_result.get('failed_records', 0),
-                            'ai_service_available': ai_result.get('ai_service_available', False),
-                            'message': ai_result.get('message', 'AI分析完成')
-                        }
-                        logger.info(f"AI分析完成: {ai_result.get('message')}")
-                    else:
-                        processing_results['ai_details'] = {
-                            'error': ai_result.get('error', '未知错误'),
-                            'ai_service_available': ai_result.get('ai_service_available', False)
-                        }
-                        logger.warning(f"AI分析失败: {ai_result.get('error')}")
-                else:
-                    processing_results['ai_analysis'] = 'skipped'
-                    processing_results['ai_details'] = {'message': '没有数据需要AI分析'}
-            else:
-                processing_results['etl_details'] = {
-                    'error': etl_result.get('error', '未知错误'),
-                    'steps': etl_result.get('steps', [])
-                }
-                logger.error(f"ETL处理失败: {etl_result.get('error')}")
-                
-        except Exception as e:
-            logger.error(f"后续处理流程异常: {e}")
-            processing_results['etl_details']['error'] = f'处理异常: {str(e)}'
-            processing_results['ai_details']['error'] = '由于ETL失败，跳过AI分析'
-        finally:
-            # 无论成功失败，都清除处理状态
-            if 'batch_id' in locals():
-                self._clear_processing_status(system_user_id, batch_id)
+        # 1. ETL处理（ODS → DWD），根据上传数据量调整批处理大小
+        report_progress('etl', 'running')
+        etl_batch_size = min(max(upload_success_rows, 100), 2000)
+        etl_success = 0
+        for batch_number in range(1, self.POST_UPLOAD_MAX_BATCHES + 1):
+            etl_result = self.etl_processor.process_ods_to_dwd(batch_size=etl_batch_size)
+            if etl_result.get('status') not in ['completed', 'partial']:
+                report_progress('etl', 'failed', error=etl_result.get('error', 'ETL处理失败'))
+                raise Exception(etl_result.get('error', 'ETL处理失败'))
+            
+            etl_success += etl_result.get('success_records', 0)
+            report_progress('etl', 'running', batches=batch_number, success_records=etl_success)
+            if not etl_result.get('has_more', False):
+                report_progress('etl', 'completed', success_records=etl_success)
+                break
+        else:
+            partial_stages.append('etl')
+            report_progress('etl', 'partial', success_records=etl_success)
+        
+        # 2. AI情感分析（AI服务不可用或处理异常时带 error 返回，不能当作"没有待处理记录"；
+        #    整批记录都分析失败时 status 同样为 failed，但只计入 failed_records，由认领次数上限控制重试）
+        report_progress('ai', 'running')
+        ai_success = 0
+        ai_failed = 0
+        for batch_number in range(1, self.POST_UPLOAD_MAX_BATCHES + 1):
+            ai_result = self.ai_analyzer.process_pending_ai_analysis(batch_size=100)
+            if ai_result.get('status') == 'failed' and ai_result.get('error'):
+                error = ai_result.get('error') or ai_result.get('message') or 'AI情感分析失败'
+                report_progress('ai', 'failed', error=error)
+                raise Exception(error)
+            if ai_result.get('total_records', 0) == 0:
+                report_progress('ai', 'completed', success_records=ai_success, failed_records=ai_failed)
+                break
+            ai_success += ai_result.get('success_records', 0)
+            ai_failed += ai_result.get('failed_records', 0)
+            report_progress('ai', 'running', batches=batch_number, success_records=ai_success, failed_records=ai_failed)
+        else:
+            partial_stages.append('ai')
+            report_progress('ai', 'partial', success_records=ai_success, failed_records=ai_failed)
+        
+        # 3. 极端负面分析（非负面评论直接标记完成）
+        report_progress('extreme_negative', 'running')
+        self.extreme_analyzer.process_non_negative_records()
+        extreme_success = 0
+        extreme_failed = 0
+        for batch_number in range(1, self.POST_UPLOAD_MAX_BATCHES + 1):
+            extreme_result = self.extreme_analyzer.process_pending_extreme_analysis(batch_size=50)
+            if extreme_result.get('status') == 'failed' and extreme_result.get('error'):
+                error = extreme_result.get('error') or extreme_result.get('message') or '极端负面分析失败'
+                report_progress('extreme_negative', 'failed', error=error)
+                raise Exception(error)
+            if extreme_result.get('total_records', 0) == 0:
+                report_progress('extreme_negative', 'completed',
+                                success_records=extreme_success, failed_records=extreme_failed)
+                break
+            extreme_success += extreme_result.get('success_records', 0)
+            extreme_failed += extreme_result.get('failed_records', 0)
+            report_progress('extreme_negative', 'running', batches=batch_number,
+                            success_records=extreme_success, failed_records=extreme_failed)
+        else:
+            partial_stages.append('extreme_negative')
+            report_progress('extreme_negative', 'partial', success_records=extreme_success, failed_records=extreme_failed)
+        
+        # 4. 同步到DWD_AI表
+        report_progress('dwd_ai_sync', 'running')
+        sync_success = 0
+        for batch_number in range(1, self.POST_UPLOAD_MAX_BATCHES + 1):
+            sync_result = self.etl_processor.process_dwd_to_ai(batch_size=500)
+            if sync_result.get('status') == 'failed':
+                report_progress('dwd_ai_sync', 'failed', error=sync_result.get('error'))
+                raise Exception(sync_result.get('error', 'DWD_AI同步失败'))
+            sync_success += sync_result.get('success_records', 0)
+            report_progress('dwd_ai_sync', 'running', batches=batch_number, success_records=sync_success)
+            if sync_result.get('total_source_records', 0) < 500:
+                report_progress('dwd_ai_sync', 'completed', success_records=sync_success)
+                break
+        else:
+            partial_stages.append('dwd_ai_sync')
+            report_progress('dwd_ai_sync', 'partial', success_records=sync_success)
+        
+        # 有阶段达到批次上限：提交后续任务继续处理剩余数据
+        follow_up_job_id = None
+        if partial_stages:
+            if continuation < self.POST_UPLOAD_MAX_CONTINUATIONS:
+                follow_up_job_id = self._enqueue_post_upload_job(
+                    job.get('batch_id'), job.get('user_id'), upload_success_rows, continuation=continuation + 1
+                )
+            logger.warning(f"上传后处理达到批次上限，未完成阶段: {partial_stages}，后续任务: {follow_up_job_id}")
         
-        return processing_results
+        return {
+            'etl_success_count': etl_success,
+            'ai_success_count': ai_success,
+            'ai_failed_count': ai_failed,
+            'extreme_success_count': extreme_success,
+            'extreme_failed_count': extreme_failed,
+            'sync_success_count': sync_success,
+            'partial_stages': partial_stages,
+            'follow_up_job_id': follow_up_job_id
+        }
     
     def get_processing_status(self, batch_id: str):
         """
@@ -660,6 +735,14 @@ class UploadController:
                 logger.warning(f"AI状态查询失败: {ai_error}")
                 ai_status_stats = {}
             
+            # 查询后台处理任务状态
+            job = None
+            if self.job_queue is not None:
+                try:
+                    job = self.job_queue.get_latest_job_for_batch(batch_id)
+                except Exception as job_error:
+                    logger.warning(f"任务状态查询失败: {job_error}")
+            
             logger.info(f"开始计算详细状态: upload_info={upload_info}")
             logger.info(f"ETL结果: {etl_result}")
             logger.info(f"AI统计: {ai_status_stats}")
@@ -687,7 +770,19 @@ class UploadController:
                         } for row in etl_result
                     ] if etl_result else [],
                     'ai_status_stats': ai_status_stats,
-                    'overall_status': self._calculate_overall_status(upload_info, etl_result, ai_status_stats)
+                    'job': {
+                        'job_id': job['job_id'],
+                        'status': job['status'],
+                        'current_stage': job['current_stage'],
+                        'stages': job['progress'],
+                        'attempts': job['attempts'],
+                        'error_message': job['error_message'],
+                        'created_at': job['created_at'],
+                        'started_at': job['started_at'],
+                        'finished_at': job['finished_at'],
+                        'result': job['result']
+                    } if job else None,
+                    'overall_status': self._calculate_overall_status(upload_info, etl_result, ai_status_stats, job)
                 }
             }), 200
             
@@ -703,11 +798,23 @@ class UploadController:
                 'message': str(e)
             }), 500
     
-    def _calculate_overall_status(self, upload_info, etl_result, ai_status_stats):
-        """计算整体处理状态"""
+    def _calculate_overall_status(self, upload_info, etl_result, ai_status_stats, job=None):
+        """计算整体处理状态（有后台任务时以任务状态为准）"""
         if upload_info.get('status') != 'completed':
             return 'upload_failed'
         
+        if job:
+            if job['status'] == 'queued':
+                return 'queued'
+            if job['status'] == 'running':
+                return f"{job['current_stage'] or 'etl'}_processing"
+            if job['status'] == 'failed':
+                return 'processing_failed'
+            if (job.get('result') or {}).get('partial_stages'):
+                # 达到批次上限且未能提交后续任务，仍有数据待处理
+                return 'partially_completed'
+            return 'fully_completed'
+        
         if not etl_result:
             return 'etl_pending'
         
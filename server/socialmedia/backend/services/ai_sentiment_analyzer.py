@@ -12,6 +12,11 @@ import pandas as pd
 from openai import OpenAI
 from dotenv import load_dotenv
 
+from services.rate_limiter import get_openai_rate_limiter, estimate_tokens
+from services.sentiment_cache import get_sentiment_cache
+from services.sentiment_prescreen import get_sentiment_prescreener
+from services.extreme_keyword_matcher import score_extreme_text
+
 # 加载环境变量
 load_dotenv()
 
@@ -23,6 +28,13 @@ class AISentimentAnalyzer:
     _instance = None
     _initialized = False
     
+    # 提示词版本：修改情感/极端负面提示词时需同步升级，使旧缓存失效
+    SENTIMENT_PROMPT_VERSION = 'sentiment_v1'
+    EXTREME_PROMPT_VERSION = 'extreme_v1'
+    
+    # 多条评论合并的提示词中单条评论的最大长度；更长的评论走单条分析，保证按全文判断
+    PACK_TEXT_MAX_CHARS = 200
+    
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(AISentimentAnalyzer, cls).__new__(cls)
@@ -38,11 +50,24 @@ class AISentimentAnalyzer:
         self.max_tokens = int(os.getenv('OPENAI_MAX_TOKENS', 2000))
         self.temperature = float(os.getenv('OPENAI_TEMPERATURE', 0.3))
         
+        # 进程内共享的RPM/TPM限流器（并发分析时共用同一份配额）
+        self.rate_limiter = get_openai_rate_limiter()
+        
+        # 打包模式：每次请求包含的评论条数（1 表示逐条请求）
+        self.pack_size = max(1, int(os.getenv('AI_SENTIMENT_PACK_SIZE', 10)))
+        
+        # 分析结果缓存（按规范化文本 + 模型 + 提示词版本寻址），未启用时为None
+        self.cache = get_sentiment_cache()
+        
+        # 本地情感预筛（SENTIMENT_PRESCREEN_MODE=off 时为None）
+        self.prescreener = get_sentiment_prescreener()
+        
         if not self.api_key:
             logger.warning("OpenAI API密钥未配置，AI分析功能将不可用")
             self.client = None
         else:
-            self.client = OpenAI(api_key=self.api_key)
+            # 429 由共享限流器按 Retry-After 统一退避重试，关闭SDK内置重试，避免限流信号被SDK吞掉
+            self.client = OpenAI(api_key=self.api_key, max_retries=0)
             logger.info("OpenAI客户端初始化成功")
             
         AISentimentAnalyzer._initialized = True
@@ -51,13 +76,14 @@ class AISentimentAnalyzer:
         """检查AI分析服务是否可用"""
         return self.client is not None
     
-    def analyze_extreme_negative(self, text: str, ai_sentiment: str) -> bool:
+    def analyze_extreme_negative(self, text: str, ai_sentiment: str, rule_based_score: float = None) -> bool:
         """
         检测是否为极端负面评论
         
         Args:
             text: 评论文本
             ai_sentiment: AI情感分析结果
+            rule_based_score: 已批量计算好的规则得分（见 score_extreme_series），为空时逐条计算
             
         Returns:
             是否为极端负面评论
@@ -68,7 +94,8 @@ class AISentimentAnalyzer:
                 return False
             
             # 1. 基础规则检测
-            rule_based_score = self._rule_based_extreme_detection(text)
+            if rule_based_score is None:
+                rule_based_score = self._rule_based_extreme_detection(text)
             
             # 2. AI深度检测（仅对可能的极端负面进行）
             if rule_based_score > 0.3 and self.is_available():  # 阈值过滤
@@ -84,120 +111,9 @@ class AISentimentAnalyzer:
             return False
     
     def _rule_based_extreme_detection(self, text: str) -> float:
-        """基于规则的极端负面检测"""
+        """基于规则的极端负面检测（关键词在导入时编译为组合正则，单次扫描）"""
         try:
-            score = 0.0
-            text_lower = text.lower()
-            
-
-            # 检测多个感叹号/问号
-            exclamation_count = text.count('!') + text.count('?') + text.count('！') + text.count('？')
-            if exclamation_count >= 2:
-                score += 0.1
-                logger.debug(f"检测到多个感叹号/问号: {exclamation_count}个")
-            
-            # 检测侮辱性词汇（中英文）
-            insult_keywords = [
-                # 中文侮辱词汇
-                '垃圾', '傻逼', '坑爹', '骗子', '黑心', '恶心', '坑人', '草', '妈的',
-                '狗屎', '操', '卧槽', '尼玛', '滚', '死', '脑残', '白痴', '弱智', 
-                '蠢货', '废物', '渣渣', '智障', '二逼', '煞笔', '傻叉', '贱', 
-                '低级', '恶劣', '下流', '无耻', '可耻', '丢人', '糟糕', '破烂',
-                '混蛋', '王八蛋', '狗东西', '畜生', '禽兽', '人渣', '败类',
-                '神经病', '有病', '缺德', '恶毒', '阴险', '卑鄙', '龌龊',
-                
-                # 英文侮辱词汇
-                'shit', 'fuck', 'damn', 'stupid', 'idiot', 'garbage', 'trash', 'scam',
-                'asshole', 'bitch', 'bastard', 'crap', 'suck', 'moron', 'jerk',
-                'loser', 'pathetic', 'disgusting', 'awful', 'terrible', 'horrible',
-                'worthless', 'useless', 'ridiculous', 'absurd', 'nonsense', 'bullshit',
-                'dumb', 'retarded', 'crazy', 'insane', 'sick', 'twisted', 'evil'
-            ]
-            for keyword in insult_keywords:
-                if keyword in text_lower:
-                    score += 0.3
-                    logger.debug(f"检测到侮辱性词汇: {keyword}")
-                    break
-            
-            # 检测威胁性语言
-            threat_keywords = [
-                # 中文威胁词汇
-                '投诉', '曝光', '举报', '起诉', '报警', '媒体', '监管', '工商', '法院',
-                '告发', '检举', '揭发', '揭露', '告状', '上诉', '申诉', '控告',
-                '律师', '法律', '诉讼', '赔偿', '维权', '打官司', '法庭', '仲裁',
-                '消费者协会', '消协', '12315', '记者', '新闻', '电视台', '报社',
-                '网络', '微博', '朋友圈', '公开', '公布', '传播', '扩散', '转发',
-                '封杀', '抵制', '黑名单', '拉黑', '删除', '屏蔽', '查封', '关闭',
-                '威胁', '恐吓', '警告', '后果', '严重', '负责', '追究', '惩罚',
-                
-                # 英文威胁词汇
-                'sue', 'lawsuit', 'report', 'expose', 'media', 'police', 'court',
-                'lawyer', 'legal', 'prosecution', 'complain', 'complaint', 'authority',
-                'government', 'department', 'agency', 'investigation', 'expose',
-                'publish', 'broadcast', 'journalist', 'reporter', 'news', 'press',
-                'social media', 'facebook', 'twitter', 'instagram', 'youtube',
-                'boycott', 'blacklist', 'ban', 'block', 'delete', 'remove', 'shut down',
-                'threaten', 'warning', 'consequence', 'serious', 'responsible', 'punishment'
-            ]
-            for keyword in threat_keywords:
-                if keyword in text_lower:
-                    score += 0.3
-                    logger.debug(f"检测到威胁性语言: {keyword}")
-                    break
-            
-            # 检测强烈负面情绪词汇
-            extreme_negative_words = [
-                # 中文极端负面情绪词汇
-                '恶劣', '恶心', '愤怒', '气死', '崩溃', '绝望', '愤慨', '痛恨', '厌恶',
-                '暴怒', '狂怒', '发疯', '抓狂', '疯狂', '失望', '沮丧', '难过',
-                '心碎', '痛苦', '煎熬', '折磨', '受罪', '悲惨', '凄惨', '惨不忍睹',
-                '无语', 'speechless', '震惊', '惊讶', '不敢相信', '无法接受',
-                '后悔', '遗憾', '可惜', '白费', '浪费', '亏', '损失', '倒霉',
-                '糟糕', '糟透', '完蛋', '毁了', '砸了', '废了', '完了', '死定了',
-                '受够了', '忍无可忍', '极限', '爆发', '彻底', '完全', '彻底失望',
-                '心寒', '心凉', '寒心', '心死', '死心', '放弃', '算了', '不要了',
-                
-                # 英文极端负面情绪词汇
-                'terrible', 'horrible', 'awful', 'disgusting', 'furious', 'hate', 'despise',
-                'outrageous', 'unacceptable', 'intolerable', 'unbearable', 'devastating',
-                'shocking', 'appalling', 'disgusting', 'revolting', 'sickening',
-                'frustrated', 'annoyed', 'irritated', 'pissed', 'mad', 'angry', 'rage',
-                'disappointed', 'heartbroken', 'devastated', 'crushed', 'destroyed',
-                'hopeless', 'desperate', 'miserable', 'suffering', 'painful', 'agony',
-                'nightmare', 'disaster', 'catastrophe', 'failure', 'ruined', 'wasted',
-                'regret', 'sorry', 'unfortunate', 'unlucky', 'bad luck', 'curse',
-                'enough', 'fed up', 'sick of', 'tired of', 'done with', 'give up', 'junk'
-            ]
-            extreme_count = sum(1 for word in extreme_negative_words if word in text_lower)
-            if extreme_count >= 1:
-                score += 0.3
-                logger.debug(f"检测到多个极端负面词汇: {extreme_count}个")
-            
-            # 检测服务相关负面词汇
-            service_negative_words = [
-                # 中文服务负面词汇
-                '服务差', '态度差', '不耐烦', '不礼貌', '粗鲁', '傲慢', '冷淡',
-                '不专业', '不负责', '敷衍', '推脱', '踢皮球', '拖延', '效率低',
-                '回复慢', '不回复', '联系不上', '找不到人', '客服差', '售后差',
-                '不解决问题', '解决不了', '处理不当', '态度恶劣', '欺骗客户',
-                '虚假承诺', '说一套做一套', '言而无信', '不守信用', '骗钱',
-                
-                # 英文服务负面词汇
-                'poor service', 'bad service', 'terrible service', 'rude', 'unprofessional',
-                'unhelpful', 'slow response', 'no response', 'ignore', 'dismissive',
-                'arrogant', 'condescending', 'incompetent', 'irresponsible', 'unreliable',
-                'misleading', 'deceptive', 'dishonest', 'fraudulent', 'scam', 'cheat'
-            ]
-            
-            # 统计服务负面词汇
-            service_count = sum(1 for word in service_negative_words if word in text_lower)
-            
-            if service_count >= 1:
-                score += 0.2
-                logger.debug(f"检测到服务相关负面词汇: {service_count}个")
-            
-            return min(score, 1.0)
-            
+            return score_extreme_text(text)
         except Exception as e:
             logger.error(f"规则检测失败: {e}")
             return 0.0
@@ -205,6 +121,10 @@ class AISentimentAnalyzer:
     def _ai_extreme_detection(self, text: str) -> float:
         """AI深度极端负面检测"""
         try:
+            cached = self._get_cached_result(text, self.EXTREME_PROMPT_VERSION)
+            if cached is not None:
+                return float(cached.get('score', 0.0))
+            
             if not self.is_available():
                 return 0.0
             
@@ -221,14 +141,17 @@ class AISentimentAnalyzer:
 只返回0-1的数字分数，不要其他解释。
 """
             
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "你是一个专业的文本情感极端程度评估专家。"},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=10,
-                temperature=0.1
+            response = self.rate_limiter.call(
+                lambda: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": "你是一个专业的文本情感极端程度评估专家。"},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=10,
+                    temperature=0.1
+                ),
+                tokens=estimate_tokens(prompt) + 10
             )
             
             score_text = response.choices[0].message.content.strip()
@@ -236,7 +159,9 @@ class AISentimentAnalyzer:
             # 尝试解析分数
             try:
                 score = float(score_text)
-                return max(0.0, min(1.0, score))  # 确保在0-1范围内
+                score = max(0.0, min(1.0, score))  # 确保在0-1范围内
+                self._set_cached_result(text, self.EXTREME_PROMPT_VERSION, {'score': score})
+                return score
             except ValueError:
                 logger.warning(f"AI返回的分数格式不正确: {score_text}")
                 return 0.0
@@ -245,12 +170,13 @@ class AISentimentAnalyzer:
             logger.error(f"AI极端负面检测失败: {e}")
             return 0.0
     
-    def analyze_single_text(self, text: str) -> Dict[str, Any]:
+    def analyze_single_text(self, text: str, prescreen: bool = True) -> Dict[str, Any]:
         """
         单条文本情感分析
         
         Args:
             text: 待分析的文本
+            prescreen: 是否先经过本地预筛（打包分析重新分析的条目已预筛过，传False）
             
         Returns:
             分析结果字典
@@ -270,6 +196,15 @@ class AISentimentAnalyzer:
                 'error': '文本为空'
             }
         
+        cached = self._get_cached_result(text, self.SENTIMENT_PROMPT_VERSION)
+        if cached is not None:
+            return {**cached, 'error': None}
+        
+        # 本地预筛置信度足够时不调用OpenAI（预筛结果不写入缓存）
+        prediction = self.prescreener.predict(text) if prescreen and self.prescreener else None
+        if prediction and self.prescreener.should_skip(prediction):
+            return self.prescreener.to_result(prediction)
+        
         try:
             prompt = f"""
 请分析以下文本的情感倾向，只返回JSON格式的结果：
@@ -291,14 +226,17 @@ class AISentimentAnalyzer:
 confidence表示分析的置信度，范围0.0-1.0。
 """
 
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "你是一个专业的情感分析助手，请仅返回JSON格式的分析结果。"},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=200,
-                temperature=self.temperature
+            response = self.rate_limiter.call(
+                lambda: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": "你是一个专业的情感分析助手，请仅返回JSON格式的分析结果。"},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=200,
+                    temperature=self.temperature
+                ),
+                tokens=estimate_tokens(prompt) + 200
             )
             
             result_text = response.choices[0].message.content.strip()
@@ -322,12 +260,16 @@ confidence表示分析的置信度，范围0.0-1.0。
                 confidence = float(result.get('confidence', 0.0))
                 confidence = max(0.0, min(1.0, confidence))  # 确保在0-1范围内
                 
-                return {
+                analysis = {
                     'sentiment': sentiment,
                     'confidence': confidence,
-                    'reasoning': result.get('reasoning', ''),
-                    'error': None
+                    'reasoning': result.get('reasoning', '')
                 }
+                self._set_cached_result(text, self.SENTIMENT_PROMPT_VERSION, analysis)
+                if prediction:
+                    self.prescreener.record_comparison(prediction, sentiment)
+                
+                return {**analysis, 'error': None}
                 
             except json.JSONDecodeError:
                 logger.error(f"无法解析AI响应: {result_text}")
@@ -367,10 +309,6 @@ confidence表示分析的置信度，范围0.0-1.0。
             logger.info(f"处理第 {i+1}/{len(texts)} 条文本")
             result = self.analyze_single_text(text)
             results.append(result)
-            
-            # 简单的API限流，避免过快调用
-            import time
-            time.sleep(0.5)  # 每次调用间隔0.5秒
         
         return results
     
@@ -413,28 +351,27 @@ confidence表示分析的置信度，范围0.0-1.0。
             'failed': 0
         }
         
-        for i, text in enumerate(texts):
-            if i % 10 == 0:  # 每10条输出一次进度
-                logger.info(f"AI分析进度: {i+1}/{len(texts)}")
-                print(f"🔄 AI分析进度: {i+1}/{len(texts)}")
+        pack_size = self.pack_size
+        for start in range(0, len(texts), pack_size):
+            pack = texts[start:start + pack_size]
+            logger.info(f"AI分析进度: {start + 1}/{len(texts)}")
+            print(f"🔄 AI分析进度: {start + 1}/{len(texts)}")
             
-            result = self.analyze_single_text(text)
-            results.append(result)
+            # 打包分析：一次请求分析多条评论，缺失或格式错误的条目单独重试
+            pack_results = self.analyze_texts_packed(pack, pack_size)
+            results.extend(pack_results)
             
             # 统计结果
-            if result.get('error'):
-                stats['failed'] += 1
-            else:
-                stats['success'] += 1
-                sentiment = result.get('sentiment', 'neutral')
-                if sentiment in ['positive', 'negative', 'neutral']:
-                    stats[sentiment] += 1
+            for result in pack_results:
+                if result.get('error'):
+                    stats['failed'] += 1
                 else:
-                    stats['neutral'] += 1
-            
-            # API限流
-            import time
-            time.sleep(0.3)  # 稍微降低间隔时间
+                    stats['success'] += 1
+                    sentiment = result.get('sentiment', 'neutral')
+                    if sentiment in ['positive', 'negative', 'neutral']:
+                        stats[sentiment] += 1
+                    else:
+                        stats['neutral'] += 1
         
         # 输出最终统计
         success_msg = f"🤖 AI情感分析完成: 成功{stats['success']}条，总共{stats['total']}条，其中positive {stats['positive']}条，negative {stats['negative']}条，neutral {stats['neutral']}条"
@@ -452,20 +389,233 @@ confidence表示分析的置信度，范围0.0-1.0。
             'available': True
         }
     
-    def _analyze_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
-        """分析单个批次"""
-        try:
-            # 构建提示词
-            prompt = self._build_sentiment_prompt(texts)
+    def analyze_texts_packed(self, texts: List[str], pack_size: int = None) -> List[Dict[str, Any]]:
+        """
+        打包情感分析：每次请求包含最多 pack_size 条评论
+        
+        返回的编号会与输入逐一校验，缺失、重复或格式错误的条目单独调用
+        analyze_single_text 重新分析；本地预筛置信度足够的条目不发送给OpenAI；
+        超过 PACK_TEXT_MAX_CHARS 的长评论不参与打包，单独按全文分析
+        
+        Args:
+            texts: 待分析的文本列表
+            pack_size: 每次请求的评论条数，默认读取环境变量 AI_SENTIMENT_PACK_SIZE
             
-            response = self.client.chat.completions.create(
+        Returns:
+            与 texts 一一对应的分析结果列表（格式同 analyze_single_text）
+        """
+        pack_size = max(1, int(pack_size or self.pack_size))
+        results: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+        
+        if not self.is_available():
+            return [{'sentiment': 'neutral', 'confidence': 0.0, 'error': 'OpenAI服务不可用'} for _ in texts]
+        
+        # 空文本直接返回，命中缓存的直接使用缓存结果，预筛置信的直接使用本地结果；相同文本只分析一次
+        pending_groups: Dict[str, List[int]] = {}
+        predictions: Dict[int, Dict[str, Any]] = {}
+        for i, text in enumerate(texts):
+            if not text or len(str(text).strip()) == 0:
+                results[i] = {'sentiment': 'neutral', 'confidence': 0.0, 'error': '文本为空'}
+                continue
+            
+            cached = self._get_cached_result(str(text), self.SENTIMENT_PROMPT_VERSION)
+            if cached is not None:
+                results[i] = {**cached, 'error': None}
+                continue
+            
+            prediction = self.prescreener.predict(str(text)) if self.prescreener else None
+            if prediction and self.prescreener.should_skip(prediction):
+                results[i] = self.prescreener.to_result(prediction)
+                continue
+            
+            group_key = self.cache.normalize_text(text) if self.cache else str(text)
+            if group_key not in pending_groups and prediction:
+                predictions[i] = prediction
+            pending_groups.setdefault(group_key, []).append(i)
+        
+        pending_indexes = []
+        for indexes in pending_groups.values():
+            first_index = indexes[0]
+            if len(str(texts[first_index])) > self.PACK_TEXT_MAX_CHARS:
+                results[first_index] = self.analyze_single_text(str(texts[first_index]), prescreen=False)
+            else:
+                pending_indexes.append(first_index)
+        
+        for start in range(0, len(pending_indexes), pack_size):
+            pack_indexes = pending_indexes[start:start + pack_size]
+            pack_texts = [str(texts[i]) for i in pack_indexes]
+            
+            if len(pack_texts) == 1:
+                results[pack_indexes[0]] = self.analyze_single_text(pack_texts[0], prescreen=False)
+                continue
+            
+            try:
+                pack_results = self._analyze_pack(pack_texts)
+            except Exception as e:
+                # 请求本身失败（限流重试耗尽、超时、服务故障）：整包标记失败，由认领租约稍后重试，
+                # 不逐条重发，避免故障期间把请求数放大 pack_size 倍
+                logger.error(f"打包情感分析请求失败，本包 {len(pack_texts)} 条标记为失败: {e}")
+                for original_index in pack_indexes:
+                    results[original_index] = {'sentiment': 'neutral', 'confidence': 0.0, 'error': f'打包分析请求失败: {e}'}
+                continue
+            
+            # 响应已返回但缺失或格式错误的条目单独重新分析
+            requeued = 0
+            for position, original_index in enumerate(pack_indexes, 1):
+                if position in pack_results:
+                    analysis = pack_results[position]
+                    self._set_cached_result(
+                        pack_texts[position - 1], self.SENTIMENT_PROMPT_VERSION,
+                        {key: value for key, value in analysis.items() if key != 'error'}
+                    )
+                    results[original_index] = analysis
+                else:
+                    requeued += 1
+                    results[original_index] = self.analyze_single_text(pack_texts[position - 1], prescreen=False)
+            
+            if requeued:
+                logger.warning(f"打包分析返回不完整：{len(pack_texts)} 条中 {requeued} 条单独重新分析")
+        
+        # 记录本地预筛与OpenAI标签的一致情况
+        for index, prediction in predictions.items():
+            if not results[index].get('error'):
+                self.prescreener.record_comparison(prediction, results[index].get('sentiment'))
+        
+        # 重复文本复用首条的分析结果
+        for indexes in pending_groups.values():
+            for duplicate_index in indexes[1:]:
+                results[duplicate_index] = dict(results[indexes[0]])
+        
+        return results
+    
+    def _get_cached_result(self, text: str, prompt_version: str) -> Optional[Dict[str, Any]]:
+        """查询分析结果缓存"""
+        if self.cache is None:
+            return None
+        return self.cache.get(text, self.model, prompt_version)
+    
+    def _set_cached_result(self, text: str, prompt_version: str, result: Dict[str, Any]):
+        """写入分析结果缓存（只缓存成功的结果）"""
+        if self.cache is not None:
+            self.cache.set(text, self.model, prompt_version, result)
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取分析结果缓存统计"""
+        if self.cache is None:
+            return {'enabled': False}
+        return self.cache.get_stats()
+    
+    def get_prescreen_stats(self) -> Dict[str, Any]:
+        """获取本地预筛统计（跳过比例、与OpenAI标签的一致率）"""
+        if self.prescreener is None:
+            return {'enabled': False, 'mode': 'off'}
+        return {'enabled': True, **self.prescreener.get_stats()}
+    
+    def _analyze_pack(self, texts: List[str]) -> Dict[int, Dict[str, Any]]:
+        """
+        一次请求分析多条评论
+        
+        Returns:
+            {编号(从1开始): 分析结果}，只包含通过校验的条目（响应无法解析时为空字典）
+            
+        Raises:
+            请求本身失败时抛出原异常，由调用方整包标记失败
+        """
+        prompt = self._build_sentiment_prompt(texts)
+        max_tokens = min(4000, 90 * len(texts) + 100)
+        
+        response = self.rate_limiter.call(
+            lambda: self.client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": "你是一个专业的情感分析专家，擅长分析社交媒体内容的情感倾向。"},
+                    {"role": "system", "content": "你是一个专业的情感分析专家，擅长分析社交媒体内容的情感倾向。请仅返回JSON格式的分析结果。"},
                     {"role": "user", "content": prompt}
                 ],
-                max_tokens=self.max_tokens,
+                max_tokens=max_tokens,
                 temperature=self.temperature
+            ),
+            tokens=estimate_tokens(prompt) + max_tokens
+        )
+        
+        return self._parse_packed_sentiment_response(response.choices[0].message.content or '', len(texts))
+    
+    def _parse_packed_sentiment_response(self, response_text: str, expected_count: int) -> Dict[int, Dict[str, Any]]:
+        """
+        解析并校验打包分析响应
+        
+        校验规则：index 必须是 1..expected_count 内的整数且不重复，
+        sentiment 必须是 positive/negative/neutral，confidence 必须是数值
+        """
+        import json
+        
+        valid_results = {}
+        try:
+            start_idx = response_text.find('{')
+            end_idx = response_text.rfind('}') + 1
+            if start_idx < 0 or end_idx <= start_idx:
+                logger.warning("打包分析响应中未找到JSON")
+                return {}
+            
+            data = json.loads(response_text[start_idx:end_idx])
+            analyses = data.get('analyses', []) if isinstance(data, dict) else []
+            
+            seen_indexes = set()
+            for analysis in analyses:
+                if not isinstance(analysis, dict):
+                    continue
+                
+                try:
+                    index = int(analysis.get('index'))
+                except (TypeError, ValueError):
+                    continue
+                
+                if index < 1 or index > expected_count:
+                    continue
+                if index in seen_indexes:
+                    # 重复编号无法判断哪条可信，全部丢弃后单独重试
+                    valid_results.pop(index, None)
+                    continue
+                seen_indexes.add(index)
+                
+                sentiment = str(analysis.get('sentiment', '')).strip().lower()
+                if sentiment not in ['positive', 'negative', 'neutral']:
+                    continue
+                
+                try:
+                    confidence = float(analysis.get('confidence'))
+                except (TypeError, ValueError):
+                    continue
+                
+                valid_results[index] = {
+                    'sentiment': sentiment,
+                    'confidence': max(0.0, min(1.0, confidence)),
+                    'reasoning': analysis.get('reason', ''),
+                    'error': None
+                }
+            
+        except Exception as e:
+            logger.error(f"解析打包分析响应失败: {e}")
+            return {}
+        
+        return valid_results
+    
+    def _analyze_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """分析单个批次"""
+        try:
+            # 构建提示词
+            prompt = self._build_sentiment_prompt(texts)
+            
+            response = self.rate_limiter.call(
+                lambda: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": "你是一个专业的情感分析专家，擅长分析社交媒体内容的情感倾向。"},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=self.max_tokens,
+                    temperature=self.temperature
+                ),
+                tokens=estimate_tokens(prompt) + self.max_tokens
             )
             
             # 解析响应
@@ -480,8 +630,9 @@ confidence表示分析的置信度，范围0.0-1.0。
         """构建情感分析提示词"""
         numbered_texts = []
         for i, text in enumerate(texts, 1):
-            # 限制单个文本长度
-            truncated_text = text[:200] + "..." if len(text) > 200 else text
+            # 限制单个文本长度（打包分析不会传入超长文本，见 analyze_texts_packed）
+            limit = self.PACK_TEXT_MAX_CHARS
+            truncated_text = text[:limit] + "..." if len(text) > limit else text
             numbered_texts.append(f"{i}. {truncated_text}")
         
         return f"""
@@ -578,14 +729,17 @@ confidence表示分析的置信度，范围0.0-1.0。
                 channel_sentiment, hourly_analysis, sample_comments
             )
             
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "你必须只用不超过3句话回答。不能有标题、分段、列表。只给出最重要的结论。"},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=150,  # 进一步减少token数
-                temperature=0.3
+            response = self.rate_limiter.call(
+                lambda: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": "你必须只用不超过3句话回答。不能有标题、分段、列表。只给出最重要的结论。"},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=150,  # 进一步减少token数
+                    temperature=0.3
+                ),
+                tokens=estimate_tokens(prompt) + 150
             )
             
             return response.choices[0].message.content
@@ -616,14 +770,17 @@ confidence表示分析的置信度，范围0.0-1.0。
         try:
             prompt = self._build_summary_prompt(sentiment_stats, sample_comments, time_trends, channel_stats)
             
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "你是一个专业的舆情分析专家，擅长生成清晰、准确的舆情分析报告。"},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=self.max_tokens,
-                temperature=self.temperature
+            response = self.rate_limiter.call(
+                lambda: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": "你是一个专业的舆情分析专家，擅长生成清晰、准确的舆情分析报告。"},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=self.max_tokens,
+                    temperature=self.temperature
+                ),
+                tokens=estimate_tokens(prompt) + self.max_tokens
             )
             
             return response.choices[0].message.content
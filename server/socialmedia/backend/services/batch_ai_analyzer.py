@@ -4,11 +4,13 @@
 专门处理DWD_AI层数据的批量AI情感分析
 """
 
+import os
+import socket
 import logging
 import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Tuple, Optional
-import time
 
 from models.new_dash_social_model import DWDAIDashSocialComment
 from config.database_config import get_db_config
@@ -23,12 +25,25 @@ class BatchAIAnalyzer:
         self.db_config = get_db_config()
         self.ai_analyzer = AISentimentAnalyzer()
         
-    def process_pending_ai_analysis(self, batch_size: int = 100) -> Dict[str, Any]:
+        # 并发请求数（同时在途的OpenAI请求数），速率由共享的RPM/TPM限流器控制
+        self.concurrency = max(1, int(os.getenv('AI_ANALYSIS_CONCURRENCY', 4)))
+        
+        # 打包条数：每次请求包含的评论条数（1 表示逐条请求）
+        self.pack_size = self.ai_analyzer.pack_size
+        
+        # 认领租约时长（秒）：超过该时间仍为processing的记录可被其他工作进程重新认领
+        self.lease_seconds = max(30, int(os.getenv('AI_CLAIM_LEASE_SECONDS', 600)))
+        
+        # 失败记录最多自动认领的次数，超过后保留 failed 状态，只能通过 retry_failed_analysis 手动重试
+        self.max_attempts = max(1, int(os.getenv('AI_MAX_ATTEMPTS', 3)))
+        
+    def process_pending_ai_analysis(self, batch_size: int = 100, concurrency: int = None) -> Dict[str, Any]:
         """
         处理待AI分析的记录
         
         Args:
             batch_size: 批处理大小
+            concurrency: 并发请求数，默认读取环境变量 AI_ANALYSIS_CONCURRENCY；1 表示逐条处理
             
         Returns:
             处理结果统计
@@ -53,8 +68,8 @@ class BatchAIAnalyzer:
                     'failed_records': 0
                 }
             
-            # 2. 获取待分析的记录
-            pending_records = self._fetch_pending_ai_records(batch_size)
+            # 2. 原子认领待分析的记录（多个工作进程并发时互不重复）
+            pending_records = self._claim_pending_ai_records(batch_size, batch_id)
             
             if not pending_records:
                 logger.info("没有待AI分析的记录")
@@ -73,7 +88,7 @@ class BatchAIAnalyzer:
             
             # 3. 批量处理AI分析
             success_count, failed_count = self._process_ai_analysis_batch(
-                pending_records, batch_id
+                pending_records, batch_id, concurrency or self.concurrency
             )
             
             # 4. 生成结果
@@ -108,87 +123,122 @@ class BatchAIAnalyzer:
                 'failed_records': 0
             }
     
-    def _fetch_pending_ai_records(self, limit: int) -> List[Dict[str, Any]]:
-        """获取待AI分析的记录（从DWD表读取）"""
+    def _claim_id(self, batch_id: str) -> str:
+        """本次认领的标识（主机:进程号:批次ID），写入 ai_worker_id"""
+        return f"{socket.gethostname()[:40]}:{os.getpid()}:{batch_id}"
+    
+    def _execute_update(self, sql: str, params: tuple = None) -> int:
+        """在一个事务中执行UPDATE，返回影响的行数"""
+        with self.db_config.pooled_connection() as connection:
+            connection.begin()
+            try:
+                with connection.cursor() as cursor:
+                    affected = cursor.execute(sql, params)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+        return affected
+    
+    def _claim_pending_ai_records(self, limit: int, batch_id: str) -> List[Dict[str, Any]]:
+        """
+        原子认领待AI分析的记录（DWD表）
+        
+        一条 UPDATE 把 pending/failed 记录以及租约已过期的 processing 记录置为 processing，
+        同时写入本次认领标识和租约到期时间、累加认领次数，再按认领标识读取记录；并发的工作进程不会认领到同一条记录。
+        认领次数达到 max_attempts 的 failed 记录不再自动认领，避免持续失败的记录反复占满批次
+        """
         try:
-            sql = f"""
+            claim_id = self._claim_id(batch_id)
+            claim_sql = """
+                UPDATE dwd_dash_social_comments SET
+                    ai_processing_status = 'processing',
+                    ai_worker_id = %s,
+                    ai_lease_expires_at = DATE_ADD(NOW(), INTERVAL %s SECOND),
+                    ai_attempts = ai_attempts + 1
+                WHERE ai_processing_status IN ('pending', 'failed', 'processing')
+                  AND (ai_processing_status != 'processing'
+                       OR ai_lease_expires_at IS NULL
+                       OR ai_lease_expires_at < NOW())
+                  AND (ai_processing_status != 'failed' OR ai_attempts < %s)
+                ORDER BY record_id ASC
+                LIMIT %s
+            """
+            claimed = self._execute_update(claim_sql, (claim_id, self.lease_seconds, self.max_attempts, int(limit)))
+            if not claimed:
+                logger.info("没有可认领的待AI分析记录")
+                return []
+            
+            sql = """
                 SELECT record_id, text, ai_processing_status,
                        brand_label, author_name, channel, last_update
                 FROM dwd_dash_social_comments 
-                WHERE ai_processing_status != 'completed'
+                WHERE ai_worker_id = %s
+                  AND ai_processing_status = 'processing'
                 ORDER BY record_id ASC
-                LIMIT {limit}
             """
             
-            result = self.db_config.execute_query_dict(sql)
-            logger.info(f"获取到 {len(result) if result else 0} 条待AI分析记录（从DWD表）")
+            result = self.db_config.execute_query_dict(sql, (claim_id,))
+            logger.info(f"认领 {len(result) if result else 0} 条待AI分析记录（从DWD表），认领标识 {claim_id}")
             
             return result or []
             
         except Exception as e:
-            logger.error(f"获取待AI分析记录失败：{e}")
+            logger.error(f"认领待AI分析记录失败：{e}")
             return []
     
-    def _process_ai_analysis_batch(self, records: List[Dict[str, Any]], batch_id: str) -> Tuple[int, int]:
-        """处理一批AI分析记录"""
+    def _renew_lease(self, batch_id: str):
+        """续约本次认领的记录，避免长批次处理中途被其他工作进程重新认领"""
+        try:
+            sql = """
+                UPDATE dwd_dash_social_comments SET
+                    ai_lease_expires_at = DATE_ADD(NOW(), INTERVAL %s SECOND)
+                WHERE ai_worker_id = %s
+                  AND ai_processing_status = 'processing'
+            """
+            self.db_config.execute_insert(sql, (self.lease_seconds, self._claim_id(batch_id)))
+        except Exception as e:
+            logger.warning(f"AI分析租约续约失败：{e}")
+    
+    def _process_ai_analysis_batch(self, records: List[Dict[str, Any]], batch_id: str,
+                                   concurrency: int = 1) -> Tuple[int, int]:
+        """
+        处理一批AI分析记录
+        
+        记录按 pack_size 打包，每包一次OpenAI请求；concurrency > 1 时多个包并发执行，
+        请求速率由共享限流器控制；每条记录分析完成后立即更新DWD状态，每完成一包续约一次
+        """
         success_count = 0
         failed_count = 0
         
         try:
-            # 首先更新所有记录状态为processing
-            record_ids = [record['record_id'] for record in records]
-            self._update_processing_status(record_ids, 'processing', batch_id)
-            
-            logger.info(f"开始批量AI分析，共 {len(records)} 条记录")
-            
-            # 逐个处理记录
-            for i, record in enumerate(records, 1):
-                try:
-                    # 每10条记录检查一次数据库连接健康状态
-                    if i % 10 == 0:
-                        logger.info(f"处理进度: {i}/{len(records)}, 检查数据库连接状态...")
-                        if not self.db_config.test_connection():
-                            logger.warning("数据库连接异常，尝试重新连接...")
-                            self.db_config.close_connection()
-                    
-                    text = record.get('text', '').strip()
-                    if not text:
-                        logger.warning(f"记录 {record['record_id']} 文本为空，跳过AI分析")
-                        self._update_single_record_failed(
-                            record['record_id'], '文本内容为空', batch_id
-                        )
-                        failed_count += 1
-                        continue
-                    
-                    # 执行AI分析
-                    ai_result = self.ai_analyzer.analyze_single_text(text)
-                    
-                    if ai_result.get('error'):
-                        # AI分析失败
-                        error_msg = ai_result.get('error', '未知错误')
-                        logger.warning(f"记录 {record['record_id']} AI分析失败: {error_msg}")
-                        self._update_single_record_failed(
-                            record['record_id'], error_msg, batch_id
-                        )
-                        failed_count += 1
-                    else:
-                        # AI分析成功
-                        self._update_single_record_success(
-                            record['record_id'], ai_result, batch_id
-                        )
-                        success_count += 1
-                    
-                    # API限流：每次分析后暂停
-                    if i < len(records):  # 最后一个记录不需要等待
-                        time.sleep(1.0)  # 1秒间隔避免API限制
-                        
-                except Exception as e:
-                    logger.error(f"处理记录 {record.get('record_id', 'unknown')} 时发生错误: {e}")
-                    self._update_single_record_failed(
-                        record.get('record_id'), f'处理异常: {str(e)}', batch_id
-                    )
-                    failed_count += 1
-                    continue
+            packs = [records[i:i + self.pack_size] for i in range(0, len(records), self.pack_size)]
+            concurrency = max(1, min(int(concurrency), len(packs)))
+            logger.info(f"开始批量AI分析，共 {len(records)} 条记录，{len(packs)} 个请求包，并发数 {concurrency}")
+            
+            done_count = 0
+            if concurrency == 1:
+                # 逐包处理
+                for pack in packs:
+                    pack_success, pack_failed = self._process_record_pack(pack, batch_id)
+                    success_count += pack_success
+                    failed_count += pack_failed
+                    done_count += len(pack)
+                    self._renew_lease(batch_id)
+                    logger.info(f"处理进度: {done_count}/{len(records)}")
+            else:
+                with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='ai-analysis') as executor:
+                    futures = {
+                        executor.submit(self._process_record_pack, pack, batch_id): len(pack)
+                        for pack in packs
+                    }
+                    for future in as_completed(futures):
+                        pack_success, pack_failed = future.result()
+                        success_count += pack_success
+                        failed_count += pack_failed
+                        done_count += futures[future]
+                        self._renew_lease(batch_id)
+                        logger.info(f"处理进度: {done_count}/{len(records)}")
             
             logger.info(f"AI分析批次处理完成：成功 {success_count} 条，失败 {failed_count} 条")
             return success_count, failed_count
@@ -200,52 +250,140 @@ class BatchAIAnalyzer:
             self._update_processing_status(record_ids, 'failed', batch_id, str(e))
             return 0, len(records)
     
+    def _process_record_pack(self, records: List[Dict[str, Any]], batch_id: str) -> Tuple[int, int]:
+        """
+        分析一包记录（一次打包请求）并逐条更新DWD状态（可在工作线程中执行）
+        
+        Returns:
+            (success_count, failed_count)
+        """
+        if len(records) == 1:
+            return (1, 0) if self._process_single_record(records[0], batch_id) else (0, 1)
+        
+        success_count = 0
+        failed_count = 0
+        
+        try:
+            texts = [(record.get('text') or '').strip() for record in records]
+            
+            # 打包分析，缺失或格式错误的条目在分析器内单独重试
+            ai_results = self.ai_analyzer.analyze_texts_packed(texts, len(records))
+            
+            for record, ai_result in zip(records, ai_results):
+                if ai_result.get('error'):
+                    error_msg = ai_result.get('error', '未知错误')
+                    logger.warning(f"记录 {record['record_id']} AI分析失败: {error_msg}")
+                    self._update_single_record_failed(record['record_id'], error_msg, batch_id)
+                    failed_count += 1
+                else:
+                    self._update_single_record_success(record['record_id'], ai_result, batch_id)
+                    success_count += 1
+            
+            return success_count, failed_count
+            
+        except Exception as e:
+            logger.error(f"处理记录包时发生错误: {e}")
+            # 未写入结果的记录标记为失败
+            for record in records[success_count + failed_count:]:
+                self._update_single_record_failed(
+                    record.get('record_id'), f'处理异常: {str(e)}', batch_id
+                )
+            return success_count, len(records) - success_count
+    
+    def _process_single_record(self, record: Dict[str, Any], batch_id: str) -> bool:
+        """
+        分析单条记录并更新DWD状态（可在工作线程中执行）
+        
+        Returns:
+            是否分析成功
+        """
+        try:
+            text = (record.get('text') or '').strip()
+            if not text:
+                logger.warning(f"记录 {record['record_id']} 文本为空，跳过AI分析")
+                self._update_single_record_failed(
+                    record['record_id'], '文本内容为空', batch_id
+                )
+                return False
+            
+            # 执行AI分析（内部按RPM/TPM限流）
+            ai_result = self.ai_analyzer.analyze_single_text(text)
+            
+            if ai_result.get('error'):
+                # AI分析失败
+                error_msg = ai_result.get('error', '未知错误')
+                logger.warning(f"记录 {record['record_id']} AI分析失败: {error_msg}")
+                self._update_single_record_failed(
+                    record['record_id'], error_msg, batch_id
+                )
+                return False
+            
+            # AI分析成功
+            self._update_single_record_success(
+                record['record_id'], ai_result, batch_id
+            )
+            return True
+            
+        except Exception as e:
+            logger.error(f"处理记录 {record.get('record_id', 'unknown')} 时发生错误: {e}")
+            self._update_single_record_failed(
+                record.get('record_id'), f'处理异常: {str(e)}', batch_id
+            )
+            return False
+    
     def _update_processing_status(self, record_ids: List[int], status: str, 
                                 batch_id: str, error_msg: str = None):
-        """批量更新记录的处理状态（更新DWD表）"""
+        """批量更新本次认领记录的处理状态并释放租约（更新DWD表）"""
         try:
             if not record_ids:
                 return
             
-            ids_str = ','.join(map(str, record_ids))
+            placeholders = ','.join(['%s'] * len(record_ids))
             # 注意：DWD表没有ai_error_message和ai_analysis_batch_id字段，只更新状态
+            # 带上认领标识条件：租约过期后已被其他工作进程重新认领的记录不覆盖
             
             sql = f"""
                 UPDATE dwd_dash_social_comments SET
-                    ai_processing_status = '{status}'
-                WHERE record_id IN ({ids_str})
+                    ai_processing_status = %s,
+                    ai_worker_id = NULL,
+                    ai_lease_expires_at = NULL
+                WHERE record_id IN ({placeholders})
+                  AND ai_worker_id = %s
             """
             
-            self.db_config.execute_insert(sql)
+            self.db_config.execute_insert(sql, (status, *record_ids, self._claim_id(batch_id)))
             logger.info(f"更新 {len(record_ids)} 条DWD记录状态为: {status}")
             
         except Exception as e:
             logger.error(f"批量更新DWD记录状态失败：{e}")
     
     def _update_single_record_success(self, record_id: int, ai_result: Dict[str, Any], batch_id: str):
-        """更新单条记录为成功状态：只更新DWD表的AI分析状态"""
+        """更新单条记录为成功状态：只更新DWD表的AI分析状态并释放租约"""
         try:
             # 获取AI分析结果
             ai_sentiment = ai_result.get('sentiment', 'neutral')
             ai_confidence = ai_result.get('confidence', 0.0)
+            # 标签来源：本地预筛（prescreen）或OpenAI（含缓存命中）
+            ai_sentiment_source = ai_result.get('source') or 'openai'
             
-            def escape_sql_string(s):
-                if s is None:
-                    return 'NULL'
-                return "'" + str(s).replace("'", "''") + "'"
-            
-            # 更新DWD表状态为completed，并保存基本AI分析结果
-            update_sql = f"""
+            # 更新DWD表状态为completed，并保存基本AI分析结果（只更新本次认领的记录）
+            update_sql = """
                 UPDATE dwd_dash_social_comments SET
                     ai_processing_status = 'completed',
-                    ai_sentiment = {escape_sql_string(ai_sentiment)},
-                    ai_confidence = {ai_confidence},
+                    ai_sentiment = %s,
+                    ai_confidence = %s,
+                    ai_sentiment_source = %s,
                     ai_processed_at = NOW(),
+                    ai_worker_id = NULL,
+                    ai_lease_expires_at = NULL,
                     updated_at = NOW()
-                WHERE record_id = {record_id}
+                WHERE record_id = %s
+                  AND ai_worker_id = %s
             """
             
-            self.db_config.execute_insert(update_sql)
+            self.db_config.execute_insert(
+                update_sql, (ai_sentiment, ai_confidence, ai_sentiment_source, record_id, self._claim_id(batch_id))
+            )
             logger.debug(f"更新DWD记录 {record_id} AI分析状态为completed，情感：{ai_sentiment}")
             
             # 注意：不再直接插入DWD_AI表，这将由后续的极端负面分析和同步流程处理
@@ -343,28 +481,31 @@ class BatchAIAnalyzer:
             logger.error(f"插入DWD_AI记录失败：{e}")
     
     def _update_single_record_failed(self, record_id: int, error_msg: str, batch_id: str):
-        """更新单条记录为失败状态（只更新DWD表，不插入DWD_AI表）"""
+        """更新单条记录为失败状态并释放租约（只更新DWD表，不插入DWD_AI表）"""
         try:
-            # 只更新DWD表的状态为failed
-            sql = f"""
+            # 只更新DWD表的状态为failed（只更新本次认领的记录）
+            sql = """
                 UPDATE dwd_dash_social_comments SET
-                    ai_processing_status = 'failed'
-                WHERE record_id = {record_id}
+                    ai_processing_status = 'failed',
+                    ai_worker_id = NULL,
+                    ai_lease_expires_at = NULL
+                WHERE record_id = %s
+                  AND ai_worker_id = %s
             """
             
-            self.db_config.execute_insert(sql)
+            self.db_config.execute_insert(sql, (record_id, self._claim_id(batch_id)))
             logger.debug(f"更新DWD记录 {record_id} 状态为failed")
             
         except Exception as e:
             logger.error(f"更新记录 {record_id} 失败状态失败：{e}")
     
     def retry_failed_analysis(self, batch_size: int = 50) -> Dict[str, Any]:
-        """重试失败的AI分析记录（从DWD表重试）"""
+        """重试失败的AI分析记录（从DWD表重试，包括已达到自动认领次数上限的记录）"""
         try:
-            # 重置失败的记录状态为pending（从DWD表）
+            # 重置失败的记录状态为pending并清零认领次数（从DWD表）
             sql = f"""
                 UPDATE dwd_dash_social_comments 
-                SET ai_processing_status = 'pending'
+                SET ai_processing_status = 'pending', ai_attempts = 0
                 WHERE ai_processing_status = 'failed' 
                 LIMIT {batch_size}
             """
@@ -404,12 +545,18 @@ class BatchAIAnalyzer:
             processing_sql = "SELECT COUNT(*) as count FROM dwd_dash_social_comments WHERE ai_processing_status = 'processing'"
             completed_sql = "SELECT COUNT(*) as count FROM dwd_dash_social_comments WHERE ai_processing_status = 'completed'"
             failed_sql = "SELECT COUNT(*) as count FROM dwd_dash_social_comments WHERE ai_processing_status = 'failed'"
+            expired_lease_sql = """
+                SELECT COUNT(*) as count FROM dwd_dash_social_comments
+                WHERE ai_processing_status = 'processing'
+                  AND (ai_lease_expires_at IS NULL OR ai_lease_expires_at < NOW())
+            """
             
             total_result = self.db_config.execute_query_dict(total_sql)
             pending_result = self.db_config.execute_query_dict(pending_sql)
             processing_result = self.db_config.execute_query_dict(processing_sql)
             completed_result = self.db_config.execute_query_dict(completed_sql)
             failed_result = self.db_config.execute_query_dict(failed_sql)
+            expired_lease_result = self.db_config.execute_query_dict(expired_lease_sql)
             
             stats = {
                 'total_records': total_result[0]['count'] if total_result else 0,
@@ -417,6 +564,7 @@ class BatchAIAnalyzer:
                 'processing_records': processing_result[0]['count'] if processing_result else 0,
                 'completed_records': completed_result[0]['count'] if completed_result else 0,
                 'failed_records': failed_result[0]['count'] if failed_result else 0,
+                'expired_lease_records': expired_lease_result[0]['count'] if expired_lease_result else 0,
                 'ai_service_available': self.ai_analyzer.is_available()
             }
             
@@ -436,6 +584,15 @@ class BatchAIAnalyzer:
             
             stats['sentiment_distribution'] = sentiment_stats
             
+            # 分析结果缓存命中情况
+            stats['sentiment_cache'] = self.ai_analyzer.get_cache_stats()
+            
+            # OpenAI限流器状态（含429次数和当前速率系数）
+            stats['rate_limiter'] = self.ai_analyzer.rate_limiter.get_stats()
+            
+            # 本地情感预筛跳过比例与一致率
+            stats['sentiment_prescreen'] = self.ai_analyzer.get_prescreen_stats()
+            
             return {
                 'status': 'success',
                 'statistics': stats
@@ -5,21 +5,30 @@
 """
 
 import logging
+import os
 import uuid
 from datetime import datetime
 from typing import Dict, Any, List, Optional, Tuple
 
+import pandas as pd
+
 from config.database_config import get_db_config
 from services.ai_sentiment_analyzer import AISentimentAnalyzer
+from services.extreme_keyword_matcher import score_extreme_series
 
 logger = logging.getLogger(__name__)
 
 class BatchExtremeNegativeAnalyzer:
     """批量极端负面分析器"""
     
+    # 非负面评论批量置为completed时，每条UPDATE覆盖的 record_id 跨度
+    NON_NEGATIVE_RANGE_SIZE = 50000
+    
     def __init__(self):
         self.db_config = get_db_config()
         self.ai_analyzer = AISentimentAnalyzer()
+        # processing 状态超过该秒数未更新视为处理进程已退出，记录可被重新领取
+        self.processing_timeout_seconds = max(60, int(os.getenv('EXTREME_PROCESSING_TIMEOUT_SECONDS', 1800)))
     
     def process_pending_extreme_analysis(self, batch_size: int = 50) -> Dict[str, Any]:
         """
@@ -53,35 +62,44 @@ class BatchExtremeNegativeAnalyzer:
             
             logger.info(f"获取到 {len(records)} 条待极端负面分析记录（从DWD表）")
             
-            # 2. 批量处理记录
-            success_count = 0
-            failed_count = 0
+            # 2. 整批标记为 processing（一条UPDATE）
+            record_ids = [record['record_id'] for record in records]
+            self._update_extreme_status(record_ids, 'processing')
             
-            for record in records:
-                try:
-                    # 更新状态为 processing
-                    self._update_extreme_status(record['record_id'], 'processing')
-                    
-                    # 进行极端负面检测
-                    is_extreme = self.ai_analyzer.analyze_extreme_negative(
-                        record['text'], 
-                        record.get('ai_sentiment', '')
-                    )
-                    
-                    # 更新状态为 completed
-                    self._update_extreme_status_success(record['record_id'], is_extreme)
-                    success_count += 1
-                    
-                    logger.debug(f"记录 {record['record_id']} 极端负面分析完成: {is_extreme}")
-                    
-                except Exception as e:
-                    logger.error(f"记录 {record['record_id']} 极端负面分析失败: {e}")
-                    # 更新状态为 failed
-                    self._update_extreme_status(record['record_id'], 'failed')
-                    failed_count += 1
-                    continue
+            extreme_ids = []
+            normal_ids = []
+            failed_ids = []
+            try:
+                # 3. 批量处理记录（规则得分对整批向量化计算），结果按类别收集
+                rule_scores = score_extreme_series(pd.Series([record['text'] for record in records])).tolist()
+                
+                for record, rule_score in zip(records, rule_scores):
+                    try:
+                        # 进行极端负面检测
+                        is_extreme = self.ai_analyzer.analyze_extreme_negative(
+                            record['text'], 
+                            record.get('ai_sentiment', ''),
+                            rule_based_score=rule_score
+                        )
+                        
+                        (extreme_ids if is_extreme else normal_ids).append(record['record_id'])
+                        logger.debug(f"记录 {record['record_id']} 极端负面分析完成: {is_extreme}")
+                        
+                    except Exception as e:
+                        logger.error(f"记录 {record['record_id']} 极端负面分析失败: {e}")
+                        failed_ids.append(record['record_id'])
+                        continue
+                
+                # 4. 整批写回结果（一条UPDATE）
+                self._apply_extreme_results(extreme_ids, normal_ids, failed_ids)
+            except Exception:
+                # 写回失败时把整批置为 failed，避免记录一直停留在 processing（failed 记录下一轮会重新领取）
+                self._release_processing(record_ids)
+                raise
+            success_count = len(extreme_ids) + len(normal_ids)
+            failed_count = len(failed_ids)
             
-            # 3. 返回处理结果
+            # 5. 返回处理结果
             result = {
                 'batch_id': batch_id,
                 'status': 'completed' if failed_count == 0 else 'partial',
@@ -89,6 +107,7 @@ class BatchExtremeNegativeAnalyzer:
                 'total_records': len(records),
                 'success_records': success_count,
                 'failed_records': failed_count,
+                'extreme_records': len(extreme_ids),
                 'ai_service_available': self.ai_analyzer.is_available()
             }
             
@@ -116,50 +135,119 @@ class BatchExtremeNegativeAnalyzer:
                 FROM dwd_dash_social_comments
                 WHERE ai_processing_status = 'completed'
                   AND ai_sentiment = 'negative'
-                  AND extreme_negative_processing_status NOT IN ('completed', 'processing')
+                  AND (extreme_negative_processing_status NOT IN ('completed', 'processing')
+                       OR (extreme_negative_processing_status = 'processing'
+                           AND updated_at < DATE_SUB(NOW(), INTERVAL %s SECOND)))
                 ORDER BY record_id ASC
-                LIMIT {batch_size}
+                LIMIT {int(batch_size)}
             """
             
-            result = self.db_config.execute_query_dict(sql)
+            result = self.db_config.execute_query_dict(sql, (self.processing_timeout_seconds,))
             return result or []
             
         except Exception as e:
             logger.error(f"获取待极端负面分析记录失败: {e}")
             return []
     
-    def _update_extreme_status(self, record_id: int, status: str):
-        """更新极端负面处理状态"""
+    def _execute_update(self, sql: str, params: tuple = None) -> int:
+        """在一个事务中执行UPDATE，返回影响的行数"""
+        with self.db_config.pooled_connection() as connection:
+            connection.begin()
+            try:
+                with connection.cursor() as cursor:
+                    affected = cursor.execute(sql, params)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+        return affected
+    
+    def _update_extreme_status(self, record_ids: List[int], status: str) -> int:
+        """批量更新极端负面处理状态（WHERE record_id IN ...）"""
+        if not record_ids:
+            return 0
         try:
+            placeholders = ', '.join(['%s'] * len(record_ids))
             sql = f"""
                 UPDATE dwd_dash_social_comments 
-                SET extreme_negative_processing_status = '{status}',
+                SET extreme_negative_processing_status = %s,
                     updated_at = NOW()
-                WHERE record_id = {record_id}
+                WHERE record_id IN ({placeholders})
             """
             
-            self.db_config.execute_insert(sql)
-            logger.debug(f"更新记录 {record_id} 极端负面状态为: {status}")
+            affected = self._execute_update(sql, (status, *record_ids))
+            logger.debug(f"更新 {affected} 条记录极端负面状态为: {status}")
+            return affected
             
         except Exception as e:
             logger.error(f"更新极端负面状态失败: {e}")
             raise
     
-    def _update_extreme_status_success(self, record_id: int, is_extreme: bool):
-        """更新极端负面分析成功状态"""
+    def _release_processing(self, record_ids: List[int]):
+        """把仍处于 processing 的记录置为 failed（写回失败时调用，失败不再抛出）"""
+        if not record_ids:
+            return
         try:
+            placeholders = ', '.join(['%s'] * len(record_ids))
             sql = f"""
                 UPDATE dwd_dash_social_comments 
-                SET extreme_negative_processing_status = 'completed',
+                SET extreme_negative_processing_status = 'failed',
                     updated_at = NOW()
-                WHERE record_id = {record_id}
+                WHERE record_id IN ({placeholders})
+                  AND extreme_negative_processing_status = 'processing'
+            """
+            affected = self._execute_update(sql, tuple(record_ids))
+            logger.warning(f"极端负面分析中断，{affected} 条 processing 记录已置为 failed")
+        except Exception as e:
+            # 仍未释放的记录会在 processing 超时后被重新领取
+            logger.error(f"释放 processing 状态失败: {e}")
+    
+    def _apply_extreme_results(self, extreme_ids: List[int], normal_ids: List[int], failed_ids: List[int]) -> int:
+        """
+        用一条 CASE 更新写回整批分析结果
+        
+        极端负面/非极端负面的记录置为 completed 并写入 extremely_negative，分析失败的记录置为 failed
+        """
+        record_ids = extreme_ids + normal_ids + failed_ids
+        if not record_ids:
+            return 0
+        
+        def in_list(ids: List[int]) -> str:
+            return ', '.join(['%s'] * len(ids))
+        
+        status_case = "'completed'"
+        params: List[Any] = []
+        if failed_ids:
+            status_case = f"CASE WHEN record_id IN ({in_list(failed_ids)}) THEN 'failed' ELSE 'completed' END"
+            params.extend(failed_ids)
+        
+        extreme_case = 'extremely_negative'
+        if extreme_ids or normal_ids:
+            branches = []
+            if extreme_ids:
+                branches.append(f"WHEN record_id IN ({in_list(extreme_ids)}) THEN 1")
+                params.extend(extreme_ids)
+            if normal_ids:
+                branches.append(f"WHEN record_id IN ({in_list(normal_ids)}) THEN 0")
+                params.extend(normal_ids)
+            extreme_case = f"CASE {' '.join(branches)} ELSE extremely_negative END"
+        
+        params.extend(record_ids)
+        try:
+            sql = f"""
+                UPDATE dwd_dash_social_comments 
+                SET extreme_negative_processing_status = {status_case},
+                    extremely_negative = {extreme_case},
+                    updated_at = NOW()
+                WHERE record_id IN ({in_list(record_ids)})
             """
             
-            self.db_config.execute_insert(sql)
-            logger.debug(f"记录 {record_id} 极端负面分析完成，结果: {is_extreme}")
+            affected = self._execute_update(sql, tuple(params))
+            logger.debug(f"极端负面结果写回 {affected} 条：极端{len(extreme_ids)}，非极端{len(normal_ids)}，失败{len(failed_ids)}")
+            return affected
             
         except Exception as e:
-            logger.error(f"更新极端负面成功状态失败: {e}")
+            logger.error(f"写回极端负面分析结果失败: {e}")
             raise
     
     def retry_failed_extreme_analysis(self, batch_size: int = 50) -> Dict[str, Any]:
@@ -231,36 +319,70 @@ class BatchExtremeNegativeAnalyzer:
                 'error': str(e)
             }
     
-    def process_non_negative_records(self, batch_size: int = 100) -> Dict[str, Any]:
+    def process_non_negative_records(self, start_record_id: int = None, end_record_id: int = None,
+                                     range_size: int = None) -> Dict[str, Any]:
         """
         处理非负面评论（直接设置为completed状态）
         
+        对 record_id 区间内所有待处理的非负面评论执行集合式UPDATE；区间为空时覆盖全部待处理记录，
+        按 range_size 个 record_id 切分为多条UPDATE，控制单个事务的大小
+        
         Args:
-            batch_size: 批处理大小
+            start_record_id: 起始 record_id（含），为空表示不限
+            end_record_id: 结束 record_id（含），为空表示不限
+            range_size: 每条UPDATE覆盖的 record_id 跨度，默认 NON_NEGATIVE_RANGE_SIZE
             
         Returns:
             处理结果统计
         """
         try:
             logger.info("开始处理非负面评论的极端负面状态")
+            range_size = max(1, int(range_size or self.NON_NEGATIVE_RANGE_SIZE))
+            
+            conditions = [
+                "ai_processing_status = 'completed'",
+                "ai_sentiment != 'negative'",
+                "extreme_negative_processing_status = 'pending'"
+            ]
+            params: List[Any] = []
+            if start_record_id is not None:
+                conditions.append('record_id >= %s')
+                params.append(int(start_record_id))
+            if end_record_id is not None:
+                conditions.append('record_id <= %s')
+                params.append(int(end_record_id))
+            where_clause = ' AND '.join(conditions)
+            
+            bounds = self.db_config.execute_query_dict(
+                f"SELECT MIN(record_id) AS min_id, MAX(record_id) AS max_id FROM dwd_dash_social_comments WHERE {where_clause}",
+                tuple(params)
+            )
+            min_id = bounds[0]['min_id'] if bounds else None
+            max_id = bounds[0]['max_id'] if bounds else None
             
             # 对于非负面评论，直接设置extreme_negative_processing_status为completed
             sql = f"""
                 UPDATE dwd_dash_social_comments 
                 SET extreme_negative_processing_status = 'completed',
+                    extremely_negative = 0,
                     updated_at = NOW()
-                WHERE ai_processing_status = 'completed'
-                  AND ai_sentiment != 'negative'
-                  AND extreme_negative_processing_status = 'pending'
-                LIMIT {batch_size}
+                WHERE {where_clause}
+                  AND record_id BETWEEN %s AND %s
             """
             
-            affected_rows = self.db_config.execute_insert(sql)
+            affected_rows = 0
+            range_count = 0
+            if min_id is not None:
+                for range_start in range(min_id, max_id + 1, range_size):
+                    range_end = min(range_start + range_size - 1, max_id)
+                    affected_rows += self._execute_update(sql, (*params, range_start, range_end))
+                    range_count += 1
             
             result = {
                 'status': 'completed',
                 'message': f'非负面评论处理完成：{affected_rows}条',
-                'processed_records': affected_rows
+                'processed_records': affected_rows,
+                'update_statements': range_count
             }
             
             logger.info(result['message'])
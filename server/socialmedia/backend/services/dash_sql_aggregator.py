@@ -0,0 +1,746 @@
+# -*- coding: utf-8 -*-
+"""
+Dash Social 数据库端聚合引擎
+把 NewDashAnalyzer 中按日期、渠道、小时、情感的统计下推为 GROUP BY 查询，
+只拉取图表需要的少量样例行，返回结构与 NewDashAnalyzer 的DataFrame分析结果保持一致
+"""
+
+import logging
+from typing import List, Dict, Any, Tuple, Optional
+
+import pandas as pd
+
+from config.database_config import get_db_config
+
+logger = logging.getLogger(__name__)
+
+# 查询过滤条件：(WHERE子句, 参数列表)
+QueryFilter = Tuple[str, List[Any]]
+
+SENTIMENT_VALUES = ['positive', 'negative', 'neutral']
+
+
+class DashSQLAggregator:
+    """基于DWD_AI表的SQL聚合分析器"""
+
+    TABLE = 'dwd_dash_social_comments_ai'
+    ROLLUP_TABLE = 'dws_dash_social_sentiment_hourly'
+    ROLLUP_STATE_TABLE = 'dws_dash_social_rollup_state'
+
+    def __init__(self):
+        self.db_config = get_db_config()
+
+        # 默认品牌关键词（与 NewDashAnalyzer 一致）
+        self.brand_keywords = [
+            'petlibro', 'PETLIBRO', 'Petlibro',
+            '宠物喂食器', '智能饮水机', '自动喂食器',
+            '宠物用品', '智能宠物', '宠物科技'
+        ]
+
+    # ------------------------------------------------------------------
+    # 查询条件
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _like_pattern(keyword: str) -> str:
+        """构建LIKE模式（转义通配符）"""
+        escaped = str(keyword).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return f"%{escaped}%"
+
+    def build_filter(self, keywords: List[str] = None, start_date: str = None,
+                     end_date: str = None, platforms: List[str] = None,
+                     ai_status_filter: str = 'completed') -> QueryFilter:
+        """
+        构建与 NewDashAnalyzer.query_data 相同语义的参数化过滤条件
+
+        Returns:
+            (where_sql, params)
+        """
+        conditions = ['1=1']
+        params: List[Any] = []
+
+        # AI状态过滤
+        if ai_status_filter != 'all':
+            conditions.append('ai_processing_status = %s')
+            params.append(ai_status_filter)
+
+        # 关键词条件（text/tags/caption/brand_label 任一包含）
+        if keywords:
+            keyword_conditions = []
+            for keyword in keywords:
+                keyword_conditions.append(
+                    '(text LIKE %s OR tags LIKE %s OR caption LIKE %s OR brand_label LIKE %s)'
+                )
+                params.extend([self._like_pattern(keyword)] * 4)
+            conditions.append(f"({' OR '.join(keyword_conditions)})")
+
+        # 时间条件（按范围比较，可使用last_update索引）
+        if start_date:
+            conditions.append('last_update >= %s')
+            params.append(start_date)
+        if end_date:
+            conditions.append('last_update < DATE_ADD(%s, INTERVAL 1 DAY)')
+            params.append(end_date)
+
+        # 渠道条件
+        if platforms:
+            conditions.append(f"channel IN ({', '.join(['%s'] * len(platforms))})")
+            params.extend(platforms)
+
+        return ' AND '.join(conditions), params
+
+    @staticmethod
+    def _extend_filter(query_filter: QueryFilter, condition: str, params: List[Any] = None) -> QueryFilter:
+        """在已有过滤条件上追加条件"""
+        where_sql, base_params = query_filter
+        return f"{where_sql} AND {condition}", list(base_params) + list(params or [])
+
+    def build_rollup_filter(self, start_date: str = None, end_date: str = None,
+                            platforms: List[str] = None) -> QueryFilter:
+        """构建小时级汇总表的过滤条件（汇总表不含文本，只能按日期和渠道过滤）"""
+        conditions = ['1=1']
+        params: List[Any] = []
+
+        if start_date:
+            conditions.append('stat_date >= %s')
+            params.append(start_date)
+        if end_date:
+            conditions.append('stat_date <= %s')
+            params.append(end_date)
+        if platforms:
+            conditions.append(f"channel IN ({', '.join(['%s'] * len(platforms))})")
+            params.extend(platforms)
+
+        return ' AND '.join(conditions), params
+
+    def _query(self, select_sql: str, query_filter: QueryFilter, suffix: str = '',
+               table: str = None) -> List[Dict[str, Any]]:
+        """执行带过滤条件的查询"""
+        where_sql, params = query_filter
+        sql = f"{select_sql} FROM {table or self.TABLE} WHERE {where_sql} {suffix}"
+        return self.db_config.execute_query_dict(sql, tuple(params)) or []
+
+    # ------------------------------------------------------------------
+    # 基础统计
+    # ------------------------------------------------------------------
+
+    def count_records(self, query_filter: QueryFilter) -> int:
+        """统计满足条件的记录数"""
+        rows = self._query("SELECT COUNT(*) AS total_count", query_filter)
+        return int(rows[0]['total_count']) if rows else 0
+
+    def is_rollup_consistent(self) -> bool:
+        """汇总表是否与明细一致（由ETL全量重建置位、增量失败清除；无状态记录视为不一致）"""
+        try:
+            rows = self.db_config.execute_query_dict(
+                f"SELECT is_consistent FROM {self.ROLLUP_STATE_TABLE} WHERE rollup_name = %s",
+                (self.ROLLUP_TABLE,)
+            )
+        except Exception as e:
+            logger.warning(f"读取情感汇总表状态失败，使用明细聚合: {e}")
+            return False
+        return bool(rows and rows[0]['is_consistent'])
+
+    def count_rollup_records(self, rollup_filter: QueryFilter) -> Optional[int]:
+        """按汇总表自身的评论数统计总数；汇总表不一致时返回None，由调用方统计明细表"""
+        if not self.is_rollup_consistent():
+            return None
+        rows = self._query("SELECT COALESCE(SUM(comment_count), 0) AS total_count", rollup_filter,
+                           table=self.ROLLUP_TABLE)
+        return int(rows[0]['total_count']) if rows else 0
+
+    def _count_by(self, query_filter: QueryFilter, sentiment_column: str,
+                  group_expr: str = None, group_alias: str = 'group_key') -> List[Dict[str, Any]]:
+        """按（可选分组列 + 情感列）统计，忽略分组值为空的记录"""
+        if group_expr:
+            select_sql = f"SELECT {group_expr} AS {group_alias}, {sentiment_column} AS sentiment_value, COUNT(*) AS cnt"
+            condition = f"{sentiment_column} IS NOT NULL AND {group_expr} IS NOT NULL"
+            suffix = f"GROUP BY {group_alias}, sentiment_value"
+        else:
+            select_sql = f"SELECT {sentiment_column} AS sentiment_value, COUNT(*) AS cnt"
+            condition = f"{sentiment_column} IS NOT NULL"
+            suffix = "GROUP BY sentiment_value"
+        return self._query(select_sql, self._extend_filter(query_filter, condition), suffix)
+
+    def fetch_sample_texts(self, query_filter: QueryFilter, column: str, value: str, limit: int) -> List[str]:
+        """获取指定情感的示例文本（最新的若干条）"""
+        rows = self._query(
+            "SELECT text",
+            self._extend_filter(query_filter, f"{column} = %s", [value]),
+            f"ORDER BY last_update DESC LIMIT {int(limit)}"
+        )
+        return [row['text'] for row in rows]
+
+    # ------------------------------------------------------------------
+    # 1. Brand Mention
+    # ------------------------------------------------------------------
+
+    def analyze_brand_mentions(self, query_filter: QueryFilter, keywords: List[str] = None) -> Dict[str, Any]:
+        """品牌提及分析（结构同 NewDashAnalyzer.analyze_brand_mentions，只统计text字段）"""
+        try:
+            period_rows = self._query(
+                "SELECT COUNT(*) AS total_count, MIN(last_update) AS min_time, MAX(last_update) AS max_time",
+                query_filter
+            )
+            if not period_rows or not period_rows[0]['total_count']:
+                return {'error': '没有数据可供分析'}
+
+            analysis_keywords = keywords or self.brand_keywords
+            brand_analysis = {}
+
+            for keyword in analysis_keywords:
+                mention_filter = self._extend_filter(query_filter, 'text LIKE %s', [self._like_pattern(keyword)])
+
+                count_rows = self._query(
+                    "SELECT COUNT(*) AS total_mentions, COUNT(ai_sentiment) AS ai_sentiment_count",
+                    mention_filter
+                )
+                total_mentions = int(count_rows[0]['total_mentions']) if count_rows else 0
+
+                if total_mentions == 0:
+                    brand_analysis[keyword] = {
+                        'total_mentions': 0,
+                        'daily_breakdown': {},
+                        'sentiment_distribution': {}
+                    }
+                    continue
+
+                # 按日期统计
+                daily_rows = self._query(
+                    "SELECT DATE(last_update) AS mention_date, COUNT(*) AS cnt",
+                    self._extend_filter(mention_filter, 'last_update IS NOT NULL'),
+                    "GROUP BY mention_date ORDER BY mention_date"
+                )
+                daily_breakdown = {str(row['mention_date']): int(row['cnt']) for row in daily_rows}
+
+                # AI情感分布统计（优先使用AI分析结果）
+                sentiment_col = 'ai_sentiment' if int(count_rows[0]['ai_sentiment_count']) > 0 else 'sentiment'
+                sentiment_rows = sorted(self._count_by(mention_filter, sentiment_col), key=lambda r: -int(r['cnt']))
+                sentiment_distribution = {row['sentiment_value']: int(row['cnt']) for row in sentiment_rows}
+
+                sample_mentions = self._query(
+                    f"SELECT text, last_update, {sentiment_col}, author_name",
+                    mention_filter,
+                    "ORDER BY last_update DESC LIMIT 3"
+                )
+
+                brand_analysis[keyword] = {
+                    'total_mentions': total_mentions,
+                    'daily_breakdown': daily_breakdown,
+                    'sentiment_distribution': sentiment_distribution,
+                    'sample_mentions': sample_mentions
+                }
+
+            total_mentions_all = sum([data['total_mentions'] for data in brand_analysis.values()])
+            min_time = period_rows[0]['min_time']
+            max_time = period_rows[0]['max_time']
+
+            summary = {
+                'total_keywords': len(analysis_keywords),
+                'total_mentions_all': total_mentions_all,
+                'most_mentioned_keyword': max(brand_analysis.items(), key=lambda x: x[1]['total_mentions'])[0] if total_mentions_all > 0 else None,
+                'analysis_period': {
+                    'start_date': str(pd.Timestamp(min_time).date()) if min_time else None,
+                    'end_date': str(pd.Timestamp(max_time).date()) if max_time else None
+                }
+            }
+
+            return {
+                'summary': summary,
+                'keyword_analysis': brand_analysis,
+                'status': 'success'
+            }
+
+        except Exception as e:
+            logger.error(f"品牌提及聚合分析失败: {e}")
+            return {'error': f'品牌提及分析失败: {str(e)}'}
+
+    # ------------------------------------------------------------------
+    # 2. Sentiment
+    # ------------------------------------------------------------------
+
+    def analyze_sentiment_details(self, query_filter: QueryFilter, hourly_analysis_dates: List[str] = None,
+                                  rollup_filter: Optional[QueryFilter] = None) -> Dict[str, Any]:
+        """
+        情感分析（结构同 NewDashAnalyzer.analyze_sentiment_details）
+
+        Args:
+            query_filter: DWD_AI明细表过滤条件
+            hourly_analysis_dates: 需要单独返回小时分布的日期
+            rollup_filter: 汇总表过滤条件（无关键词过滤时传入），汇总表状态不一致时自动回退明细聚合
+        """
+        try:
+            aggregates = None
+            if rollup_filter is not None:
+                aggregates = self._collect_rollup_aggregates(rollup_filter)
+            if aggregates is None:
+                aggregates = self._collect_sentiment_aggregates(query_filter)
+
+            total_count = aggregates['total_count']
+            if total_count == 0:
+                return {'error': '没有数据可供分析'}
+
+            sentiment_column = aggregates['sentiment_column']
+            if sentiment_column == 'sentiment':
+                logger.warning("AI情感分析数据不完整，使用原始情感标签")
+            logger.info(f"使用情感字段: {sentiment_column}（SQL聚合模式，数据来源：{aggregates['source']}）")
+
+            # 1. 整体情感分布
+            overall_distribution = {
+                value: count for value, count in sorted(aggregates['distribution'], key=lambda item: -item[1])
+            }
+            sentiment_counts = overall_distribution
+
+            # 2. 情感统计
+            sentiment_stats = self._build_sentiment_stats(
+                sentiment_counts, total_count, aggregates['extremely_negative_count']
+            )
+
+            # 3. AI置信度统计
+            ai_confidence_stats = {}
+            confidence_count = aggregates['confidence_count']
+            if sentiment_column == 'ai_sentiment' and confidence_count > 0:
+                low = aggregates['low_confidence_count']
+                high = aggregates['high_confidence_count']
+                ai_confidence_stats = {
+                    'mean_confidence': float(aggregates['mean_confidence']),
+                    'low_confidence_count': low,
+                    'high_confidence_count': high,
+                    'low_confidence_rate': float(low / confidence_count * 100),
+                    'confidence_distribution': {
+                        'high': high,
+                        'medium': confidence_count - low - high,
+                        'low': low
+                    }
+                }
+
+            # 4. 按时间的情感趋势
+            sentiment_trends_dict, chart_data = self._build_trend_data(aggregates['trend'])
+
+            # 5. 渠道情感对比
+            channel_sentiment_dict, channel_chart_data = self._build_channel_data(aggregates['channel'])
+
+            # 6. 典型内容样例（只取最新的3条）
+            examples = {}
+            for example_key, sentiment_value in [('high_positive', 'positive'), ('high_negative', 'negative')]:
+                examples[example_key] = self._query(
+                    f"SELECT text, {sentiment_column}, last_update, author_name, ai_confidence",
+                    self._extend_filter(query_filter, f"{sentiment_column} = %s", [sentiment_value]),
+                    "ORDER BY last_update DESC LIMIT 3"
+                )
+
+            # 7. 饼图数据
+            pie_chart_data = [
+                {'name': '正面', 'value': int(sentiment_counts.get('positive', 0)), 'sentiment': 'positive'},
+                {'name': '负面', 'value': int(sentiment_counts.get('negative', 0)), 'sentiment': 'negative'},
+                {'name': '中性', 'value': int(sentiment_counts.get('neutral', 0)), 'sentiment': 'neutral'}
+            ]
+
+            # 8. 小时分布分析
+            hourly_distribution = self._build_hourly_distribution(
+                aggregates['hourly'], hourly_analysis_dates, sentiment_column
+            )
+
+            return {
+                'overall_distribution': overall_distribution,
+                'sentiment_stats': sentiment_stats,
+                'ai_confidence_stats': ai_confidence_stats,
+                'sentiment_trends': sentiment_trends_dict,
+                'channel_sentiment': channel_sentiment_dict,
+                'examples': examples,
+                'summary': sentiment_stats,
+                'status': 'success',
+                'chart_data': {
+                    'pie_data': pie_chart_data,
+                    'trend_data': chart_data,
+                    'channel_data': channel_chart_data,
+                    'hourly_data': hourly_distribution.get('aggregated', hourly_distribution)
+                },
+                'hourly_analysis': hourly_distribution,
+                'data_source': {
+                    'sentiment_source': sentiment_column,
+                    'ai_processed_count': aggregates['ai_processed_count'],
+                    'total_count': total_count,
+                    'aggregate_source': aggregates['source']
+                }
+            }
+
+        except Exception as e:
+            logger.error(f"情感聚合分析失败: {e}")
+            return {'error': f'情感分析失败: {str(e)}'}
+
+    def _collect_sentiment_aggregates(self, query_filter: QueryFilter) -> Dict[str, Any]:
+        """在DWD_AI明细表上执行GROUP BY，收集情感分析所需的聚合数据"""
+        totals = self._query(
+            """
+            SELECT COUNT(*) AS total_count,
+                   COUNT(ai_sentiment) AS ai_sentiment_count,
+                   COALESCE(SUM(extremely_negative), 0) AS extremely_negative_count,
+                   COUNT(ai_confidence) AS confidence_count,
+                   AVG(ai_confidence) AS mean_confidence,
+                   COALESCE(SUM(CASE WHEN ai_confidence < 0.5 THEN 1 ELSE 0 END), 0) AS low_confidence_count,
+                   COALESCE(SUM(CASE WHEN ai_confidence >= 0.8 THEN 1 ELSE 0 END), 0) AS high_confidence_count,
+                   COALESCE(SUM(CASE WHEN ai_processing_status = 'completed' THEN 1 ELSE 0 END), 0) AS ai_processed_count
+            """,
+            query_filter
+        )
+        totals = totals[0] if totals else {}
+        total_count = int(totals.get('total_count') or 0)
+        if total_count == 0:
+            return {'total_count': 0}
+
+        sentiment_column = 'ai_sentiment' if int(totals['ai_sentiment_count']) > 0 else 'sentiment'
+
+        distribution_rows = self._count_by(query_filter, sentiment_column)
+        trend_rows = self._count_by(query_filter, sentiment_column, 'DATE(last_update)', 'stat_date')
+        channel_rows = self._count_by(query_filter, sentiment_column, 'channel', 'channel_name')
+        hourly_rows = self._query(
+            f"SELECT DATE(last_update) AS stat_date, HOUR(last_update) AS stat_hour, "
+            f"{sentiment_column} AS sentiment_value, COUNT(*) AS cnt",
+            self._extend_filter(query_filter, f"{sentiment_column} IS NOT NULL AND last_update IS NOT NULL"),
+            "GROUP BY stat_date, stat_hour, sentiment_value"
+        )
+
+        return {
+            'source': 'detail',
+            'total_count': total_count,
+            'sentiment_column': sentiment_column,
+            'extremely_negative_count': int(totals['extremely_negative_count']),
+            'confidence_count': int(totals['confidence_count']),
+            'mean_confidence': totals['mean_confidence'],
+            'low_confidence_count': int(totals['low_confidence_count']),
+            'high_confidence_count': int(totals['high_confidence_count']),
+            'ai_processed_count': int(totals['ai_processed_count']),
+            'distribution': [(row['sentiment_value'], int(row['cnt'])) for row in distribution_rows],
+            'trend': [(row['stat_date'], row['sentiment_value'], int(row['cnt'])) for row in trend_rows],
+            'channel': [(row['channel_name'], row['sentiment_value'], int(row['cnt'])) for row in channel_rows],
+            'hourly': [(row['stat_date'], int(row['stat_hour']), row['sentiment_value'], int(row['cnt'])) for row in hourly_rows]
+        }
+
+    def _collect_rollup_aggregates(self, rollup_filter: QueryFilter) -> Optional[Dict[str, Any]]:
+        """
+        从小时级汇总表收集情感分析所需的聚合数据
+
+        汇总表状态不一致（尚未全量重建或增量更新失败）或没有AI情感结果时返回None，由调用方回退明细聚合；
+        总数取汇总表自身的评论数，不再统计明细表
+        """
+        if not self.is_rollup_consistent():
+            logger.info("情感汇总表未标记为一致（需全量重建），回退明细聚合")
+            return None
+
+        try:
+            rows = self._query(
+                """
+                SELECT stat_date, stat_hour, channel, ai_sentiment,
+                       SUM(comment_count) AS cnt,
+                       SUM(CASE WHEN extremely_negative = 1 THEN comment_count ELSE 0 END) AS extremely_negative_count,
+                       SUM(confidence_count) AS confidence_count,
+                       SUM(confidence_sum) AS confidence_sum,
+                       SUM(low_confidence_count) AS low_confidence_count,
+                       SUM(high_confidence_count) AS high_confidence_count
+                """,
+                rollup_filter,
+                "GROUP BY stat_date, stat_hour, channel, ai_sentiment",
+                table=self.ROLLUP_TABLE
+            )
+        except Exception as e:
+            logger.warning(f"读取情感汇总表失败，回退明细聚合: {e}")
+            return None
+
+        total_count = sum(int(row['cnt']) for row in rows)
+        ai_sentiment_count = sum(int(row['cnt']) for row in rows if row['ai_sentiment'])
+        if ai_sentiment_count == 0:
+            logger.info(f"情感汇总表在该范围内没有AI情感结果（汇总{total_count}条），回退明细聚合")
+            return None
+
+        distribution: Dict[str, int] = {}
+        trend: Dict[Tuple[Any, str], int] = {}
+        channel: Dict[Tuple[Any, str], int] = {}
+        hourly: Dict[Tuple[Any, int, str], int] = {}
+        confidence_count = 0
+        confidence_sum = 0.0
+        low_confidence_count = 0
+        high_confidence_count = 0
+        extremely_negative_count = 0
+
+        for row in rows:
+            count = int(row['cnt'])
+            extremely_negative_count += int(row['extremely_negative_count'] or 0)
+            confidence_count += int(row['confidence_count'] or 0)
+            confidence_sum += float(row['confidence_sum'] or 0)
+            low_confidence_count += int(row['low_confidence_count'] or 0)
+            high_confidence_count += int(row['high_confidence_count'] or 0)
+
+            sentiment = row['ai_sentiment']
+            if not sentiment:
+                continue
+            distribution[sentiment] = distribution.get(sentiment, 0) + count
+            trend_key = (row['stat_date'], sentiment)
+            trend[trend_key] = trend.get(trend_key, 0) + count
+            if row['channel']:
+                channel_key = (row['channel'], sentiment)
+                channel[channel_key] = channel.get(channel_key, 0) + count
+            hourly_key = (row['stat_date'], int(row['stat_hour']), sentiment)
+            hourly[hourly_key] = hourly.get(hourly_key, 0) + count
+
+        return {
+            'source': 'rollup',
+            'total_count': total_count,
+            'sentiment_column': 'ai_sentiment',
+            'extremely_negative_count': extremely_negative_count,
+            'confidence_count': confidence_count,
+            'mean_confidence': confidence_sum / confidence_count if confidence_count else None,
+            'low_confidence_count': low_confidence_count,
+            'high_confidence_count': high_confidence_count,
+            # 汇总表只从DWD_AI层（AI处理已完成）写入
+            'ai_processed_count': total_count,
+            'distribution': list(distribution.items()),
+            'trend': [(stat_date, sentiment, count) for (stat_date, sentiment), count in trend.items()],
+            'channel': [(channel_name, sentiment, count) for (channel_name, sentiment), count in channel.items()],
+            'hourly': [(stat_date, hour, sentiment, count) for (stat_date, hour, sentiment), count in hourly.items()]
+        }
+
+    @staticmethod
+    def _build_sentiment_stats(sentiment_counts: Dict[str, int], total_count: int,
+                               extremely_negative_count: int) -> Dict[str, Any]:
+        """构建情感统计"""
+        return {
+            'total_comments': total_count,
+            'positive_count': int(sentiment_counts.get('positive', 0)),
+            'negative_count': int(sentiment_counts.get('negative', 0)),
+            'neutral_count': int(sentiment_counts.get('neutral', 0)),
+            'positive_rate': (sentiment_counts.get('positive', 0) / total_count * 100) if total_count > 0 else 0,
+            'negative_rate': (sentiment_counts.get('negative', 0) / total_count * 100) if total_count > 0 else 0,
+            'neutral_rate': (sentiment_counts.get('neutral', 0) / total_count * 100) if total_count > 0 else 0,
+            'extremely_negative_count': extremely_negative_count,
+            'extremely_negative_rate': (extremely_negative_count / total_count * 100) if total_count > 0 else 0
+        }
+
+    @staticmethod
+    def _pivot(rows: List[Tuple[Any, str, int]]) -> Tuple[List[Any], List[str], Dict[Any, Dict[str, int]]]:
+        """把 (分组值, 情感值, 数量) 透视为 {分组值: {情感值: 数量}}，缺失的情感补0（同 unstack(fill_value=0)）"""
+        group_values = sorted({row[0] for row in rows})
+        sentiment_values = sorted({row[1] for row in rows})
+        table = {group: {sentiment: 0 for sentiment in sentiment_values} for group in group_values}
+        for group, sentiment, count in rows:
+            table[group][sentiment] += count
+        return group_values, sentiment_values, table
+
+    def _build_trend_data(self, rows: List[Tuple[Any, str, int]]) -> Tuple[Dict[str, Any], Dict[str, List]]:
+        """构建情感趋势（字典 + ECharts格式）"""
+        dates, _, table = self._pivot(rows)
+        sentiment_trends_dict = {}
+        chart_data = {'dates': [], 'positive': [], 'negative': [], 'neutral': []}
+
+        for stat_date in dates:
+            date_str = str(stat_date)
+            row = table[stat_date]
+            sentiment_trends_dict[date_str] = row
+            chart_data['dates'].append(date_str)
+            for sentiment in SENTIMENT_VALUES:
+                chart_data[sentiment].append(int(row.get(sentiment, 0)))
+
+        return sentiment_trends_dict, chart_data
+
+    def _build_channel_data(self, rows: List[Tuple[Any, str, int]]) -> Tuple[Dict[str, Any], Dict[str, List]]:
+        """构建渠道情感对比（字典 + 图表格式）"""
+        channels, _, table = self._pivot(rows)
+        channel_sentiment_dict = {}
+        channel_chart_data = {'channels': [], 'data': []}
+
+        for channel in channels:
+            row = table[channel]
+            channel_sentiment_dict[channel] = row
+            channel_chart_data['channels'].append(channel)
+            channel_chart_data['data'].append({
+                'channel': channel,
+                'positive': int(row.get('positive', 0)),
+                'negative': int(row.get('negative', 0)),
+                'neutral': int(row.get('neutral', 0)),
+                'total': int(sum(row.values()))
+            })
+
+        return channel_sentiment_dict, channel_chart_data
+
+    @staticmethod
+    def _empty_hourly() -> Dict[str, List[int]]:
+        return {
+            'hours': list(range(24)),
+            'positive': [0] * 24,
+            'negative': [0] * 24,
+            'neutral': [0] * 24
+        }
+
+    def _build_hourly_distribution(self, rows: List[Tuple[Any, int, str, int]],
+                                   hourly_analysis_dates: List[str] = None,
+                                   sentiment_column: str = 'ai_sentiment') -> Dict[str, Any]:
+        """由 (日期, 小时, 情感, 数量) 构建24小时分布（结构同 _calculate_hourly_distribution）"""
+        if not rows:
+            return {'aggregated': self._empty_hourly(), 'by_date': {}}
+
+        aggregated = self._empty_hourly()
+        per_date: Dict[Any, Dict[str, List[int]]] = {}
+        for stat_date, hour, sentiment, count in rows:
+            if sentiment in SENTIMENT_VALUES and 0 <= hour < 24:
+                aggregated[sentiment][hour] += count
+                per_date.setdefault(stat_date, self._empty_hourly())[sentiment][hour] += count
+            else:
+                per_date.setdefault(stat_date, self._empty_hourly())
+
+        by_date_distribution = {}
+        if hourly_analysis_dates:
+            # 如果指定了日期，只返回这些日期的分布
+            for date_str in hourly_analysis_dates:
+                try:
+                    target_date = pd.to_datetime(date_str).date()
+                    by_date_distribution[date_str] = per_date.get(target_date, self._empty_hourly())
+                except Exception as e:
+                    logger.warning(f"处理日期 {date_str} 时出错: {e}")
+                    continue
+        else:
+            for stat_date in sorted(per_date.keys()):
+                by_date_distribution[str(stat_date)] = per_date[stat_date]
+
+        return {
+            'aggregated': aggregated,
+            'by_date': by_date_distribution,
+            'sentiment_source': sentiment_column
+        }
+
+    # ------------------------------------------------------------------
+    # 3. Bad Case
+    # ------------------------------------------------------------------
+
+    def analyze_bad_cases(self, query_filter: QueryFilter) -> Dict[str, Any]:
+        """极端负面评论分析（结构同 NewDashAnalyzer.analyze_bad_cases，只拉取极端负面明细行）"""
+        try:
+            totals = self._query(
+                "SELECT COUNT(*) AS total_count, COUNT(ai_sentiment) AS ai_sentiment_count, "
+                "COALESCE(SUM(CASE WHEN ai_processing_status = 'completed' THEN 1 ELSE 0 END), 0) AS ai_processed_count",
+                query_filter
+            )
+            total_comments = int(totals[0]['total_count']) if totals else 0
+            if total_comments == 0:
+                return {'error': '没有数据可供分析'}
+
+            sentiment_column = 'ai_sentiment' if int(totals[0]['ai_sentiment_count']) > 0 else 'sentiment'
+            ai_processed_count = int(totals[0]['ai_processed_count'])
+            negative_filter = self._extend_filter(query_filter, f"{sentiment_column} = 'negative'")
+
+            # 负面评论统计
+            negative_rows = self._query(
+                """
+                SELECT COUNT(*) AS negative_count,
+                       COUNT(ai_confidence) AS confidence_count,
+                       AVG(ai_confidence) AS mean_confidence,
+                       COALESCE(SUM(CASE WHEN ai_confidence < 0.5 THEN 1 ELSE 0 END), 0) AS low_confidence_count,
+                       COALESCE(SUM(CASE WHEN ai_confidence >= 0.8 THEN 1 ELSE 0 END), 0) AS high_confidence_count
+                """,
+                negative_filter
+            )[0]
+            total_negative_count = int(negative_rows['negative_count'])
+
+            # 极端负面评论明细（按时间降序）
+            extreme_rows = self._query(
+                f"SELECT author_name, channel, last_update, text, {sentiment_column}, ai_confidence",
+                self._extend_filter(negative_filter, 'extremely_negative = 1'),
+                "ORDER BY last_update DESC"
+            )
+            extreme_negative_comments = pd.DataFrame(extreme_rows)
+            logger.info(f"应用extremely_negative字段筛选：{total_negative_count}条负面评论中，{len(extreme_negative_comments)}条为极端负面评论")
+
+            if extreme_negative_comments.empty:
+                return {
+                    'extreme_negative_comments': {
+                        'count': 0,
+                        'details': []
+                    },
+                    'summary': {
+                        'total_comments': total_comments,
+                        'total_negative_count': total_negative_count,
+                        'extreme_negative_count': 0,
+                        'extreme_negative_percentage': 0
+                    },
+                    'data_source': {
+                        'sentiment_source': sentiment_column,
+                        'ai_processed_count': ai_processed_count
+                    },
+                    'status': 'success'
+                }
+
+            extreme_negative_comments['last_update'] = pd.to_datetime(extreme_negative_comments['last_update'], errors='coerce')
+
+            extreme_negative_details = []
+            for _, comment in extreme_negative_comments.iterrows():
+                comment_detail = {
+                    'user': comment['author_name'],
+                    'platform': comment['channel'],
+                    'time': comment['last_update'].isoformat() if pd.notna(comment['last_update']) else '',
+                    'content': comment['text'],
+                    'sentiment': comment[sentiment_column],
+                }
+                if sentiment_column == 'ai_sentiment' and pd.notna(comment['ai_confidence']):
+                    comment_detail['confidence'] = float(comment['ai_confidence'])
+                extreme_negative_details.append(comment_detail)
+
+            extreme_negative_count = len(extreme_negative_comments)
+            extreme_negative_percentage = (extreme_negative_count / total_comments) * 100 if total_comments > 0 else 0
+
+            # 按用户统计极端负面评论
+            user_extreme_stats = extreme_negative_comments.groupby('author_name').agg({
+                'text': 'count',
+                'last_update': ['min', 'max'],
+                'channel': lambda x: list(x.unique())
+            }).reset_index()
+            user_extreme_stats.columns = ['user', 'extreme_negative_count', 'first_extreme', 'last_extreme', 'platforms']
+            user_extreme_stats = user_extreme_stats.sort_values('extreme_negative_count', ascending=False)
+
+            # 按平台统计极端负面评论
+            platform_extreme_stats = extreme_negative_comments.groupby('channel').agg({
+                'text': 'count',
+                'author_name': lambda x: len(x.unique())
+            }).reset_index()
+            platform_extreme_stats.columns = ['platform', 'extreme_negative_count', 'unique_users']
+            platform_extreme_stats = platform_extreme_stats.sort_values('extreme_negative_count', ascending=False)
+
+            # AI分析质量统计
+            ai_quality_stats = {}
+            confidence_count = int(negative_rows['confidence_count'])
+            if sentiment_column == 'ai_sentiment' and confidence_count > 0:
+                extreme_confidence_data = extreme_negative_comments['ai_confidence'].dropna().astype(float)
+                ai_quality_stats = {
+                    'avg_confidence_all_negative': float(negative_rows['mean_confidence']),
+                    'avg_confidence_extreme': float(extreme_confidence_data.mean()) if not extreme_confidence_data.empty else 0,
+                    'low_confidence_negative_count': int(negative_rows['low_confidence_count']),
+                    'high_confidence_negative_count': int(negative_rows['high_confidence_count']),
+                    'filter_method': 'extremely_negative_field',
+                    'filtered_out_count': total_negative_count - extreme_negative_count
+                }
+
+            return {
+                'extreme_negative_comments': {
+                    'count': extreme_negative_count,
+                    'details': extreme_negative_details,
+                    'user_stats': user_extreme_stats.to_dict('records'),
+                    'platform_stats': platform_extreme_stats.to_dict('records')
+                },
+                'summary': {
+                    'total_comments': total_comments,
+                    'total_negative_count': total_negative_count,
+                    'extreme_negative_count': extreme_negative_count,
+                    'extreme_negative_percentage': round(extreme_negative_percentage, 2),
+                    'unique_extreme_users': int(extreme_negative_comments['author_name'].nunique()),
+                    'platforms_with_extreme': int(extreme_negative_comments['channel'].nunique())
+                },
+                'ai_quality_stats': ai_quality_stats,
+                'data_source': {
+                    'sentiment_source': sentiment_column,
+                    'ai_processed_count': ai_processed_count,
+                    'total_count': total_comments
+                },
+                'status': 'success'
+            }
+
+        except Exception as e:
+            logger.error(f"极端负面评论聚合分析失败: {e}")
+            return {'error': f'极端负面评论分析失败: {str(e)}'}
@@ -4,38 +4,144 @@ ETL处理器
 实现ODS层到DWD层的数据处理，以及DWD层到DWD_AI层的数据流转
 """
 
+import os
 import logging
 import uuid
 import hashlib
-from datetime import datetime, date
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, date, timedelta
 from typing import Dict, Any, List, Tuple, Optional
 import pandas as pd
 
 from models.new_dash_social_model import (
-    ODSDashSocialComment, DWDDashSocialComment, DWDAIDashSocialComment, ETLProcessingLog
+    ODSDashSocialComment, DWDAIDashSocialComment, ETLProcessingLog
 )
 from config.database_config import get_db_config
 
 logger = logging.getLogger(__name__)
 
+# pandas 2.x 整列解析混合格式时需显式 format='mixed'（逐值推断），1.x 默认即逐值推断
+_MIXED_DATETIME_KWARGS = {'format': 'mixed'} if int(pd.__version__.split('.')[0]) >= 2 else {}
+
 class ETLProcessor:
     """ETL处理器 - 负责数据层间的处理和转换"""
     
+    # 去重键批量存在性查询的分块大小（每块一条 IN 查询）
+    DEDUPE_LOOKUP_CHUNK_SIZE = 1000
+    
+    # DWD批量写入的分块大小（每块一条多行INSERT、一个事务）
+    DWD_INSERT_CHUNK_SIZE = 500
+    
+    # 有效的日期时间格式（YYYY-MM-DD / DD-MM-YYYY，可带 HH:MM 或 HH:MM:SS），整列一次匹配
+    VALID_DATETIME_PATTERN = (
+        r'^(?:\d{4}[-/]\d{1,2}[-/]\d{1,2}|\d{1,2}[-/]\d{1,2}[-/]\d{4})'
+        r'(?:\s+\d{1,2}:\d{1,2}(?::\d{1,2})?)?$'
+    )
+    
+    # DWD批量插入的列顺序
+    DWD_INSERT_COLUMNS = [
+        'source_record_id', 'last_update', 'brand_label', 'author_name', 'channel',
+        'message_type', 'text', 'tags', 'post_link', 'sentiment', 'caption',
+        'upload_batch_id', 'original_row_index', 'dedupe_date', 'dedupe_key',
+        'is_latest_in_group', 'source_count', 'ai_processing_status',
+        'extreme_negative_processing_status', 'processed_at', 'created_at'
+    ]
+    
+    # ODS → DWD 增量处理在检查点表中的流水线名称
+    ODS_TO_DWD_CHECKPOINT = 'ods_to_dwd'
+    
+    # 按记录ID标记ODS已处理时每条 UPDATE ... IN 的ID数
+    ODS_MARK_CHUNK_SIZE = 1000
+    
+    # 分区处理时按 record_id 分页读取ODS的每页行数
+    PARTITION_FETCH_PAGE_SIZE = 10000
+    
+    # DWD → DWD_AI 服务端同步的分块大小（每块一条 INSERT ... SELECT、一个事务）
+    AI_PROMOTION_CHUNK_SIZE = 1000
+    
+    # DWD → DWD_AI 服务端同步语句：直接复制AI分析和极端负面分析都已完成、且尚未同步的DWD记录
+    AI_PROMOTION_INSERT_SQL = """
+        INSERT IGNORE INTO dwd_dash_social_comments_ai
+        (dwd_record_id, last_update, brand_label, author_name, channel,
+         message_type, text, tags, post_link, sentiment, caption,
+         upload_batch_id, original_row_index, dedupe_date, source_count,
+         ai_sentiment, ai_confidence, ai_processed_at, ai_processing_status,
+         ai_analysis_batch_id, extremely_negative, created_at)
+        SELECT d.record_id, d.last_update, d.brand_label, d.author_name, d.channel,
+               d.message_type, d.text, d.tags, d.post_link, d.sentiment, d.caption,
+               d.upload_batch_id, d.original_row_index, d.dedupe_date, d.source_count,
+               d.ai_sentiment, d.ai_confidence, d.ai_processed_at, 'completed',
+               %s, COALESCE(d.extremely_negative, 0), NOW()
+        FROM dwd_dash_social_comments d
+        LEFT JOIN dwd_dash_social_comments_ai ai ON d.record_id = ai.dwd_record_id
+        WHERE ai.dwd_record_id IS NULL
+          AND d.ai_processing_status = 'completed'
+          AND d.extreme_negative_processing_status = 'completed'
+        ORDER BY d.record_id ASC
+        LIMIT %s
+    """
+    
+    # DWD_AI → 小时级情感汇总表的聚合语句（WHERE条件由调用方拼接）
+    SENTIMENT_ROLLUP_NAME = 'dws_dash_social_sentiment_hourly'
+    SENTIMENT_ROLLUP_INSERT_SQL = """
+        INSERT INTO dws_dash_social_sentiment_hourly
+        (stat_date, stat_hour, channel, brand_label, ai_sentiment, extremely_negative,
+         comment_count, confidence_count, confidence_sum, low_confidence_count, high_confidence_count)
+        SELECT DATE(last_update), HOUR(last_update),
+               COALESCE(channel, ''), COALESCE(brand_label, ''), COALESCE(ai_sentiment, ''),
+               COALESCE(extremely_negative, 0),
+               COUNT(*), COUNT(ai_confidence), COALESCE(SUM(ai_confidence), 0),
+               SUM(CASE WHEN ai_confidence < 0.5 THEN 1 ELSE 0 END),
+               SUM(CASE WHEN ai_confidence >= 0.8 THEN 1 ELSE 0 END)
+        FROM dwd_dash_social_comments_ai
+        WHERE last_update IS NOT NULL AND {condition}
+        GROUP BY DATE(last_update), HOUR(last_update), COALESCE(channel, ''), COALESCE(brand_label, ''),
+                 COALESCE(ai_sentiment, ''), COALESCE(extremely_negative, 0)
+        ON DUPLICATE KEY UPDATE
+            comment_count = comment_count + VALUES(comment_count),
+            confidence_count = confidence_count + VALUES(confidence_count),
+            confidence_sum = confidence_sum + VALUES(confidence_sum),
+            low_confidence_count = low_confidence_count + VALUES(low_confidence_count),
+            high_confidence_count = high_confidence_count + VALUES(high_confidence_count)
+    """
+    
     def __init__(self):
         self.db_config = get_db_config()
+        # DWD → DWD_AI 同步方式：sql（服务端 INSERT ... SELECT）/ python（逐条读取后写入）
+        self.ai_sync_mode = os.getenv('DWD_AI_SYNC_MODE', 'sql').strip().lower()
+        # ODS → DWD 是否按 record_id 水位增量处理
+        self.incremental_mode = os.getenv('ETL_INCREMENTAL_MODE', 'true').strip().lower() not in ('0', 'false', 'no', 'off')
+        # 完整流水线单次调用最多执行的批次数（超出部分由下一次调用继续）
+        self.pipeline_max_steps = int(os.getenv('ETL_PIPELINE_MAX_STEPS', 20))
+        # 分区并行处理的进程数
+        self.partition_workers = int(os.getenv('ETL_PARTITION_WORKERS', min(os.cpu_count() or 1, 8)))
+        # 增量处理时每次补处理水位以下遗漏记录的最大行数（0 表示不补处理）
+        self.catchup_batch_size = int(os.getenv('ETL_CATCHUP_BATCH_SIZE', 1000))
     
-    def process_ods_to_dwd(self, batch_size: int = 1000, force_reprocess: bool = False) -> Dict[str, Any]:
+    def process_ods_to_dwd(self, batch_size: int = 1000, force_reprocess: bool = False,
+                           incremental: bool = None) -> Dict[str, Any]:
         """
         ODS到DWD的ETL处理
         
+        增量模式下从检查点表读取 record_id 水位，处理水位之后连续的一段记录；
+        只有该范围的DWD写入全部成功后，才在同一事务中按范围标记ODS已处理并推进水位，
+        失败的范围在下次调用时整体重试（去重键 + INSERT IGNORE 保证重试幂等）；
+        每次增量处理前先有界地补处理水位以下仍未处理的记录（见 _process_ods_below_watermark）
+        
         Args:
             batch_size: 批处理大小
-            force_reprocess: 是否强制重新处理已处理的数据
+            force_reprocess: 是否强制重新处理已处理的数据（不走增量模式）
+            incremental: 是否增量处理，默认读取环境变量 ETL_INCREMENTAL_MODE
             
         Returns:
             处理结果统计
         """
         try:
+            incremental = (self.incremental_mode if incremental is None else incremental) and not force_reprocess
+            watermark = None
+            catchup = None
+
             # 生成处理批次ID
             batch_id = f"ods_to_dwd_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
             
@@ -51,9 +157,15 @@ class ETLProcessor:
             
             self._save_etl_log(etl_log)
             
-            # 1. 获取待处理的ODS数据
-            condition = "processed_flag = 0" if not force_reprocess else "1=1"
-            ods_data = self._fetch_ods_data(condition, batch_size)
+            # 1. 获取待处理的ODS数据（增量模式取水位之后连续的一段记录）
+            if incremental:
+                watermark = self._get_etl_watermark(self.ODS_TO_DWD_CHECKPOINT)
+                catchup = self._process_ods_below_watermark(watermark, batch_id)
+                # 已由分区并行回填处理过的记录直接跳过
+                condition, params = "record_id > %s AND processed_flag = 0", (int(watermark),)
+            else:
+                condition, params = ("processed_flag = 0" if not force_reprocess else "1=1"), ()
+            ods_data = self._fetch_ods_data(condition, batch_size, params)
             
             if not ods_data:
                 etl_log.status = 'completed'
@@ -71,7 +183,11 @@ class ETLProcessor:
                     'processed_records': 0,
                     'success_records': 0,
                     'failed_records': 0,
-                    'duplicate_records': 0
+                    'duplicate_records': 0,
+                    'incremental': incremental,
+                    'watermark': watermark,
+                    'catchup': catchup,
+                    'has_more': bool(catchup and catchup['has_more'])
                 }
             
             etl_log.total_source_records = len(ods_data)
@@ -82,12 +198,24 @@ class ETLProcessor:
             # 3. 保存到DWD表
             success_count, failed_count = self._save_dwd_records(dwd_records, batch_id)
             
-            # 4. 更新ODS处理标记
-            processed_ods_ids = [record['record_id'] for record in ods_data]
-            self._mark_ods_processed(processed_ods_ids)
+            # 4. 更新ODS处理标记（有写入失败或去重异常时不标记，下次重新处理）
+            range_succeeded = failed_count == 0 and not stats.get('error')
+            range_end = max(record['record_id'] for record in ods_data)
+            watermark_committed = False
+            if incremental:
+                if range_succeeded:
+                    watermark_committed = self._commit_ods_range(
+                        watermark, range_end, batch_id, [record['record_id'] for record in ods_data]
+                    )
+            elif range_succeeded:
+                processed_ods_ids = [record['record_id'] for record in ods_data]
+                self._mark_ods_processed(processed_ods_ids)
             
             # 5. 更新ETL日志
-            etl_log.status = 'completed' if failed_count == 0 else 'partial'
+            range_committed = watermark_committed if incremental else range_succeeded
+            etl_log.status = 'completed' if failed_count == 0 and range_committed else 'partial'
+            if not range_committed:
+                etl_log.error_message = stats.get('error') or '本批次存在写入失败，ODS记录未标记为已处理，将在下次处理时重试'
             etl_log.end_time = datetime.now()
             etl_log.duration_seconds = int((etl_log.end_time - etl_log.start_time).total_seconds())
             etl_log.processed_records = len(dwd_records)
@@ -110,8 +238,19 @@ class ETLProcessor:
                 'duplicate_records': stats['duplicate_count'],
                 'filtered_empty_text_records': stats.get('filtered_empty_text', 0),
                 'filtered_invalid_date_records': stats.get('filtered_invalid_date', 0),
-                'duration_seconds': etl_log.duration_seconds
+                'duration_seconds': etl_log.duration_seconds,
+                'incremental': incremental,
+                # 只有本批次成功提交且取满一批时才可能还有待处理数据，失败时由调用方决定何时重试
+                'has_more': (range_committed and len(ods_data) >= batch_size) or bool(catchup and catchup['has_more'])
             }
+            if incremental:
+                result.update({
+                    'catchup': catchup,
+                    'range_start': watermark + 1,
+                    'range_end': range_end,
+                    'watermark': range_end if watermark_committed else watermark,
+                    'watermark_committed': watermark_committed
+                })
             
             logger.info(f"ODS到DWD处理完成：{result}")
             return result
@@ -133,100 +272,331 @@ class ETLProcessor:
                 'error': error_msg
             }
     
-    def _fetch_ods_data(self, condition: str, limit: int) -> List[Dict[str, Any]]:
-        """获取ODS数据 - 获取所有原始数据，验证由ETL过程负责"""
+    def process_ods_to_dwd_partitioned(self, start_date: str = None, end_date: str = None,
+                                       workers: int = None, partition_days: int = 1,
+                                       progress_callback=None) -> Dict[str, Any]:
+        """
+        按 DATE(last_update) 分区并行处理ODS到DWD（用于历史数据回填）
+        
+        去重键包含日期，分区之间不会产生跨分区的重复组，因此每个分区可在独立进程中
+        完成清洗、去重和写入（各进程使用自己的数据库连接池），各分区统计合并为一条ETL日志
+        
+        Args:
+            start_date: 开始日期（YYYY-MM-DD），为空表示不限
+            end_date: 结束日期（YYYY-MM-DD），为空表示不限
+            workers: 并行进程数，默认读取环境变量 ETL_PARTITION_WORKERS
+            partition_days: 每个分区包含的天数
+            progress_callback: 每个分区结束后调用 progress_callback(已完成分区数, 总分区数)
+            
+        Returns:
+            合并后的处理结果统计
+        """
         try:
-            sql = f"""
-                SELECT record_id, last_update, brand_label, author_name, channel, 
-                       message_type, text, tags, post_link, sentiment, caption, 
-                       upload_batch_id, original_row_index, processed_at, created_at
-                FROM ods_dash_social_comments 
-                WHERE {condition}
-                ORDER BY record_id ASC
-                LIMIT {limit}
-            """
+            batch_id = f"ods_to_dwd_part_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
             
-            result = self.db_config.execute_query_dict(sql)
-            logger.info(f"获取到 {len(result) if result else 0} 条ODS原始数据")
+            etl_log = ETLProcessingLog(
+                process_type='ods_to_dwd',
+                batch_id=batch_id,
+                source_table='ods_dash_social_comments',
+                target_table='dwd_dash_social_comments',
+                start_time=datetime.now(),
+                status='processing'
+            )
             
-            return result or []
+            self._save_etl_log(etl_log)
+            
+            # 1. 按日期切分待处理的ODS数据
+            partitions = self._plan_ods_partitions(start_date, end_date, max(1, int(partition_days)))
+            workers = max(1, min(int(workers or self.partition_workers), len(partitions) or 1))
+            logger.info(f"ODS分区并行处理：{len(partitions)} 个分区，{workers} 个进程")
+            
+            # 2. 多进程处理各分区（spawn方式启动，子进程不继承父进程的数据库连接）
+            partition_results = []
+            if partitions:
+                with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+                    futures = {
+                        executor.submit(_process_ods_partition, partition_start, partition_end, batch_id): (partition_start, partition_end)
+                        for partition_start, partition_end in partitions
+                    }
+                    for future in as_completed(futures):
+                        partition_start, partition_end = futures[future]
+                        try:
+                            partition_results.append(future.result())
+                        except Exception as e:
+                            logger.error(f"ODS分区 {partition_start} ~ {partition_end} 处理进程异常：{e}")
+                            partition_results.append({
+                                'partition_start': partition_start,
+                                'partition_end': partition_end,
+                                'status': 'failed',
+                                'error': str(e)
+                            })
+                        if progress_callback:
+                            progress_callback(len(partition_results), len(partitions))
+            
+            # 3. 合并统计
+            stat_keys = ['total_source_records', 'processed_records', 'success_records', 'failed_records',
+                         'duplicate_records', 'filtered_empty_text_records', 'filtered_invalid_date_records']
+            totals = {key: sum(r.get(key, 0) for r in partition_results) for key in stat_keys}
+            failed_partitions = [r for r in partition_results if r.get('status') != 'completed']
+            
+            # 全量回填且所有分区成功时，last_update 为空的记录无法进入任何分区，直接按时间无效标记为已处理
+            if not start_date and not end_date and not failed_partitions:
+                null_date_count = self._mark_null_date_ods_processed()
+                totals['total_source_records'] += null_date_count
+                totals['filtered_invalid_date_records'] += null_date_count
+            
+            etl_log.status = 'completed' if not failed_partitions else ('partial' if totals['success_records'] > 0 else 'failed')
+            etl_log.end_time = datetime.now()
+            etl_log.duration_seconds = int((etl_log.end_time - etl_log.start_time).total_seconds())
+            etl_log.total_source_records = totals['total_source_records']
+            etl_log.processed_records = totals['processed_records']
+            etl_log.success_records = totals['success_records']
+            etl_log.failed_records = totals['failed_records']
+            etl_log.duplicate_records = totals['duplicate_records']
+            etl_log.filtered_empty_text_records = totals['filtered_empty_text_records']
+            etl_log.filtered_invalid_date_records = totals['filtered_invalid_date_records']
+            if failed_partitions:
+                etl_log.error_message = '; '.join(
+                    f"{r['partition_start']}~{r['partition_end']}: {r.get('error', '存在写入失败')}" for r in failed_partitions
+                )
+            
+            self._update_etl_log(etl_log)
+            
+            result = {
+                'batch_id': batch_id,
+                'status': etl_log.status,
+                'message': f"分区并行ETL处理完成：{len(partitions)}个分区（失败{len(failed_partitions)}个），"
+                           f"成功{totals['success_records']}条，失败{totals['failed_records']}条，去重{totals['duplicate_records']}条",
+                **totals,
+                'duplicate_count': totals['duplicate_records'],
+                'partition_count': len(partitions),
+                'failed_partition_count': len(failed_partitions),
+                'workers': workers,
+                'partitions': sorted(partition_results, key=lambda r: r['partition_start']),
+                'duration_seconds': etl_log.duration_seconds
+            }
+            
+            logger.info(f"ODS分区并行处理完成：{result['message']}")
+            return result
             
         except Exception as e:
-            logger.error(f"获取ODS数据失败：{e}")
+            error_msg = f"ODS分区并行处理失败：{str(e)}"
+            logger.error(error_msg)
+            
+            if 'etl_log' in locals():
+                etl_log.status = 'failed'
+                etl_log.error_message = error_msg
+                etl_log.end_time = datetime.now()
+                self._update_etl_log(etl_log)
+            
+            return {
+                'batch_id': batch_id if 'batch_id' in locals() else 'unknown',
+                'status': 'failed',
+                'error': error_msg
+            }
+    
+    def _plan_ods_partitions(self, start_date: str, end_date: str, partition_days: int) -> List[Tuple[str, str]]:
+        """
+        统计待处理ODS数据涉及的日期，按 partition_days 天切分为 [开始日期, 结束日期) 区间
+        """
+        conditions = ['processed_flag = 0', 'last_update IS NOT NULL']
+        params = []
+        if start_date:
+            conditions.append('last_update >= %s')
+            params.append(start_date)
+        if end_date:
+            conditions.append('last_update < DATE_ADD(%s, INTERVAL 1 DAY)')
+            params.append(end_date)
+        
+        sql = f"""
+            SELECT DISTINCT DATE(last_update) AS stat_date
+            FROM ods_dash_social_comments
+            WHERE {' AND '.join(conditions)}
+            ORDER BY stat_date
+        """
+        rows = self.db_config.execute_query_dict(sql, tuple(params)) or []
+        dates = [row['stat_date'] if isinstance(row['stat_date'], date) else pd.to_datetime(row['stat_date']).date()
+                 for row in rows if row['stat_date'] is not None]
+        if not dates:
             return []
+        
+        partitions = {}
+        for stat_date in dates:
+            window_start = dates[0] + timedelta(days=((stat_date - dates[0]).days // partition_days) * partition_days)
+            partitions[window_start] = window_start + timedelta(days=partition_days)
+        
+        return [(start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')) for start, end in sorted(partitions.items())]
     
-    def _clean_datetime_field(self, series: pd.Series) -> pd.Series:
+    def _process_ods_below_watermark(self, watermark: int, batch_id: str) -> Dict[str, Any]:
         """
-        ETL层时间字段清洗：严格验证和转换时间格式
-        无效时间将被设置为None，由后续流程过滤
+        补处理 record_id 不大于水位、但仍未处理的ODS记录
         
-        Args:
-            series: pandas Series包含时间数据
+        并发上传交错提交、或 TiDB 自增ID不保证单调时，较小 record_id 的记录可能在水位推进之后才提交，
+        增量范围不会再覆盖它们；每次最多处理 catchup_batch_size 条，写入全部成功后按记录ID标记已处理
+        """
+        result = {
+            'total_source_records': 0,
+            'success_records': 0,
+            'failed_records': 0,
+            'has_more': False
+        }
+        if self.catchup_batch_size <= 0 or watermark <= 0:
+            return result
+        
+        try:
+            ods_data = self._fetch_ods_data("record_id <= %s AND processed_flag = 0",
+                                            self.catchup_batch_size, (int(watermark),))
+            if not ods_data:
+                return result
             
-        Returns:
-            清洗后的Series，无效时间为None
+            logger.warning(f"发现 {len(ods_data)} 条水位（{watermark}）以下未处理的ODS记录，开始补处理")
+            dwd_records, stats = self._deduplicate_ods_data(ods_data)
+            success_count, failed_count = self._save_dwd_records(dwd_records, batch_id)
+            result.update({
+                'total_source_records': len(ods_data),
+                'success_records': success_count,
+                'failed_records': failed_count
+            })
+            
+            if failed_count or stats.get('error'):
+                result['error'] = stats.get('error') or f'{failed_count}条记录写入失败，将在下次处理时重试'
+                return result
+            
+            self._mark_ods_processed([record['record_id'] for record in ods_data])
+            result['has_more'] = len(ods_data) >= self.catchup_batch_size
+            return result
+            
+        except Exception as e:
+            logger.error(f"补处理水位以下的ODS记录失败：{e}")
+            result['error'] = str(e)
+            return result
+    
+    def _process_partition(self, partition_start: str, partition_end: str, batch_id: str) -> Dict[str, Any]:
         """
-        import re
+        处理单个日期分区（在子进程中执行）：读取分区内全部待处理ODS数据，清洗、去重、写入DWD，
+        全部写入成功后按分区条件标记ODS已处理
         
-        def is_valid_datetime_format(value):
-            """检查是否为有效的日期时间格式"""
-            if pd.isna(value) or value is None:
-                return False
-                
-            value_str = str(value).strip()
-            if not value_str or value_str.lower() in ['nan', 'none', '', 'null']:
-                return False
-            
-            # 定义有效的日期时间格式正则表达式
-            valid_patterns = [
-                # 完整日期时间格式
-                r'^\d{4}[-/]\d{1,2}[-/]\d{1,2}\s+\d{1,2}:\d{1,2}:\d{1,2}$',  # 2024-01-01 12:34:56
-                r'^\d{4}[-/]\d{1,2}[-/]\d{1,2}\s+\d{1,2}:\d{1,2}$',           # 2024-01-01 12:34
-                r'^\d{4}[-/]\d{1,2}[-/]\d{1,2}$',                              # 2024-01-01
-                # 允许的其他格式
-                r'^\d{1,2}[-/]\d{1,2}[-/]\d{4}\s+\d{1,2}:\d{1,2}:\d{1,2}$',  # 01-01-2024 12:34:56
-                r'^\d{1,2}[-/]\d{1,2}[-/]\d{4}\s+\d{1,2}:\d{1,2}$',           # 01-01-2024 12:34
-                r'^\d{1,2}[-/]\d{1,2}[-/]\d{4}$',                              # 01-01-2024
-            ]
-            
-            # 检查是否匹配任一有效格式
-            for pattern in valid_patterns:
-                if re.match(pattern, value_str):
-                    return True
-            
-            # 特别排除明显错误的格式
-            invalid_patterns = [
-                r'^\d{1,2}:\d{1,2}[\.,]\d+$',  # 15:22.1, 03:13.6 等格式
-                r'^\d{1,2}:\d{1,2}$',          # 仅时分格式 15:22
-                r'^\d{1,2}[\.,]\d+$',          # 仅数字格式 25.10.9
-            ]
-            
-            for pattern in invalid_patterns:
-                if re.match(pattern, value_str):
-                    return False
+        读取或标记失败时抛出异常，由主进程记为失败分区
+        """
+        result = {
+            'partition_start': partition_start,
+            'partition_end': partition_end,
+            'total_source_records': 0,
+            'processed_records': 0,
+            'success_records': 0,
+            'failed_records': 0,
+            'duplicate_records': 0,
+            'filtered_empty_text_records': 0,
+            'filtered_invalid_date_records': 0
+        }
+        
+        # 按 record_id 分页读取，整个分区在内存中一起去重（保证每组保留最晚的记录）
+        partition_condition = "processed_flag = 0 AND last_update >= %s AND last_update < %s"
+        partition_params = (partition_start, partition_end)
+        ods_data = []
+        last_record_id = 0
+        while True:
+            page = self._fetch_ods_data(f"{partition_condition} AND record_id > %s",
+                                        self.PARTITION_FETCH_PAGE_SIZE, partition_params + (last_record_id,))
+            ods_data.extend(page)
+            if len(page) < self.PARTITION_FETCH_PAGE_SIZE:
+                break
+            last_record_id = page[-1]['record_id']
+        
+        result['total_source_records'] = len(ods_data)
+        if not ods_data:
+            result['status'] = 'completed'
+            return result
+        
+        dwd_records, stats = self._deduplicate_ods_data(ods_data)
+        success_count, failed_count = self._save_dwd_records(dwd_records, batch_id)
+        
+        result.update({
+            'processed_records': len(dwd_records),
+            'success_records': success_count,
+            'failed_records': failed_count,
+            'duplicate_records': stats.get('duplicate_count', 0),
+            'filtered_empty_text_records': stats.get('filtered_empty_text', 0),
+            'filtered_invalid_date_records': stats.get('filtered_invalid_date', 0)
+        })
+        
+        if failed_count or stats.get('error'):
+            result['status'] = 'partial' if success_count else 'failed'
+            result['error'] = stats.get('error') or f'{failed_count}条记录写入失败，分区未标记为已处理'
+            return result
+        
+        # 只按本次读取到的记录ID标记，读取之后才提交的分区记录保持未处理，留给下次处理
+        if not self._mark_ods_processed([record['record_id'] for record in ods_data]):
+            raise Exception(f"分区 {partition_start} ~ {partition_end} 标记ODS已处理失败")
+        result['status'] = 'completed'
+        return result
+    
+    def _mark_null_date_ods_processed(self) -> int:
+        """标记 last_update 为空的待处理ODS记录为已处理，返回标记前的记录数"""
+        try:
+            count_result = self.db_config.execute_query_dict(
+                "SELECT COUNT(*) AS count FROM ods_dash_social_comments WHERE processed_flag = 0 AND last_update IS NULL"
+            )
+            count = count_result[0]['count'] if count_result else 0
+            if count:
+                self.db_config.execute_insert(
+                    "UPDATE ods_dash_social_comments SET processed_flag = 1 WHERE processed_flag = 0 AND last_update IS NULL"
+                )
+                logger.info(f"标记 {count} 条last_update为空的ODS记录为已处理（时间无效）")
+            return count
             
-            return False
+        except Exception as e:
+            logger.error(f"标记last_update为空的ODS记录失败：{e}")
+            return 0
+    
+    def _fetch_ods_data(self, condition: str, limit: int, params: tuple = ()) -> List[Dict[str, Any]]:
+        """
+        获取ODS数据 - 获取所有原始数据，验证由ETL过程负责
+        
+        condition 中的取值使用 %s 占位符，由 params 传入；查询失败时抛出异常，
+        避免调用方把数据库错误当作"没有待处理数据"
+        """
+        sql = f"""
+            SELECT record_id, last_update, brand_label, author_name, channel, 
+                   message_type, text, tags, post_link, sentiment, caption, 
+                   upload_batch_id, original_row_index, processed_at, created_at
+            FROM ods_dash_social_comments 
+            WHERE {condition}
+            ORDER BY record_id ASC
+            LIMIT %s
+        """
         
-        cleaned_series = series.copy()
-        invalid_count = 0
+        try:
+            result = self.db_config.execute_query_dict(sql, tuple(params) + (int(limit),))
+        except Exception as e:
+            logger.error(f"获取ODS数据失败：{e}")
+            raise
+        
+        logger.info(f"获取到 {len(result) if result else 0} 条ODS原始数据")
+        return result or []
+    
+    def _clean_datetime_field(self, series: pd.Series) -> pd.Series:
+        """
+        ETL层时间字段清洗：严格验证和转换时间格式
+        无效时间将被设置为NaT，由后续流程过滤
         
-        # ETL层：严格验证，无效数据设为None
-        for idx in series.index:
-            value = series.iloc[idx] if idx < len(series) else None
+        已是datetime64类型的列（数据库DATETIME字段）直接保留；
+        其他类型整列做格式正则校验后一次性 pd.to_datetime(errors='coerce')，不逐行转换
+        
+        Args:
+            series: pandas Series包含时间数据
             
-            if not is_valid_datetime_format(value):
-                cleaned_series.iloc[idx] = None
-                invalid_count += 1
-            else:
-                # 对有效格式尝试转换
-                try:
-                    converted = pd.to_datetime(value, errors='raise')
-                    cleaned_series.iloc[idx] = converted
-                except:
-                    # 转换失败则设为空
-                    cleaned_series.iloc[idx] = None
-                    invalid_count += 1
+        Returns:
+            清洗后的datetime64 Series，无效时间为NaT
+        """
+        if pd.api.types.is_datetime64_any_dtype(series):
+            cleaned_series = series
+        else:
+            value_str = series.astype(str).str.strip()
+            valid_mask = series.notna() & value_str.str.match(self.VALID_DATETIME_PATTERN)
+            cleaned_series = pd.to_datetime(value_str.where(valid_mask), errors='coerce', **_MIXED_DATETIME_KWARGS)
         
+        invalid_count = int(cleaned_series.isna().sum())
         if invalid_count > 0:
             logger.info(f"ETL时间字段清洗：过滤掉 {invalid_count} 条格式无效的时间数据")
         
@@ -274,7 +644,7 @@ class ETLProcessor:
         
         return df
     
-    def _deduplicate_ods_data(self, ods_data: List[Dict[str, Any]]) -> Tuple[List[DWDDashSocialComment], Dict[str, Any]]:
+    def _deduplicate_ods_data(self, ods_data: List[Dict[str, Any]]) -> Tuple[List[tuple], Dict[str, Any]]:
         """
         ETL层数据处理：清洗、验证、去重
         
@@ -283,6 +653,10 @@ class ETLProcessor:
         2. 必填字段验证（text、author_name、channel）
         3. 去重处理：基于DATE(last_update) + brand_label + author_name + channel + text分组，
                    保留last_update时分秒最晚的记录
+        4. 整列生成去重键，跳过DWD中已存在的键后按列构建批量插入参数
+        
+        Returns:
+            (DWD插入参数列表（顺序与 DWD_INSERT_COLUMNS 一致）, 统计信息)
         """
         try:
             if not ods_data:
@@ -333,43 +707,15 @@ class ETLProcessor:
             unique_count = len(df_deduped)
             duplicate_count = valid_count - unique_count
             
-            # 转换为DWD记录
-            dwd_records = []
-            for _, row in df_deduped.iterrows():
-                # 生成去重键
-                dedupe_key = self._generate_dedupe_key(
-                    row['dedupe_date'], row['brand_label'], 
-                    row['author_name'], row['channel'], row['text']
-                )
-                
-                # 检查DWD表中是否已存在（避免重复插入）
-                existing_record = self._check_dwd_exists(dedupe_key)
-                if existing_record:
-                    continue  # 跳过已存在的记录
-                
-                dwd_record = DWDDashSocialComment(
-                    source_record_id=int(row['record_id']),
-                    last_update=row['last_update'],
-                    brand_label=str(row['brand_label']),
-                    author_name=str(row['author_name']),
-                    channel=str(row['channel']),
-                    message_type=str(row['message_type']),
-                    text=str(row['text']),
-                    tags=str(row['tags']),
-                    post_link=str(row['post_link']),
-                    sentiment=str(row['sentiment']),
-                    caption=str(row['caption']),
-                    upload_batch_id=str(row['upload_batch_id']),
-                    original_row_index=int(row['original_row_index']),
-                    dedupe_date=row['dedupe_date'],
-                    dedupe_key=dedupe_key,
-                    is_latest_in_group=1,
-                    source_count=1,  # 可以后续优化为计算实际合并的记录数
-                    ai_processing_status="pending",  # 新增：AI处理状态，默认为pending
-                    processed_at=datetime.now()
-                )
-                
-                dwd_records.append(dwd_record)
+            # 整列生成去重键
+            df_deduped['dedupe_key'] = self._generate_dedupe_keys(df_deduped)
+            
+            # 批量检查DWD表中已存在的去重键（每个分块一次查询，避免逐条查询）
+            existing_keys = self._fetch_existing_dedupe_keys(df_deduped['dedupe_key'].tolist())
+            
+            # 跳过已存在的记录，按列构建插入参数
+            df_new = df_deduped[~df_deduped['dedupe_key'].isin(list(existing_keys))]
+            dwd_records = self._build_dwd_insert_params(df_new)
             
             stats = {
                 'original_count': original_count,
@@ -393,45 +739,82 @@ class ETLProcessor:
                 'filtered_empty_text': 0,
                 'filtered_invalid_date': 0,
                 'original_count': 0,
-                'valid_count': 0
+                'valid_count': 0,
+                'error': f"数据去重失败：{e}"
             }
     
-    def _generate_dedupe_key(self, dedupe_date: date, brand_label: str, 
-                           author_name: str, channel: str, text: str) -> str:
-        """生成去重键"""
-        # 创建唯一标识字符串
-        key_string = f"{dedupe_date}|{brand_label}|{author_name}|{channel}|{text[:200]}"
-        
-        # 生成MD5哈希（避免键过长）
-        return hashlib.md5(key_string.encode('utf-8')).hexdigest()
+    def _generate_dedupe_keys(self, df: pd.DataFrame) -> List[str]:
+        """整列生成去重键：MD5(去重日期|品牌|作者|渠道|正文前200字)"""
+        key_strings = (
+            df['dedupe_date'].astype(str) + '|' +
+            df['brand_label'].astype(str) + '|' +
+            df['author_name'].astype(str) + '|' +
+            df['channel'].astype(str) + '|' +
+            df['text'].astype(str).str.slice(0, 200)
+        )
+        return [hashlib.md5(key_string.encode('utf-8')).hexdigest() for key_string in key_strings.tolist()]
     
-    def _check_dwd_exists(self, dedupe_key: str) -> bool:
-        """检查DWD表中是否已存在该去重键的记录"""
-        try:
-            sql = f"SELECT COUNT(*) as count FROM dwd_dash_social_comments WHERE dedupe_key = '{dedupe_key}'"
-            result = self.db_config.execute_query_dict(sql)
-            
-            return result[0]['count'] > 0 if result else False
+    def _fetch_existing_dedupe_keys(self, dedupe_keys: List[str]) -> set:
+        """
+        批量查询DWD表中已存在的去重键
+
+        按 DEDUPE_LOOKUP_CHUNK_SIZE 分块，每块一条 IN 查询（走 idx_dedupe_key 索引）
+
+        Returns:
+            已存在的去重键集合（查询失败的分块视为不存在，由唯一索引 uk_dwd_dedupe 兜底）
+        """
+        existing_keys = set()
+        unique_keys = list(dict.fromkeys(dedupe_keys))
+        
+        for start in range(0, len(unique_keys), self.DEDUPE_LOOKUP_CHUNK_SIZE):
+            chunk = unique_keys[start:start + self.DEDUPE_LOOKUP_CHUNK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            sql = f"SELECT dedupe_key FROM dwd_dash_social_comments WHERE dedupe_key IN ({placeholders})"
             
-        except Exception as e:
-            logger.error(f"检查DWD记录存在性失败：{e}")
-            return False
+            try:
+                result = self.db_config.execute_query_dict(sql, tuple(chunk))
+                existing_keys.update(row['dedupe_key'] for row in result or [])
+            except Exception as e:
+                logger.error(f"批量检查DWD记录存在性失败：{e}")
+        
+        if existing_keys:
+            logger.info(f"DWD表中已存在 {len(existing_keys)} 个去重键，将跳过对应记录")
+        
+        return existing_keys
     
-    def _save_dwd_records(self, dwd_records: List[DWDDashSocialComment], batch_id: str) -> Tuple[int, int]:
-        """保存DWD记录到数据库"""
+    def _save_dwd_records(self, dwd_records: List[tuple], batch_id: str) -> Tuple[int, int]:
+        """
+        保存DWD记录到数据库（dwd_records 为 _build_dwd_insert_params 构建的参数元组）
+
+        按 DWD_INSERT_CHUNK_SIZE 分块，每块一条参数化的多行 INSERT IGNORE（一个事务），
+        并发写入导致的唯一键冲突行会被忽略而不是让整块失败
+
+        Returns:
+            (success_count, failed_count)
+        """
         success_count = 0
         failed_count = 0
         
         try:
-            for record in dwd_records:
+            sql = f"""
+                INSERT IGNORE INTO dwd_dash_social_comments 
+                ({', '.join(self.DWD_INSERT_COLUMNS)})
+                VALUES ({', '.join(['%s'] * len(self.DWD_INSERT_COLUMNS))})
+            """
+            
+            for start in range(0, len(dwd_records), self.DWD_INSERT_CHUNK_SIZE):
+                chunk = dwd_records[start:start + self.DWD_INSERT_CHUNK_SIZE]
                 try:
-                    sql = self._build_dwd_insert_sql(record)
-                    self.db_config.execute_insert(sql)
-                    success_count += 1
+                    inserted = self.db_config.execute_insert_many(sql, chunk)
+                    success_count += inserted
                     
+                    ignored = len(chunk) - inserted
+                    if ignored > 0:
+                        logger.info(f"DWD分块写入：{ignored} 条记录因唯一键冲突被忽略")
+                        
                 except Exception as e:
-                    logger.error(f"保存DWD记录失败：{e}")
-                    failed_count += 1
+                    logger.error(f"保存DWD记录分块失败（{len(chunk)} 条）：{e}")
+                    failed_count += len(chunk)
                     continue
             
             logger.info(f"DWD记录保存完成：成功{success_count}条，失败{failed_count}条")
@@ -441,95 +824,176 @@ class ETLProcessor:
             logger.error(f"批量保存DWD记录失败：{e}")
             return success_count, failed_count
     
-    def _build_dwd_insert_sql(self, record: DWDDashSocialComment) -> str:
-        """构建DWD插入SQL"""
-        import pandas as pd
+    def _build_dwd_insert_params(self, df: pd.DataFrame) -> List[tuple]:
+        """
+        按列构建DWD批量插入参数（顺序与 DWD_INSERT_COLUMNS 一致）
         
-        def escape_sql_string(s):
-            if s is None:
-                return 'NULL'
-            return "'" + str(s).replace("'", "''").replace("\\", "\\\\") + "'"
+        每列整体转换为Python列表后按行zip，不为每行构造中间记录对象
+        """
+        row_count = len(df)
+        if row_count == 0:
+            return []
         
-        def format_datetime(dt):
-            if dt is None or pd.isna(dt):
-                return 'NULL'
-            if isinstance(dt, str):
-                return f"'{dt}'"
-            try:
-                return f"'{dt.strftime('%Y-%m-%d %H:%M:%S')}'"
-            except (AttributeError, ValueError):
-                return 'NULL'
+        now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
-        def format_date(dt):
-            if dt is None or pd.isna(dt):
-                return 'NULL'
-            if isinstance(dt, str):
-                return f"'{dt}'"
-            try:
-                return f"'{dt.strftime('%Y-%m-%d')}'"
-            except (AttributeError, ValueError):
-                return 'NULL'
+        def text_column(name):
+            if name not in df.columns:
+                return [''] * row_count
+            return df[name].astype(str).tolist()
         
-        sql = f"""
-            INSERT INTO dwd_dash_social_comments 
-            (source_record_id, last_update, brand_label, author_name, channel, 
-             message_type, text, tags, post_link, sentiment, caption, 
-             upload_batch_id, original_row_index, dedupe_date, dedupe_key, 
-             is_latest_in_group, source_count, ai_processing_status, 
-             extreme_negative_processing_status, processed_at, created_at)
-            VALUES (
-                {record.source_record_id},
-                {format_datetime(record.last_update)},
-                {escape_sql_string(record.brand_label)},
-                {escape_sql_string(record.author_name)},
-                {escape_sql_string(record.channel)},
-                {escape_sql_string(record.message_type)},
-                {escape_sql_string(record.text)},
-                {escape_sql_string(record.tags)},
-                {escape_sql_string(record.post_link)},
-                {escape_sql_string(record.sentiment)},
-                {escape_sql_string(record.caption)},
-                {escape_sql_string(record.upload_batch_id)},
-                {record.original_row_index},
-                {format_date(record.dedupe_date)},
-                {escape_sql_string(record.dedupe_key)},
-                {record.is_latest_in_group},
-                {record.source_count},
-                {escape_sql_string(record.ai_processing_status)},
-                {escape_sql_string(record.extreme_negative_processing_status)},
-                {format_datetime(record.processed_at)},
-                NOW()
-            )
+        columns = [
+            df['record_id'].astype(int).tolist(),                                          # source_record_id
+            pd.to_datetime(df['last_update']).dt.strftime('%Y-%m-%d %H:%M:%S').tolist(),   # last_update
+            text_column('brand_label'),
+            text_column('author_name'),
+            text_column('channel'),
+            text_column('message_type'),
+            text_column('text'),
+            text_column('tags'),
+            text_column('post_link'),
+            text_column('sentiment'),
+            text_column('caption'),
+            text_column('upload_batch_id'),
+            df['original_row_index'].astype(int).tolist(),
+            df['dedupe_date'].astype(str).tolist(),
+            df['dedupe_key'].tolist(),
+            [1] * row_count,                # is_latest_in_group
+            [1] * row_count,                # source_count
+            ['pending'] * row_count,        # ai_processing_status
+            ['pending'] * row_count,        # extreme_negative_processing_status
+            [now_str] * row_count,          # processed_at
+            [now_str] * row_count           # created_at
+        ]
+        
+        return list(zip(*columns))
+    
+    def _get_etl_watermark(self, pipeline_name: str) -> int:
         """
+        读取增量处理水位（已处理完成的最大 record_id）
         
-        return sql
+        首次使用时按现有处理标记初始化：最小未处理 record_id - 1，全部已处理时取最大 record_id
+        """
+        sql = "SELECT high_watermark FROM dwd_etl_checkpoint WHERE pipeline_name = %s"
+        result = self.db_config.execute_query_dict(sql, (pipeline_name,))
+        if result:
+            return int(result[0]['high_watermark'])
+        
+        seed_sql = """
+            SELECT COALESCE(
+                (SELECT MIN(record_id) - 1 FROM ods_dash_social_comments WHERE processed_flag = 0),
+                (SELECT MAX(record_id) FROM ods_dash_social_comments),
+                0
+            ) AS seed
+        """
+        seed_result = self.db_config.execute_query_dict(seed_sql)
+        seed = int(seed_result[0]['seed']) if seed_result else 0
+        
+        # 并发初始化时以先写入的为准
+        self.db_config.execute_insert(
+            "INSERT IGNORE INTO dwd_etl_checkpoint (pipeline_name, high_watermark) VALUES (%s, %s)",
+            (pipeline_name, seed)
+        )
+        result = self.db_config.execute_query_dict(sql, (pipeline_name,))
+        if not result:
+            raise Exception(f"初始化ETL检查点失败：{pipeline_name}")
+        
+        logger.info(f"初始化ETL检查点 {pipeline_name}，水位 {result[0]['high_watermark']}")
+        return int(result[0]['high_watermark'])
     
-    def _mark_ods_processed(self, record_ids: List[int]):
-        """标记ODS记录为已处理"""
+    def _commit_ods_range(self, watermark: int, range_end: int, batch_id: str, record_ids: List[int]) -> bool:
+        """
+        在一个事务中推进水位并标记本批次实际读取到的ODS记录为已处理
+        
+        水位更新带 high_watermark = 旧水位 条件，其他进程已推进水位时本次提交回滚，
+        避免并发运行重复推进或回退水位；只按读取到的记录ID标记，读取之后才提交到该ID范围内的记录
+        保持未处理，由水位以下的补处理（_process_ods_below_watermark）处理
+        """
         try:
-            if not record_ids:
-                return
+            with self.db_config.pooled_connection() as connection:
+                connection.begin()
+                try:
+                    with connection.cursor() as cursor:
+                        advanced = cursor.execute(
+                            """
+                            UPDATE dwd_etl_checkpoint
+                            SET high_watermark = %s, last_batch_id = %s, updated_at = NOW()
+                            WHERE pipeline_name = %s AND high_watermark = %s
+                            """,
+                            (range_end, batch_id, self.ODS_TO_DWD_CHECKPOINT, watermark)
+                        )
+                        if not advanced:
+                            connection.rollback()
+                            logger.warning(f"ETL水位已被其他任务推进（期望 {watermark}），本批次 {batch_id} 不提交")
+                            return False
+                        
+                        marked = self._mark_ods_ids(cursor, record_ids)
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    raise
+            
+            logger.info(f"ETL水位推进：{watermark} → {range_end}，标记 {marked} 条ODS记录为已处理")
+            return True
             
-            ids_str = ','.join(map(str, record_ids))
-            sql = f"UPDATE ods_dash_social_comments SET processed_flag = 1 WHERE record_id IN ({ids_str})"
+        except Exception as e:
+            logger.error(f"提交ETL水位失败（范围 {watermark + 1}-{range_end} 将在下次重试）：{e}")
+            return False
+    
+    def _mark_ods_ids(self, cursor, record_ids: List[int]) -> int:
+        """在调用方的事务中按记录ID分块标记ODS已处理，返回标记的记录数"""
+        marked = 0
+        for start in range(0, len(record_ids), self.ODS_MARK_CHUNK_SIZE):
+            chunk = record_ids[start:start + self.ODS_MARK_CHUNK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            marked += cursor.execute(
+                f"UPDATE ods_dash_social_comments SET processed_flag = 1 "
+                f"WHERE record_id IN ({placeholders}) AND processed_flag = 0",
+                tuple(chunk)
+            )
+        return marked
+    
+    def _mark_ods_processed(self, record_ids: List[int]) -> bool:
+        """
+        按记录ID标记ODS记录为已处理
+        
+        Returns:
+            是否执行成功（记录已被其他任务标记、实际更新0条也算成功）
+        """
+        if not record_ids:
+            return True
+        
+        try:
+            with self.db_config.pooled_connection() as connection:
+                connection.begin()
+                try:
+                    with connection.cursor() as cursor:
+                        marked = self._mark_ods_ids(cursor, record_ids)
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    raise
             
-            self.db_config.execute_insert(sql)
-            logger.info(f"标记 {len(record_ids)} 条ODS记录为已处理")
+            logger.info(f"标记 {marked} 条ODS记录为已处理（共 {len(record_ids)} 个记录ID）")
+            return True
             
         except Exception as e:
             logger.error(f"标记ODS记录处理状态失败：{e}")
+            return False
     
-    def process_dwd_to_ai(self, batch_size: int = 500) -> Dict[str, Any]:
+    def process_dwd_to_ai(self, batch_size: int = 500, sync_mode: str = None) -> Dict[str, Any]:
         """
         DWD到DWD_AI的数据准备（不包含AI分析）
         
         Args:
             batch_size: 批处理大小
+            sync_mode: 同步方式 sql/python，默认读取环境变量 DWD_AI_SYNC_MODE
             
         Returns:
             处理结果统计
         """
         try:
+            sync_mode = (sync_mode or self.ai_sync_mode or 'sql').lower()
+
             # 生成处理批次ID
             batch_id = f"dwd_to_ai_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
             
@@ -545,6 +1009,9 @@ class ETLProcessor:
             
             self._save_etl_log(etl_log)
             
+            if sync_mode == 'sql':
+                return self._process_dwd_to_ai_sql(batch_size, batch_id, etl_log)
+            
             # 1. 获取DWD中未同步到AI表的数据
             dwd_data = self._fetch_unsynced_dwd_data(batch_size)
             
@@ -568,8 +1035,8 @@ class ETLProcessor:
             
             etl_log.total_source_records = len(dwd_data)
             
-            # 2. 转换为AI记录并保存（不做AI分析）
-            success_count, failed_count = self._save_ai_records_from_dwd(dwd_data, batch_id)
+            # 2. 转换为AI记录并保存（不做AI分析），同一事务内累加小时级情感汇总表
+            success_count, failed_count, rollup_updated = self._save_ai_records_from_dwd(dwd_data, batch_id)
             
             # 3. 更新ETL日志
             etl_log.status = 'completed' if failed_count == 0 else 'partial'
@@ -589,6 +1056,8 @@ class ETLProcessor:
                 'processed_records': etl_log.processed_records,
                 'success_records': success_count,
                 'failed_records': failed_count,
+                'rollup_updated': rollup_updated,
+                'sync_mode': 'python',
                 'duration_seconds': etl_log.duration_seconds
             }
             
@@ -612,6 +1081,201 @@ class ETLProcessor:
                 'error': error_msg
             }
     
+    def _process_dwd_to_ai_sql(self, batch_size: int, batch_id: str, etl_log: ETLProcessingLog) -> Dict[str, Any]:
+        """
+        服务端同步DWD到DWD_AI：按 AI_PROMOTION_CHUNK_SIZE 分块执行 INSERT ... SELECT，
+        记录数据不经过Python，极端负面结果直接取自DWD的 extremely_negative 字段
+        """
+        success_count, error_message, rollup_updated = self._promote_dwd_to_ai(batch_size, batch_id)
+        
+        if error_message:
+            etl_log.status = 'partial' if success_count > 0 else 'failed'
+            etl_log.error_message = error_message
+        else:
+            etl_log.status = 'completed'
+        etl_log.end_time = datetime.now()
+        etl_log.duration_seconds = int((etl_log.end_time - etl_log.start_time).total_seconds())
+        etl_log.total_source_records = success_count
+        etl_log.processed_records = success_count
+        etl_log.success_records = success_count
+        etl_log.failed_records = 0
+        
+        self._update_etl_log(etl_log)
+        
+        if success_count == 0 and not error_message:
+            message = '没有待同步的DWD数据'
+        else:
+            message = f'DWD到AI同步完成：成功{success_count}条' + (f'，中断原因：{error_message}' if error_message else '')
+        
+        result = {
+            'batch_id': batch_id,
+            'status': etl_log.status,
+            'message': message,
+            'total_source_records': success_count,
+            'processed_records': success_count,
+            'success_records': success_count,
+            'failed_records': 0,
+            'rollup_updated': rollup_updated,
+            'sync_mode': 'sql',
+            'duration_seconds': etl_log.duration_seconds
+        }
+        if error_message:
+            result['error'] = error_message
+        
+        logger.info(f"DWD到AI处理完成：{result}")
+        return result
+    
+    def _promote_dwd_to_ai(self, limit: int, batch_id: str) -> Tuple[int, Optional[str], bool]:
+        """
+        分块执行 AI_PROMOTION_INSERT_SQL，直到达到 limit 或没有待同步记录
+        
+        每块一个事务，失败的分块回滚后停止（已提交的分块保留，未同步的记录下次仍会被选中）；
+        每块使用独立的 ai_analysis_batch_id（批次ID_块序号），汇总表累加与该块写入在同一事务内完成
+        
+        Returns:
+            (写入的记录数, 错误信息；全部成功时为None, 汇总表是否已全部累加)
+        """
+        success_count = 0
+        chunk_no = 0
+        rollup_updated = True
+        
+        while success_count < limit:
+            chunk_limit = min(self.AI_PROMOTION_CHUNK_SIZE, limit - success_count)
+            chunk_no += 1
+            chunk_batch_id = f"{batch_id}_{chunk_no}"
+            
+            def promote(cursor):
+                return cursor.execute(self.AI_PROMOTION_INSERT_SQL, (chunk_batch_id, chunk_limit))
+            
+            try:
+                # 汇总表一旦标记为不一致，本批次剩余分块不再累加，等待 rebuild_sentiment_rollup 重建
+                inserted, chunk_rolled_up = self._write_with_rollup(promote, chunk_batch_id, with_rollup=rollup_updated)
+            except Exception as e:
+                logger.error(f"DWD到AI服务端同步分块失败：{e}")
+                return success_count, str(e), rollup_updated
+            
+            rollup_updated = rollup_updated and chunk_rolled_up
+            success_count += inserted
+            logger.info(f"DWD到AI服务端同步：本块写入{inserted}条，累计{success_count}条")
+            
+            if inserted < chunk_limit:
+                break
+        
+        return success_count, None, rollup_updated
+    
+    def _write_with_rollup(self, write, ai_batch_id: str, with_rollup: bool = True) -> Tuple[Any, bool]:
+        """
+        在同一事务中执行DWD_AI写入 write(cursor)，并把 ai_batch_id 写入的记录累加到小时级情感汇总表
+        
+        DWD_AI记录写入后不再修改，按 ai_analysis_batch_id 累加即可保持汇总与明细一致；
+        写入和累加同时提交或同时回滚，不会出现明细已写入而汇总缺失的情况。
+        累加失败时回滚，先把汇总表标记为不一致（看板改读明细），再只重做写入，
+        之后可通过 rebuild_sentiment_rollup 重建；标记失败则直接抛出，本次不写入
+        
+        Returns:
+            (write 的返回值, 汇总表是否已累加)
+        """
+        rollup_sql = self.SENTIMENT_ROLLUP_INSERT_SQL.format(condition='ai_analysis_batch_id = %s')
+        
+        for include_rollup in ((True, False) if with_rollup else (False,)):
+            rollup_started = False
+            with self.db_config.pooled_connection() as connection:
+                connection.begin()
+                try:
+                    with connection.cursor() as cursor:
+                        result = write(cursor)
+                        if include_rollup:
+                            rollup_started = True
+                            affected = cursor.execute(rollup_sql, (ai_batch_id,))
+                    connection.commit()
+                except Exception as e:
+                    connection.rollback()
+                    if not rollup_started:
+                        raise
+                    logger.error(f"情感汇总表增量更新失败，回滚后不带汇总重写（可调用 rebuild_sentiment_rollup 重建）：{e}")
+                    if not self._set_rollup_state(False, str(e)):
+                        raise
+                    continue
+            
+            if include_rollup:
+                logger.info(f"情感汇总表增量更新完成：批次 {ai_batch_id}，影响 {affected} 行")
+            return result, include_rollup
+    
+    def _set_rollup_state(self, consistent: bool, error: str = None) -> bool:
+        """记录情感汇总表是否与明细一致（看板只在一致时读取汇总表），返回是否记录成功"""
+        try:
+            if consistent:
+                sql = """
+                    INSERT INTO dws_dash_social_rollup_state (rollup_name, is_consistent, last_rebuild_at, last_error)
+                    VALUES (%s, 1, NOW(), NULL)
+                    ON DUPLICATE KEY UPDATE is_consistent = 1, last_rebuild_at = NOW(), last_error = NULL
+                """
+                params = (self.SENTIMENT_ROLLUP_NAME,)
+            else:
+                sql = """
+                    INSERT INTO dws_dash_social_rollup_state (rollup_name, is_consistent, last_error)
+                    VALUES (%s, 0, %s)
+                    ON DUPLICATE KEY UPDATE is_consistent = 0, last_error = VALUES(last_error)
+                """
+                params = (self.SENTIMENT_ROLLUP_NAME, error)
+            return self.db_config.execute_insert(sql, params)
+        except Exception as e:
+            logger.error(f"更新情感汇总表状态失败：{e}")
+            return False
+    
+    def rebuild_sentiment_rollup(self, start_date: str = None, end_date: str = None) -> Dict[str, Any]:
+        """
+        重建小时级情感汇总表（用于首次上线、历史数据回填或增量更新失败后的修复）
+        
+        Args:
+            start_date: 开始日期（YYYY-MM-DD），为空表示不限
+            end_date: 结束日期（YYYY-MM-DD），为空表示不限
+        """
+        try:
+            delete_conditions = ['1=1']
+            source_conditions = ['1=1']
+            params = []
+            if start_date:
+                delete_conditions.append('stat_date >= %s')
+                source_conditions.append('last_update >= %s')
+                params.append(start_date)
+            if end_date:
+                delete_conditions.append('stat_date <= %s')
+                source_conditions.append('last_update < DATE_ADD(%s, INTERVAL 1 DAY)')
+                params.append(end_date)
+            
+            insert_sql = self.SENTIMENT_ROLLUP_INSERT_SQL.format(condition=' AND '.join(source_conditions))
+            with self.db_config.pooled_connection() as connection:
+                connection.begin()
+                try:
+                    with connection.cursor() as cursor:
+                        deleted = cursor.execute(
+                            f"DELETE FROM dws_dash_social_sentiment_hourly WHERE {' AND '.join(delete_conditions)}",
+                            tuple(params)
+                        )
+                        inserted = cursor.execute(insert_sql, tuple(params))
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    raise
+            
+            logger.info(f"情感汇总表重建完成：删除{deleted}行，写入{inserted}行")
+            # 只有全量重建能保证整张汇总表与明细一致
+            if not start_date and not end_date:
+                self._set_rollup_state(True)
+            return {
+                'status': 'completed',
+                'start_date': start_date,
+                'end_date': end_date,
+                'deleted_rows': deleted,
+                'inserted_rows': inserted
+            }
+            
+        except Exception as e:
+            error_msg = f"情感汇总表重建失败：{str(e)}"
+            logger.error(error_msg)
+            return {'status': 'failed', 'error': error_msg}
+    
     def _fetch_unsynced_dwd_data(self, limit: int) -> List[Dict[str, Any]]:
         """获取未同步到AI表的DWD数据（只处理AI分析和极端负面分析都已完成的记录）"""
         try:
@@ -634,24 +1298,23 @@ class ETLProcessor:
             logger.error(f"获取未同步DWD数据失败：{e}")
             return []
     
-    def _save_ai_records_from_dwd(self, dwd_data: List[Dict[str, Any]], batch_id: str) -> Tuple[int, int]:
-        """从DWD数据创建AI记录（包含AI分析结果和极端负面分析结果）"""
-        success_count = 0
-        failed_count = 0
+    def _save_ai_records_from_dwd(self, dwd_data: List[Dict[str, Any]], batch_id: str) -> Tuple[int, int, bool]:
+        """
+        从DWD数据创建AI记录（包含AI分析结果和极端负面分析结果）
+        
+        所有记录在一个事务内写入，并在同一事务中累加小时级情感汇总表
+        
+        Returns:
+            (成功条数, 失败条数, 汇总表是否已累加)
+        """
+        insert_sqls = []
+        build_failed = 0
         
         try:
             for dwd_record in dwd_data:
                 try:
-                    # 判断是否为极端负面评论
-                    is_extremely_negative = False
-                    if dwd_record.get('ai_sentiment') == 'negative':
-                        # 重新进行极端负面检测（基于DWD中的AI结果）
-                        from services.ai_sentiment_analyzer import AISentimentAnalyzer
-                        analyzer = AISentimentAnalyzer()
-                        is_extremely_negative = analyzer.analyze_extreme_negative(
-                            dwd_record.get('text', ''), 
-                            dwd_record.get('ai_sentiment', '')
-                        )
+                    # 极端负面结果由 BatchExtremeNegativeAnalyzer 写入DWD，这里直接沿用
+                    is_extremely_negative = bool(dwd_record.get('extremely_negative'))
                     
                     # 创建AI记录（继承DWD数据和AI分析结果）
                     ai_record = DWDAIDashSocialComment(
@@ -680,21 +1343,37 @@ class ETLProcessor:
                         extremely_negative=is_extremely_negative
                     )
                     
-                    sql = self._build_ai_insert_sql(ai_record)
-                    self.db_config.execute_insert(sql)
-                    success_count += 1
+                    insert_sqls.append(self._build_ai_insert_sql(ai_record))
                     
                 except Exception as e:
-                    logger.error(f"保存AI记录失败：{e}")
-                    failed_count += 1
+                    logger.error(f"构建AI记录失败：{e}")
+                    build_failed += 1
                     continue
             
+            def save(cursor):
+                success_count = 0
+                failed_count = 0
+                for sql in insert_sqls:
+                    try:
+                        cursor.execute(sql)
+                        success_count += 1
+                    except Exception as e:
+                        logger.error(f"保存AI记录失败：{e}")
+                        failed_count += 1
+                return success_count, failed_count
+            
+            (success_count, failed_count), rollup_updated = self._write_with_rollup(
+                save, batch_id, with_rollup=bool(insert_sqls)
+            )
+            failed_count += build_failed
+            
             logger.info(f"AI记录保存完成：成功{success_count}条，失败{failed_count}条")
-            return success_count, failed_count
+            return success_count, failed_count, rollup_updated or success_count == 0
             
         except Exception as e:
+            # 事务已整体回滚，本批次记录均未写入，下次仍会被选中
             logger.error(f"批量保存AI记录失败：{e}")
-            return success_count, failed_count
+            return 0, len(dwd_data), True
     
     def _build_ai_insert_sql(self, record: DWDAIDashSocialComment) -> str:
         """构建AI表插入SQL"""
@@ -853,6 +1532,11 @@ class ETLProcessor:
             
             recent_logs_result = self.db_config.execute_query_dict(recent_logs_sql)
             
+            # 增量处理水位
+            checkpoints_result = self.db_config.execute_query_dict(
+                "SELECT pipeline_name, high_watermark, last_batch_id, updated_at FROM dwd_etl_checkpoint"
+            )
+            
             return {
                 'data_counts': {
                     'ods_total': ods_count,
@@ -862,6 +1546,7 @@ class ETLProcessor:
                     'pending_dwd_to_ai': pending_dwd_count
                 },
                 'recent_logs': recent_logs_result or [],
+                'checkpoints': checkpoints_result or [],
                 'status': 'success'
             }
             
@@ -869,37 +1554,62 @@ class ETLProcessor:
             logger.error(f"获取ETL状态失败：{e}")
             return {'error': str(e)}
     
-    def run_full_etl_pipeline(self, batch_size: int = 1000) -> Dict[str, Any]:
-        """运行完整的ETL流水线"""
+    def run_full_etl_pipeline(self, batch_size: int = 1000, max_steps: int = None) -> Dict[str, Any]:
+        """
+        运行完整的ETL流水线
+        
+        每个阶段按 batch_size 循环执行，直到没有待处理数据、出现失败或达到 max_steps 批；
+        增量模式下每批成功后即提交水位，中断后再次调用会从水位处继续（has_more 表示仍有积压）
+        
+        Args:
+            batch_size: 每批处理的记录数
+            max_steps: 每个阶段最多执行的批次数，默认读取环境变量 ETL_PIPELINE_MAX_STEPS
+        """
         try:
             results = []
+            max_steps = max_steps or self.pipeline_max_steps
             
             # 1. ODS → DWD
             logger.info("开始执行 ODS → DWD 处理...")
-            ods_to_dwd_result = self.process_ods_to_dwd(batch_size)
-            results.append({
-                'step': 'ods_to_dwd',
-                'result': ods_to_dwd_result
-            })
+            ods_has_more = False
+            for step in range(1, max_steps + 1):
+                ods_to_dwd_result = self.process_ods_to_dwd(batch_size)
+                results.append({
+                    'step': 'ods_to_dwd',
+                    'batch': step,
+                    'result': ods_to_dwd_result
+                })
+                ods_has_more = ods_to_dwd_result.get('has_more', False)
+                if not ods_has_more:
+                    break
             
             # 2. DWD → DWD_AI（数据同步，不包含AI分析）
             logger.info("开始执行 DWD → DWD_AI 同步...")
-            dwd_to_ai_result = self.process_dwd_to_ai(batch_size // 2)
-            results.append({
-                'step': 'dwd_to_ai',
-                'result': dwd_to_ai_result
-            })
+            ai_batch_size = max(batch_size // 2, 1)
+            ai_has_more = False
+            for step in range(1, max_steps + 1):
+                dwd_to_ai_result = self.process_dwd_to_ai(ai_batch_size)
+                results.append({
+                    'step': 'dwd_to_ai',
+                    'batch': step,
+                    'result': dwd_to_ai_result
+                })
+                ai_has_more = (dwd_to_ai_result.get('status') == 'completed'
+                               and dwd_to_ai_result.get('success_records', 0) >= ai_batch_size)
+                if not ai_has_more:
+                    break
             
             # 3. 生成总体报告
             # 注意：这里统计的是各阶段处理的记录数，而非最终数据记录数
-            ods_to_dwd_success = results[0]['result'].get('success_records', 0)
-            dwd_to_ai_success = results[1]['result'].get('success_records', 0) if len(results) > 1 else 0
+            ods_to_dwd_success = sum(r['result'].get('success_records', 0) for r in results if r['step'] == 'ods_to_dwd')
+            dwd_to_ai_success = sum(r['result'].get('success_records', 0) for r in results if r['step'] == 'dwd_to_ai')
             
             total_failed = sum(r['result'].get('failed_records', 0) for r in results)
             
             pipeline_result = {
                 'pipeline_status': 'completed',
                 'steps': results,
+                'has_more': ods_has_more or ai_has_more,
                 'ods_to_dwd_success': ods_to_dwd_success,
                 'dwd_to_ai_success': dwd_to_ai_success,
                 'total_processing_operations': ods_to_dwd_success + dwd_to_ai_success,  # 更准确的描述
@@ -918,3 +1628,18 @@ class ETLProcessor:
                 'error': error_msg,
                 'steps': results if 'results' in locals() else []
             }
+
+
+def _process_ods_partition(partition_start: str, partition_end: str, batch_id: str) -> Dict[str, Any]:
+    """进程池入口：在子进程中创建独立的ETL处理器（及数据库连接池）处理一个日期分区"""
+    logging.basicConfig(level=logging.INFO)
+    try:
+        return ETLProcessor()._process_partition(partition_start, partition_end, batch_id)
+    except Exception as e:
+        logger.error(f"ODS分区 {partition_start} ~ {partition_end} 处理失败：{e}")
+        return {
+            'partition_start': partition_start,
+            'partition_end': partition_end,
+            'status': 'failed',
+            'error': str(e)
+        }
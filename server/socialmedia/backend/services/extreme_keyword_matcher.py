@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+极端负面关键词匹配器
+各类关键词在模块导入时编译为一个组合正则，对文本只扫描一遍即可得到所有命中的类别；
+另提供对整列 pandas Series 打分的向量化版本，供批量分析使用
+"""
+
+import re
+import logging
+from typing import Dict, List
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 各类关键词（统一小写，按子串匹配）
+EXTREME_KEYWORD_GROUPS: Dict[str, List[str]] = {
+    # 侮辱性词汇
+    'insult': [
+        # 中文侮辱词汇
+        '垃圾', '傻逼', '坑爹', '骗子', '黑心', '恶心', '坑人', '草', '妈的',
+        '狗屎', '操', '卧槽', '尼玛', '滚', '死', '脑残', '白痴', '弱智',
+        '蠢货', '废物', '渣渣', '智障', '二逼', '煞笔', '傻叉', '贱',
+        '低级', '恶劣', '下流', '无耻', '可耻', '丢人', '糟糕', '破烂',
+        '混蛋', '王八蛋', '狗东西', '畜生', '禽兽', '人渣', '败类',
+        '神经病', '有病', '缺德', '恶毒', '阴险', '卑鄙', '龌龊',
+
+        # 英文侮辱词汇
+        'shit', 'fuck', 'damn', 'stupid', 'idiot', 'garbage', 'trash', 'scam',
+        'asshole', 'bitch', 'bastard', 'crap', 'suck', 'moron', 'jerk',
+        'loser', 'pathetic', 'disgusting', 'awful', 'terrible', 'horrible',
+        'worthless', 'useless', 'ridiculous', 'absurd', 'nonsense', 'bullshit',
+        'dumb', 'retarded', 'crazy', 'insane', 'sick', 'twisted', 'evil'
+    ],
+
+    # 威胁性语言
+    'threat': [
+        # 中文威胁词汇
+        '投诉', '曝光', '举报', '起诉', '报警', '媒体', '监管', '工商', '法院',
+        '告发', '检举', '揭发', '揭露', '告状', '上诉', '申诉', '控告',
+        '律师', '法律', '诉讼', '赔偿', '维权', '打官司', '法庭', '仲裁',
+        '消费者协会', '消协', '12315', '记者', '新闻', '电视台', '报社',
+        '网络', '微博', '朋友圈', '公开', '公布', '传播', '扩散', '转发',
+        '封杀', '抵制', '黑名单', '拉黑', '删除', '屏蔽', '查封', '关闭',
+        '威胁', '恐吓', '警告', '后果', '严重', '负责', '追究', '惩罚',
+
+        # 英文威胁词汇
+        'sue', 'lawsuit', 'report', 'expose', 'media', 'police', 'court',
+        'lawyer', 'legal', 'prosecution', 'complain', 'complaint', 'authority',
+        'government', 'department', 'agency', 'investigation',
+        'publish', 'broadcast', 'journalist', 'reporter', 'news', 'press',
+        'social media', 'facebook', 'twitter', 'instagram', 'youtube',
+        'boycott', 'blacklist', 'ban', 'block', 'delete', 'remove', 'shut down',
+        'threaten', 'warning', 'consequence', 'serious', 'responsible', 'punishment'
+    ],
+
+    # 强烈负面情绪词汇
+    'extreme_emotion': [
+        # 中文极端负面情绪词汇
+        '恶劣', '恶心', '愤怒', '气死', '崩溃', '绝望', '愤慨', '痛恨', '厌恶',
+        '暴怒', '狂怒', '发疯', '抓狂', '疯狂', '失望', '沮丧', '难过',
+        '心碎', '痛苦', '煎熬', '折磨', '受罪', '悲惨', '凄惨', '惨不忍睹',
+        '无语', 'speechless', '震惊', '惊讶', '不敢相信', '无法接受',
+        '后悔', '遗憾', '可惜', '白费', '浪费', '亏', '损失', '倒霉',
+        '糟糕', '糟透', '完蛋', '毁了', '砸了', '废了', '完了', '死定了',
+        '受够了', '忍无可忍', '极限', '爆发', '彻底', '完全', '彻底失望',
+        '心寒', '心凉', '寒心', '心死', '死心', '放弃', '算了', '不要了',
+
+        # 英文极端负面情绪词汇
+        'terrible', 'horrible', 'awful', 'disgusting', 'furious', 'hate', 'despise',
+        'outrageous', 'unacceptable', 'intolerable', 'unbearable', 'devastating',
+        'shocking', 'appalling', 'revolting', 'sickening',
+        'frustrated', 'annoyed', 'irritated', 'pissed', 'mad', 'angry', 'rage',
+        'disappointed', 'heartbroken', 'devastated', 'crushed', 'destroyed',
+        'hopeless', 'desperate', 'miserable', 'suffering', 'painful', 'agony',
+        'nightmare', 'disaster', 'catastrophe', 'failure', 'ruined', 'wasted',
+        'regret', 'sorry', 'unfortunate', 'unlucky', 'bad luck', 'curse',
+        'enough', 'fed up', 'sick of', 'tired of', 'done with', 'give up', 'junk'
+    ],
+
+    # 服务相关负面词汇
+    'service': [
+        # 中文服务负面词汇
+        '服务差', '态度差', '不耐烦', '不礼貌', '粗鲁', '傲慢', '冷淡',
+        '不专业', '不负责', '敷衍', '推脱', '踢皮球', '拖延', '效率低',
+        '回复慢', '不回复', '联系不上', '找不到人', '客服差', '售后差',
+        '不解决问题', '解决不了', '处理不当', '态度恶劣', '欺骗客户',
+        '虚假承诺', '说一套做一套', '言而无信', '不守信用', '骗钱',
+
+        # 英文服务负面词汇
+        'poor service', 'bad service', 'terrible service', 'rude', 'unprofessional',
+        'unhelpful', 'slow response', 'no response', 'ignore', 'dismissive',
+        'arrogant', 'condescending', 'incompetent', 'irresponsible', 'unreliable',
+        'misleading', 'deceptive', 'dishonest', 'fraudulent', 'scam', 'cheat'
+    ]
+}
+
+# 命中某类关键词时的加分，各类只计一次
+CATEGORY_WEIGHTS: Dict[str, float] = {
+    'insult': 0.3,
+    'threat': 0.3,
+    'extreme_emotion': 0.3,
+    'service': 0.2
+}
+
+# 感叹号/问号达到该数量时加分
+EXCLAMATION_THRESHOLD = 2
+EXCLAMATION_WEIGHT = 0.1
+EXCLAMATION_PATTERN = re.compile(r'[!?！？]')
+
+
+def _build_keyword_closure(groups: Dict[str, List[str]]) -> Dict[str, List[tuple]]:
+    """
+    计算每个关键词命中时实际出现的 (类别, 关键词)
+
+    组合正则在每个位置只返回最长的关键词，被它包含的短关键词（如 'terrible service' 中的 'terrible'）
+    也同时出现在文本里，因此把它们的类别一并记到长关键词上
+    """
+    keyword_categories: Dict[str, set] = {}
+    for category, keywords in groups.items():
+        for keyword in keywords:
+            keyword_categories.setdefault(keyword, set()).add(category)
+
+    closure = {}
+    for keyword in keyword_categories:
+        closure[keyword] = sorted(
+            (category, contained)
+            for contained, categories in keyword_categories.items()
+            if contained in keyword
+            for category in categories
+        )
+    return closure
+
+
+_KEYWORD_CLOSURE = _build_keyword_closure(EXTREME_KEYWORD_GROUPS)
+
+# 零宽前瞻使每个位置都参与匹配（关键词之间可以重叠）；长关键词在前，保证取到该位置最长的关键词
+_COMBINED_PATTERN = re.compile(
+    '(?=(' + '|'.join(re.escape(keyword) for keyword in sorted(_KEYWORD_CLOSURE, key=len, reverse=True)) + '))'
+)
+
+# 向量化版本每类一个正则
+_CATEGORY_PATTERNS = {
+    category: '|'.join(re.escape(keyword) for keyword in sorted(set(keywords), key=len, reverse=True))
+    for category, keywords in EXTREME_KEYWORD_GROUPS.items()
+}
+
+
+def match_extreme_keywords(text: str) -> Dict[str, List[str]]:
+    """
+    单次扫描文本，返回命中的各类关键词
+
+    Args:
+        text: 评论文本（不区分大小写）
+
+    Returns:
+        {类别: [命中的关键词]}，未命中的类别不出现
+    """
+    if not text:
+        return {}
+
+    matched: Dict[str, set] = {}
+    for match in _COMBINED_PATTERN.finditer(str(text).lower()):
+        for category, keyword in _KEYWORD_CLOSURE[match.group(1)]:
+            matched.setdefault(category, set()).add(keyword)
+    return {category: sorted(keywords) for category, keywords in matched.items()}
+
+
+def score_extreme_text(text: str) -> float:
+    """基于关键词和标点的极端负面规则得分（0-1）"""
+    if not text:
+        return 0.0
+
+    text = str(text)
+    score = 0.0
+
+    exclamation_count = len(EXCLAMATION_PATTERN.findall(text))
+    if exclamation_count >= EXCLAMATION_THRESHOLD:
+        score += EXCLAMATION_WEIGHT
+        logger.debug(f"检测到多个感叹号/问号: {exclamation_count}个")
+
+    for category, keywords in match_extreme_keywords(text).items():
+        score += CATEGORY_WEIGHTS[category]
+        logger.debug(f"检测到{category}类关键词: {keywords}")
+
+    return min(score, 1.0)
+
+
+def score_extreme_series(texts: pd.Series) -> pd.Series:
+    """
+    向量化计算整列文本的极端负面规则得分，结果与逐条调用 score_extreme_text 一致
+
+    Args:
+        texts: 评论文本列（空值按空文本处理）
+
+    Returns:
+        与 texts 同索引的得分列
+    """
+    texts = texts.fillna('').astype(str)
+    lower = texts.str.lower()
+
+    scores = pd.Series(0.0, index=texts.index)
+    scores += (texts.str.count(EXCLAMATION_PATTERN.pattern) >= EXCLAMATION_THRESHOLD) * EXCLAMATION_WEIGHT
+    for category, pattern in _CATEGORY_PATTERNS.items():
+        scores += lower.str.contains(pattern, regex=True) * CATEGORY_WEIGHTS[category]
+
+    return scores.clip(upper=1.0)
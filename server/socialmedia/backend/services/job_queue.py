@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+后台任务队列
+任务持久化在本地SQLite文件中，由工作线程领取执行；进程重启后未完成的任务会在租约过期后被重新领取，
+用于把上传后的ETL和AI分析从HTTP请求中移出
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, Optional, Callable, List, Iterator
+
+logger = logging.getLogger(__name__)
+
+# 任务处理函数：handler(job, report_progress) -> result字典
+# report_progress(stage, status, **details) 更新阶段进度并续约
+JobHandler = Callable[[Dict[str, Any], Callable[..., None]], Dict[str, Any]]
+
+
+class JobQueue:
+    """基于SQLite的持久化任务队列（线程安全，支持多进程共享同一个队列文件）"""
+
+    ACTIVE_STATUSES = ('queued', 'running')
+
+    def __init__(self, db_path: str = None, workers: int = None, lease_seconds: int = None,
+                 max_attempts: int = None, poll_interval: float = 1.0):
+        """
+        Args:
+            db_path: 队列文件路径，默认读取环境变量 JOB_QUEUE_PATH
+            workers: 工作线程数，默认读取环境变量 JOB_QUEUE_WORKERS
+            lease_seconds: 任务租约（秒），超过该时间未上报进度的运行中任务视为中断并重新领取，默认读取 JOB_QUEUE_LEASE_SECONDS
+            max_attempts: 最大执行次数，默认读取 JOB_QUEUE_MAX_ATTEMPTS
+            poll_interval: 空闲时的轮询间隔（秒）
+        """
+        default_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'job_queue.db')
+        self.db_path = db_path or os.getenv('JOB_QUEUE_PATH', default_path)
+        self.workers = workers if workers is not None else int(os.getenv('JOB_QUEUE_WORKERS', 1))
+        self.lease_seconds = lease_seconds if lease_seconds is not None else int(os.getenv('JOB_QUEUE_LEASE_SECONDS', 900))
+        self.max_attempts = max_attempts if max_attempts is not None else int(os.getenv('JOB_QUEUE_MAX_ATTEMPTS', 3))
+        self.poll_interval = poll_interval
+
+        self._handlers: Dict[str, JobHandler] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    batch_id TEXT,
+                    user_id TEXT,
+                    status TEXT NOT NULL,
+                    current_stage TEXT,
+                    progress TEXT NOT NULL DEFAULT '{}',
+                    payload TEXT NOT NULL DEFAULT '{}',
+                    result TEXT,
+                    error_message TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker_id TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    heartbeat_at REAL,
+                    finished_at REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id)")
+
+        logger.info(f"任务队列初始化：{self.db_path}，工作线程 {self.workers} 个，租约 {self.lease_seconds} 秒")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """每次操作使用独立连接（SQLite连接不跨线程共享），自动提交模式，事务由调用方显式控制"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------
+    # 生产者接口
+    # ------------------------------------------------------------------
+
+    def register_handler(self, kind: str, handler: JobHandler):
+        """注册任务类型的处理函数"""
+        self._handlers[kind] = handler
+
+    def enqueue(self, kind: str, payload: Dict[str, Any] = None, batch_id: str = None, user_id: str = None) -> str:
+        """
+        提交任务
+
+        Returns:
+            任务ID
+        """
+        job_id = f"job_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO jobs (job_id, kind, batch_id, user_id, status, payload, created_at)
+                VALUES (?, ?, ?, ?, 'queued', ?, ?)
+                """,
+                (job_id, kind, batch_id, user_id, json.dumps(payload or {}, ensure_ascii=False, default=str), time.time())
+            )
+        logger.info(f"任务已入队：{job_id}（{kind}，批次 {batch_id}）")
+        self._wakeup.set()
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """按任务ID查询任务"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def get_latest_job_for_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """查询某个上传批次最近提交的任务"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE batch_id = ? ORDER BY created_at DESC LIMIT 1",
+                (batch_id,)
+            ).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def list_jobs(self, statuses: tuple = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """列出任务（默认最近的任务）"""
+        sql = "SELECT * FROM jobs"
+        params: list = []
+        if statuses:
+            sql += f" WHERE status IN ({', '.join(['?'] * len(statuses))})"
+            params.extend(statuses)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        params.append(int(limit))
+        with self._connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        def to_iso(value):
+            return datetime.fromtimestamp(value).isoformat() if value else None
+
+        return {
+            'job_id': row['job_id'],
+            'kind': row['kind'],
+            'batch_id': row['batch_id'],
+            'user_id': row['user_id'],
+            'status': row['status'],
+            'current_stage': row['current_stage'],
+            'progress': json.loads(row['progress'] or '{}'),
+            'payload': json.loads(row['payload'] or '{}'),
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error_message': row['error_message'],
+            'attempts': row['attempts'],
+            'worker_id': row['worker_id'],
+            'created_at': to_iso(row['created_at']),
+            'started_at': to_iso(row['started_at']),
+            'heartbeat_at': to_iso(row['heartbeat_at']),
+            'finished_at': to_iso(row['finished_at'])
+        }
+
+    # ------------------------------------------------------------------
+    # 工作线程
+    # ------------------------------------------------------------------
+
+    def start(self):
+        """启动工作线程（重复调用无副作用；multiprocessing 子进程中不启动，避免进程池重新导入入口模块时抢占任务）"""
+        if multiprocessing.parent_process() is not None:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            for i in range(max(1, self.workers)):
+                worker_id = f"{socket.gethostname()}:{os.getpid()}:{i}"
+                thread = threading.Thread(target=self._worker_loop, args=(worker_id,),
+                                          name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"任务队列工作线程已启动：{len(self._threads)} 个")
+
+    def stop(self, timeout: float = 5.0):
+        """停止工作线程（正在执行的任务会在当前阶段结束后退出）"""
+        self._stop.set()
+        self._wakeup.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+
+    def _claim_next(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """领取最早的待执行任务，或租约已过期的运行中任务"""
+        now = time.time()
+        kinds = list(self._handlers.keys())
+        if not kinds:
+            return None
+
+        with self._connect() as conn:
+            # BEGIN IMMEDIATE 获取写锁，保证多线程/多进程不会领取同一个任务
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 超过最大执行次数的中断任务直接标记失败
+                conn.execute(
+                    """
+                    UPDATE jobs SET status = 'failed', finished_at = ?,
+                           error_message = COALESCE(error_message, '任务多次中断，超过最大执行次数')
+                    WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?
+                    """,
+                    (now, now - self.lease_seconds, self.max_attempts)
+                )
+                row = conn.execute(
+                    f"""
+                    SELECT * FROM jobs
+                    WHERE kind IN ({', '.join(['?'] * len(kinds))})
+                      AND (status = 'queued' OR (status = 'running' AND heartbeat_at < ?))
+                    ORDER BY created_at ASC
+                    LIMIT 1
+                    """,
+                    (*kinds, now - self.lease_seconds)
+                ).fetchone()
+
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                if row['status'] == 'running':
+                    logger.warning(f"任务 {row['job_id']} 租约过期（原执行者 {row['worker_id']}），重新领取")
+
+                conn.execute(
+                    """
+                    UPDATE jobs SET status = 'running', worker_id = ?, attempts = attempts + 1,
+                           started_at = COALESCE(started_at, ?), heartbeat_at = ?
+                    WHERE job_id = ?
+                    """,
+                    (worker_id, now, now, row['job_id'])
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        return self.get_job(row['job_id'])
+
+    def _report_progress(self, job_id: str, worker_id: str, stage: str, status: str, **details):
+        """更新阶段进度并续约（只有当前执行者可以更新）"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT progress FROM jobs WHERE job_id = ? AND worker_id = ?",
+                    (job_id, worker_id)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return
+
+                progress = json.loads(row['progress'] or '{}')
+                stage_progress = progress.setdefault(stage, {})
+                stage_progress.update(details)
+                stage_progress['status'] = status
+                stage_progress['updated_at'] = datetime.fromtimestamp(now).isoformat()
+
+                conn.execute(
+                    "UPDATE jobs SET progress = ?, current_stage = ?, heartbeat_at = ? WHERE job_id = ? AND worker_id = ?",
+                    (json.dumps(progress, ensure_ascii=False, default=str), stage, now, job_id, worker_id)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _finish(self, job_id: str, worker_id: str, status: str, result: Dict[str, Any] = None, error_message: str = None):
+        """记录任务结束状态"""
+        with self._connect() as conn:
+            conn.execute(
+                """
+                UPDATE jobs SET status = ?, result = ?, error_message = ?, finished_at = ?, heartbeat_at = ?
+                WHERE job_id = ? AND worker_id = ?
+                """,
+                (status, json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+                 error_message, time.time(), time.time(), job_id, worker_id)
+            )
+
+    def _worker_loop(self, worker_id: str):
+        """工作线程主循环"""
+        while not self._stop.is_set():
+            try:
+                job = self._claim_next(worker_id)
+            except Exception as e:
+                logger.error(f"领取任务失败：{e}")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            job_id = job['job_id']
+            handler = self._handlers.get(job['kind'])
+            logger.info(f"开始执行任务 {job_id}（{job['kind']}，第 {job['attempts']} 次）")
+
+            def report_progress(stage: str, status: str, **details):
+                try:
+                    self._report_progress(job_id, worker_id, stage, status, **details)
+                except Exception as e:
+                    logger.warning(f"更新任务进度失败：{e}")
+
+            try:
+                result = handler(job, report_progress)
+                self._finish(job_id, worker_id, 'completed', result=result)
+                logger.info(f"任务 {job_id} 执行完成")
+            except Exception as e:
+                error_msg = f"任务执行失败：{str(e)}"
+                logger.error(f"任务 {job_id} {error_msg}")
+                self._finish(job_id, worker_id, 'failed', error_message=error_msg)
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> Optional[JobQueue]:
+    """获取进程内共享的任务队列；JOB_QUEUE_ENABLED=false 或初始化失败时返回None"""
+    global _job_queue
+    if os.getenv('JOB_QUEUE_ENABLED', 'true').strip().lower() in ('0', 'false', 'no', 'off'):
+        return None
+
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                try:
+                    _job_queue = JobQueue()
+                except Exception as e:
+                    logger.error(f"任务队列初始化失败，上传后处理将不会自动执行: {e}")
+                    return None
+    return _job_queue
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""
+OpenAI调用限流器
+实现位于 server/utils/openai_rate_limiter.py（与问卷分析服务共用），这里负责导入并保持原有导入路径
+"""
+
+import os
+import sys
+
+_SHARED_UTILS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))), 'utils'
+)
+if _SHARED_UTILS_DIR not in sys.path:
+    sys.path.append(_SHARED_UTILS_DIR)
+
+from openai_rate_limiter import (
+    RateLimiter, estimate_tokens, get_openai_rate_limiter, get_retry_after, is_rate_limit_error
+)
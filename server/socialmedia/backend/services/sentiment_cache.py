@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+情感分析结果缓存
+以（规范化文本 + 模型名 + 提示词版本）的哈希为键，将AI分析结果持久化到本地SQLite文件，
+支持TTL过期和LRU淘汰，避免重复文本反复调用OpenAI
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SentimentCache:
+    """基于SQLite的内容寻址结果缓存（线程安全）"""
+
+    # 每写入多少条执行一次过期清理和LRU淘汰
+    EVICTION_INTERVAL = 200
+
+    def __init__(self, db_path: str = None, ttl_seconds: int = None, max_entries: int = None):
+        """
+        Args:
+            db_path: 缓存文件路径，默认读取环境变量 SENTIMENT_CACHE_PATH
+            ttl_seconds: 过期时间（秒），默认读取环境变量 SENTIMENT_CACHE_TTL_DAYS（天）
+            max_entries: 最大条目数，超出后按最近访问时间淘汰，默认读取环境变量 SENTIMENT_CACHE_MAX_ENTRIES
+        """
+        default_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'sentiment_cache.db')
+        self.db_path = db_path or os.getenv('SENTIMENT_CACHE_PATH', default_path)
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else int(float(os.getenv('SENTIMENT_CACHE_TTL_DAYS', 30)) * 86400)
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv('SENTIMENT_CACHE_MAX_ENTRIES', 200000))
+
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._writes_since_eviction = 0
+
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sentiment_cache (
+                cache_key TEXT PRIMARY KEY,
+                prompt_version TEXT NOT NULL,
+                model TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_accessed_at REAL NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_accessed ON sentiment_cache (last_accessed_at)")
+        self._conn.commit()
+
+        logger.info(f"情感分析缓存初始化：{self.db_path}，TTL {self.ttl_seconds} 秒，最大 {self.max_entries} 条")
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """规范化文本：Unicode兼容规范化、转小写、合并空白"""
+        normalized = unicodedata.normalize('NFKC', str(text or ''))
+        return re.sub(r'\s+', ' ', normalized).strip().lower()
+
+    def make_key(self, text: str, model: str, prompt_version: str) -> str:
+        """生成缓存键"""
+        raw = f"{prompt_version}\x1f{model}\x1f{self.normalize_text(text)}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, text: str, model: str, prompt_version: str) -> Optional[Dict[str, Any]]:
+        """
+        查询缓存
+
+        Returns:
+            缓存的结果字典，未命中或已过期返回None
+        """
+        cache_key = self.make_key(text, model, prompt_version)
+        now = time.time()
+
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT result, created_at FROM sentiment_cache WHERE cache_key = ?",
+                    (cache_key,)
+                ).fetchone()
+
+                if row is None or (self.ttl_seconds > 0 and now - row[1] > self.ttl_seconds):
+                    self._misses += 1
+                    return None
+
+                self._conn.execute(
+                    "UPDATE sentiment_cache SET last_accessed_at = ?, hit_count = hit_count + 1 WHERE cache_key = ?",
+                    (now, cache_key)
+                )
+                self._conn.commit()
+                self._hits += 1
+
+            return json.loads(row[0])
+
+        except Exception as e:
+            logger.warning(f"读取情感分析缓存失败: {e}")
+            return None
+
+    def set(self, text: str, model: str, prompt_version: str, result: Dict[str, Any]):
+        """写入缓存（只应写入成功的分析结果）"""
+        cache_key = self.make_key(text, model, prompt_version)
+        now = time.time()
+
+        try:
+            with self._lock:
+                self._conn.execute(
+                    """
+                    INSERT OR REPLACE INTO sentiment_cache
+                    (cache_key, prompt_version, model, result, created_at, last_accessed_at, hit_count)
+                    VALUES (?, ?, ?, ?, ?, ?, 0)
+                    """,
+                    (cache_key, prompt_version, model, json.dumps(result, ensure_ascii=False), now, now)
+                )
+                self._conn.commit()
+
+                self._writes_since_eviction += 1
+                if self._writes_since_eviction >= self.EVICTION_INTERVAL:
+                    self._writes_since_eviction = 0
+                    self._evict(now)
+
+        except Exception as e:
+            logger.warning(f"写入情感分析缓存失败: {e}")
+
+    def _evict(self, now: float):
+        """清理过期条目，并按最近访问时间淘汰超出上限的条目（调用方持有锁）"""
+        if self.ttl_seconds > 0:
+            self._conn.execute("DELETE FROM sentiment_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+
+        count = self._conn.execute("SELECT COUNT(*) FROM sentiment_cache").fetchone()[0]
+        overflow = count - self.max_entries
+        if self.max_entries > 0 and overflow > 0:
+            self._conn.execute(
+                """
+                DELETE FROM sentiment_cache WHERE cache_key IN (
+                    SELECT cache_key FROM sentiment_cache ORDER BY last_accessed_at ASC LIMIT ?
+                )
+                """,
+                (overflow,)
+            )
+            logger.info(f"情感分析缓存淘汰 {overflow} 条最久未访问的条目")
+
+        self._conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计（命中率为本进程启动以来的统计）"""
+        try:
+            with self._lock:
+                hits, misses = self._hits, self._misses
+                entries, total_hits = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(hit_count), 0) FROM sentiment_cache"
+                ).fetchone()
+
+            lookups = hits + misses
+            return {
+                'enabled': True,
+                'hits': hits,
+                'misses': misses,
+                'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+                'entries': entries,
+                'lifetime_hits': total_hits,
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds
+            }
+
+        except Exception as e:
+            logger.warning(f"获取情感分析缓存统计失败: {e}")
+            return {'enabled': True, 'error': str(e)}
+
+
+_sentiment_cache = None
+_sentiment_cache_lock = threading.Lock()
+
+
+def get_sentiment_cache() -> Optional[SentimentCache]:
+    """获取进程内共享的情感分析缓存；SENTIMENT_CACHE_ENABLED=false 或初始化失败时返回None"""
+    global _sentiment_cache
+    if os.getenv('SENTIMENT_CACHE_ENABLED', 'true').strip().lower() in ('0', 'false', 'no', 'off'):
+        return None
+
+    if _sentiment_cache is None:
+        with _sentiment_cache_lock:
+            if _sentiment_cache is None:
+                try:
+                    _sentiment_cache = SentimentCache()
+                except Exception as e:
+                    logger.error(f"情感分析缓存初始化失败，将不使用缓存: {e}")
+                    return None
+    return _sentiment_cache
@@ -0,0 +1,441 @@
+# -*- coding: utf-8 -*-
+"""
+情感分析本地预筛
+在调用OpenAI之前用情感词典打分（可选叠加基于历史 ai_sentiment 标签训练的朴素贝叶斯模型）给出本地判断，
+置信度达到阈值的评论直接采用本地结果，其余评论照常交给OpenAI；
+同时统计跳过比例以及本地判断与OpenAI标签的一致率，用于调整阈值
+
+运行模式（环境变量 SENTIMENT_PRESCREEN_MODE）：
+- off：不预筛
+- shadow：只做本地判断并与OpenAI结果比对，不跳过任何调用（默认）
+- on：置信度达到阈值的评论跳过OpenAI，并按 SENTIMENT_PRESCREEN_AUDIT_RATE 抽样送OpenAI复核
+"""
+
+import os
+import re
+import json
+import math
+import time
+import random
+import logging
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+
+from config.database_config import get_db_config
+
+logger = logging.getLogger(__name__)
+
+SENTIMENTS = ('positive', 'negative', 'neutral')
+
+
+class SentimentPreScreener:
+    """情感词典 + 朴素贝叶斯的本地情感预筛（线程安全）"""
+
+    POSITIVE_WORDS = [
+        # 中文
+        '好评', '喜欢', '满意', '推荐', '不错', '很好', '好用', '好看', '好吃', '优秀', '完美', '惊喜',
+        '值得', '舒服', '漂亮', '感谢', '谢谢', '支持', '开心', '超赞', '点赞', '给力', '靠谱', '回购',
+        '划算', '实惠', '贴心', '专业', '赞', '棒', '爱了',
+        # 英文
+        'love', 'great', 'excellent', 'amazing', 'awesome', 'good', 'best', 'perfect', 'recommend',
+        'happy', 'thanks', 'thank you', 'nice', 'beautiful', 'wonderful', 'favorite', 'favourite',
+        'satisfied', 'fantastic', 'brilliant', 'worth it',
+        # 表情
+        '👍', '❤️', '❤', '😍', '🥰', '😊', '👏', '💯'
+    ]
+
+    NEGATIVE_WORDS = [
+        # 中文
+        '差评', '失望', '垃圾', '难用', '退货', '退款', '投诉', '坑', '骗', '后悔', '糟糕', '恶心',
+        '生气', '太差', '很差', '烂', '故障', '坏了', '不满', '质量差', '服务差', '态度差', '难吃',
+        '难看', '假货', '拒绝', '避雷', '无语', '气死', '差劲',
+        # 英文
+        'bad', 'terrible', 'awful', 'worst', 'hate', 'disappointed', 'disappointing', 'broken', 'refund',
+        'poor', 'scam', 'waste', 'horrible', 'useless', 'angry', 'never again', 'rubbish', 'fake',
+        'defective', 'complaint',
+        # 表情
+        '👎', '😡', '😠', '🤬', '🤮', '💩'
+    ]
+
+    # 否定词：紧邻情感词之前（中文）或前三个词内（英文）出现时反转极性
+    ZH_NEGATORS = ('不', '没', '没有', '别', '不太', '不是')
+    EN_NEGATORS = {'not', 'no', 'never', "don't", "doesn't", "didn't", "isn't", "wasn't", "aren't",
+                   "can't", 'cannot', "won't", 'dont', 'doesnt', 'didnt', 'isnt', 'wasnt', 'cant'}
+
+    # 朴素贝叶斯模型至少需要的训练样本数
+    MIN_TRAINING_DOCUMENTS = 500
+
+    # 模型词表上限（按出现频次保留）
+    MAX_VOCABULARY = 50000
+
+    def __init__(self, mode: str = None, threshold: float = None, audit_rate: float = None, model_path: str = None):
+        """
+        Args:
+            mode: 运行模式 off/shadow/on，默认读取环境变量 SENTIMENT_PRESCREEN_MODE
+            threshold: 跳过OpenAI所需的最低本地置信度，默认读取环境变量 SENTIMENT_PRESCREEN_THRESHOLD
+            audit_rate: on 模式下置信评论仍送OpenAI复核的抽样比例，默认读取环境变量 SENTIMENT_PRESCREEN_AUDIT_RATE
+            model_path: 朴素贝叶斯模型文件路径，默认读取环境变量 SENTIMENT_PRESCREEN_MODEL_PATH
+        """
+        self.mode = (mode or os.getenv('SENTIMENT_PRESCREEN_MODE', 'shadow')).strip().lower()
+        if self.mode not in ('off', 'shadow', 'on'):
+            logger.warning(f"未知的情感预筛模式 {self.mode}，按 shadow 处理")
+            self.mode = 'shadow'
+        self.threshold = threshold if threshold is not None else float(os.getenv('SENTIMENT_PRESCREEN_THRESHOLD', 0.9))
+        self.audit_rate = audit_rate if audit_rate is not None else float(os.getenv('SENTIMENT_PRESCREEN_AUDIT_RATE', 0.05))
+
+        default_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'sentiment_prescreen_model.json')
+        self.model_path = model_path or os.getenv('SENTIMENT_PRESCREEN_MODEL_PATH', default_path)
+
+        self._lexicon_pattern = re.compile(
+            '|'.join(self._lexicon_regex(word) for word in sorted(set(self.POSITIVE_WORDS + self.NEGATIVE_WORDS), key=len, reverse=True))
+        )
+        self._positive_set = set(self.POSITIVE_WORDS)
+
+        self._lock = threading.Lock()
+        self._model = None
+        self._stats = self._empty_stats()
+
+        self._load_model()
+
+    @staticmethod
+    def _lexicon_regex(word: str) -> str:
+        """
+        情感词的匹配模式：英文词只在前后不是字母数字时命中（避免 badminton 命中 bad、goodbye 命中 good；
+        不用 \\b，中英文混排时紧邻汉字的英文词仍能命中），中文和表情按子串匹配
+        """
+        if word.isascii():
+            return rf'(?<![a-z0-9]){re.escape(word)}(?![a-z0-9])'
+        return re.escape(word)
+
+    @staticmethod
+    def _empty_stats() -> Dict[str, Any]:
+        return {
+            'screened': 0,
+            'confident': 0,
+            'skipped': 0,
+            'compared': 0,
+            'agreed': 0,
+            'confident_compared': 0,
+            'confident_agreed': 0,
+            # 按本地置信度分桶（0.5、0.6 ... 1.0）统计一致率，用于选择阈值
+            'buckets': defaultdict(lambda: {'compared': 0, 'agreed': 0})
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != 'off'
+
+    # ------------------------------------------------------------------
+    # 本地判断
+    # ------------------------------------------------------------------
+
+    def predict(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        本地情感判断
+
+        Returns:
+            {'sentiment', 'confidence', 'source'}；无法判断时返回None
+        """
+        if not self.enabled or not text or not str(text).strip():
+            return None
+
+        text = str(text)
+        lexicon = self._lexicon_score(text)
+        model = self._model_score(text)
+
+        if lexicon and model:
+            if lexicon[0] == model[0]:
+                # 两者一致时按独立证据合并置信度
+                prediction = (lexicon[0], 1 - (1 - lexicon[1]) * (1 - model[1]), 'lexicon+model')
+            else:
+                # 两者冲突时取置信度较高的一方并打折，通常低于阈值而交给OpenAI
+                winner = lexicon if lexicon[1] >= model[1] else model
+                prediction = (winner[0], abs(lexicon[1] - model[1]), 'conflict')
+        elif lexicon:
+            prediction = (lexicon[0], lexicon[1], 'lexicon')
+        elif model:
+            prediction = (model[0], model[1], 'model')
+        else:
+            return None
+
+        confidence = round(prediction[1], 4)
+        with self._lock:
+            self._stats['screened'] += 1
+            if confidence >= self.threshold:
+                self._stats['confident'] += 1
+
+        return {'sentiment': prediction[0], 'confidence': confidence, 'source': prediction[2]}
+
+    def should_skip(self, prediction: Optional[Dict[str, Any]]) -> bool:
+        """on 模式下置信度达到阈值且未被抽中复核的评论跳过OpenAI"""
+        if self.mode != 'on' or not prediction or prediction['confidence'] < self.threshold:
+            return False
+        if random.random() < self.audit_rate:
+            return False
+        with self._lock:
+            self._stats['skipped'] += 1
+        return True
+
+    def to_result(self, prediction: Dict[str, Any]) -> Dict[str, Any]:
+        """把本地判断转换为与 analyze_single_text 相同格式的结果"""
+        return {
+            'sentiment': prediction['sentiment'],
+            'confidence': prediction['confidence'],
+            'reasoning': f"本地预筛（{prediction['source']}）",
+            'source': 'prescreen',
+            'error': None
+        }
+
+    def record_comparison(self, prediction: Optional[Dict[str, Any]], llm_sentiment: str):
+        """记录本地判断与OpenAI标签是否一致"""
+        if not prediction or llm_sentiment not in SENTIMENTS:
+            return
+        agreed = prediction['sentiment'] == llm_sentiment
+        bucket = f"{min(math.floor(prediction['confidence'] * 10) / 10, 1.0):.1f}"
+        with self._lock:
+            self._stats['compared'] += 1
+            self._stats['agreed'] += int(agreed)
+            if prediction['confidence'] >= self.threshold:
+                self._stats['confident_compared'] += 1
+                self._stats['confident_agreed'] += int(agreed)
+            self._stats['buckets'][bucket]['compared'] += 1
+            self._stats['buckets'][bucket]['agreed'] += int(agreed)
+
+    def _lexicon_score(self, text: str) -> Optional[Tuple[str, float]]:
+        """情感词典打分：统计（考虑否定后的）正负情感词命中数"""
+        text_lower = text.lower()
+        positive_hits = 0
+        negative_hits = 0
+
+        for match in self._lexicon_pattern.finditer(text_lower):
+            is_positive = match.group(0) in self._positive_set
+            if self._is_negated(text_lower, match.start()):
+                is_positive = not is_positive
+            if is_positive:
+                positive_hits += 1
+            else:
+                negative_hits += 1
+
+        if positive_hits == negative_hits:
+            return None
+
+        sentiment = 'positive' if positive_hits > negative_hits else 'negative'
+        if positive_hits and negative_hits:
+            # 正负混合：按净命中数给出较低的置信度
+            confidence = min(0.8, 0.5 + 0.1 * abs(positive_hits - negative_hits))
+        else:
+            confidence = min(0.95, 0.7 + 0.1 * max(positive_hits, negative_hits))
+        return sentiment, confidence
+
+    def _is_negated(self, text_lower: str, start: int) -> bool:
+        """判断情感词前是否紧跟否定词"""
+        prefix = text_lower[max(0, start - 2):start]
+        if any(prefix.endswith(negator) for negator in self.ZH_NEGATORS):
+            return True
+        preceding_words = re.findall(r"[a-z']+", text_lower[max(0, start - 30):start])[-3:]
+        return any(word in self.EN_NEGATORS for word in preceding_words)
+
+    # ------------------------------------------------------------------
+    # 朴素贝叶斯模型
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _tokenize(text: str) -> List[str]:
+        """英文按词切分，中文按相邻两字切分"""
+        text_lower = str(text).lower()
+        tokens = re.findall(r"[a-z][a-z']+", text_lower)
+        for segment in re.findall(r'[一-鿿]+', text_lower):
+            if len(segment) == 1:
+                tokens.append(segment)
+            else:
+                tokens.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+        return tokens
+
+    def _model_score(self, text: str) -> Optional[Tuple[str, float]]:
+        """朴素贝叶斯后验概率最高的情感及其概率；模型未加载或没有已知特征时返回None"""
+        model = self._model
+        if model is None:
+            return None
+
+        tokens = [token for token in self._tokenize(text) if token in model['vocabulary']]
+        if not tokens:
+            return None
+
+        vocabulary_size = len(model['vocabulary'])
+        log_scores = {}
+        for sentiment, class_info in model['classes'].items():
+            denominator = class_info['token_total'] + vocabulary_size
+            score = class_info['log_prior']
+            token_counts = class_info['token_counts']
+            for token in tokens:
+                score += math.log((token_counts.get(token, 0) + 1) / denominator)
+            log_scores[sentiment] = score
+
+        best = max(log_scores, key=log_scores.get)
+        normalizer = sum(math.exp(score - log_scores[best]) for score in log_scores.values())
+        return best, 1.0 / normalizer
+
+    def train(self, samples: List[Tuple[str, str]]) -> Dict[str, Any]:
+        """
+        用 (文本, 情感标签) 样本训练朴素贝叶斯模型并保存
+
+        Returns:
+            训练结果统计
+        """
+        class_documents = Counter()
+        class_tokens: Dict[str, Counter] = {sentiment: Counter() for sentiment in SENTIMENTS}
+        document_frequency = Counter()
+
+        for text, sentiment in samples:
+            if sentiment not in SENTIMENTS or not text:
+                continue
+            tokens = self._tokenize(text)
+            if not tokens:
+                continue
+            class_documents[sentiment] += 1
+            class_tokens[sentiment].update(tokens)
+            document_frequency.update(set(tokens))
+
+        total_documents = sum(class_documents.values())
+        if total_documents < self.MIN_TRAINING_DOCUMENTS:
+            return {
+                'status': 'skipped',
+                'message': f'训练样本不足：{total_documents} 条（至少需要 {self.MIN_TRAINING_DOCUMENTS} 条）',
+                'documents': total_documents
+            }
+
+        # 只保留至少出现在两条评论中的特征，并按频次截断词表
+        vocabulary = [token for token, count in document_frequency.most_common(self.MAX_VOCABULARY) if count >= 2]
+        vocabulary_set = set(vocabulary)
+
+        classes = {}
+        for sentiment in SENTIMENTS:
+            if not class_documents[sentiment]:
+                continue
+            token_counts = {token: count for token, count in class_tokens[sentiment].items() if token in vocabulary_set}
+            classes[sentiment] = {
+                'log_prior': math.log(class_documents[sentiment] / total_documents),
+                'token_total': sum(token_counts.values()),
+                'token_counts': token_counts
+            }
+
+        model = {
+            'trained_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'documents': total_documents,
+            'class_documents': dict(class_documents),
+            'vocabulary': vocabulary,
+            'classes': classes
+        }
+
+        os.makedirs(os.path.dirname(self.model_path) or '.', exist_ok=True)
+        with open(self.model_path, 'w', encoding='utf-8') as f:
+            json.dump(model, f, ensure_ascii=False)
+
+        self._model = self._prepare_model(model)
+        logger.info(f"情感预筛模型训练完成：{total_documents} 条样本，词表 {len(vocabulary)} 个")
+
+        return {
+            'status': 'completed',
+            'documents': total_documents,
+            'class_documents': dict(class_documents),
+            'vocabulary_size': len(vocabulary),
+            'model_path': self.model_path
+        }
+
+    def train_from_database(self, limit: int = 20000, min_confidence: float = 0.7) -> Dict[str, Any]:
+        """
+        用DWD中已完成的高置信度OpenAI情感标签训练模型（最近的 limit 条）
+
+        预筛直接给出的标签（ai_sentiment_source = 'prescreen'）不参与训练，避免模型用自己的输出训练自己；
+        该字段为空的历史记录均来自OpenAI
+        """
+        sql = """
+            SELECT text, ai_sentiment
+            FROM dwd_dash_social_comments
+            WHERE ai_processing_status = 'completed'
+              AND ai_sentiment IN ('positive', 'negative', 'neutral')
+              AND ai_confidence >= %s
+              AND COALESCE(ai_sentiment_source, 'openai') = 'openai'
+            ORDER BY record_id DESC
+            LIMIT %s
+        """
+        rows = get_db_config().execute_query_dict(sql, (min_confidence, int(limit))) or []
+        return self.train([(row['text'], row['ai_sentiment']) for row in rows])
+
+    @staticmethod
+    def _prepare_model(model: Dict[str, Any]) -> Dict[str, Any]:
+        """把词表转换为集合以便快速查询"""
+        return {**model, 'vocabulary': set(model['vocabulary'])}
+
+    def _load_model(self):
+        """加载已训练的模型文件（不存在或损坏时只使用情感词典）"""
+        if not os.path.exists(self.model_path):
+            return
+        try:
+            with open(self.model_path, 'r', encoding='utf-8') as f:
+                self._model = self._prepare_model(json.load(f))
+            logger.info(f"情感预筛模型已加载：{self.model_path}（{self._model.get('documents', 0)} 条样本）")
+        except Exception as e:
+            logger.warning(f"加载情感预筛模型失败，将只使用情感词典: {e}")
+            self._model = None
+
+    # ------------------------------------------------------------------
+    # 统计
+    # ------------------------------------------------------------------
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取预筛统计（本进程启动以来）"""
+        with self._lock:
+            stats = {key: value for key, value in self._stats.items() if key != 'buckets'}
+            buckets = {bucket: dict(counts) for bucket, counts in sorted(self._stats['buckets'].items())}
+
+        def ratio(numerator, denominator):
+            return round(numerator / denominator, 4) if denominator else None
+
+        for counts in buckets.values():
+            counts['agreement_rate'] = ratio(counts['agreed'], counts['compared'])
+
+        model = self._model
+        stats.update({
+            'mode': self.mode,
+            'threshold': self.threshold,
+            'audit_rate': self.audit_rate,
+            'skip_ratio': ratio(stats['skipped'], stats['screened']),
+            'confident_ratio': ratio(stats['confident'], stats['screened']),
+            'agreement_rate': ratio(stats['agreed'], stats['compared']),
+            'confident_agreement_rate': ratio(stats['confident_agreed'], stats['confident_compared']),
+            'agreement_by_confidence': buckets,
+            'model': {
+                'loaded': model is not None,
+                'trained_at': model.get('trained_at') if model else None,
+                'documents': model.get('documents', 0) if model else 0
+            }
+        })
+        return stats
+
+    def reset_stats(self):
+        """清空统计（调整阈值后重新观察）"""
+        with self._lock:
+            self._stats = self._empty_stats()
+
+
+_sentiment_prescreener = None
+_sentiment_prescreener_lock = threading.Lock()
+
+
+def get_sentiment_prescreener() -> Optional[SentimentPreScreener]:
+    """获取进程内共享的情感预筛器；SENTIMENT_PRESCREEN_MODE=off 或初始化失败时返回None"""
+    global _sentiment_prescreener
+    if os.getenv('SENTIMENT_PRESCREEN_MODE', 'shadow').strip().lower() == 'off':
+        return None
+
+    if _sentiment_prescreener is None:
+        with _sentiment_prescreener_lock:
+            if _sentiment_prescreener is None:
+                try:
+                    _sentiment_prescreener = SentimentPreScreener()
+                except Exception as e:
+                    logger.error(f"情感预筛初始化失败，将不使用预筛: {e}")
+                    return None
+    return _sentiment_prescreener
@@ -6,10 +6,11 @@
 
 import os
 import logging
+import numpy as np
 import pandas as pd
 import uuid
 from datetime import datetime
-from typing import Tuple, Dict, Any, List
+from typing import Tuple, Dict, Any, List, Iterator, Callable, Optional
 from pathlib import Path
 
 from models.new_dash_social_model import ODSDashSocialComment, FileUploadLog
@@ -29,9 +30,24 @@ class SimpleFileProcessor:
     4. 数据验证和去重由ETL层负责
     """
     
+    # ODS批量插入的列顺序
+    ODS_INSERT_COLUMNS = [
+        'last_update', 'brand_label', 'author_name', 'channel', 'message_type', 'text', 'tags',
+        'post_link', 'sentiment', 'caption', 'upload_batch_id', 'original_row_index',
+        'processed_at', 'created_at', 'processed_flag'
+    ]
+
     def __init__(self):
         self.db_config = get_db_config()
         self.supported_formats = ['.xlsx', '.xls', '.csv']
+
+        # 批量写入配置（每个分块一条多行INSERT语句、一个事务）
+        self.bulk_insert_enabled = os.getenv('ODS_BULK_INSERT', 'true').strip().lower() not in ('0', 'false', 'no', 'off')
+        self.bulk_rows_per_statement = int(os.getenv('ODS_BULK_ROWS_PER_STATEMENT', 500))
+
+        # 流式导入配置（按分块读取、标准化并写入ODS，内存占用与文件大小无关）
+        self.streaming_enabled = os.getenv('ODS_STREAMING_INGEST', 'true').strip().lower() not in ('0', 'false', 'no', 'off')
+        self.stream_chunk_rows = int(os.getenv('ODS_STREAM_CHUNK_ROWS', 5000))
         
         # 预期的列名映射（支持中英文）
         self.column_mapping = {
@@ -157,6 +173,95 @@ class SimpleFileProcessor:
             logger.error(f"CSV文件读取失败: {e}")
             raise e
     
+    def iter_file_chunks(self, file_path: str, chunk_rows: int = None) -> Iterator[pd.DataFrame]:
+        """
+        流式分块读取文件，每次返回不超过 chunk_rows 行的DataFrame（行索引在整个文件内连续）
+
+        CSV使用pandas分块读取，xlsx使用openpyxl只读模式逐行迭代；
+        无法流式读取的文件（如.xls、编码探测失败的CSV）退回整文件读取，作为单个分块返回
+        """
+        chunk_rows = max(1, int(chunk_rows or self.stream_chunk_rows))
+        file_extension = Path(file_path).suffix.lower()
+
+        if file_extension == '.xlsx':
+            yield from self._iter_excel_chunks(file_path, chunk_rows)
+            return
+
+        if file_extension == '.csv':
+            reader, error_msg = CSVHelper.iter_csv_chunks(file_path, chunk_rows)
+            if reader is not None:
+                yield from reader
+                return
+            logger.warning(f"CSV流式读取不可用（{error_msg}），退回整文件读取")
+
+        df, error_msg = self.read_file(file_path)
+        if df is None:
+            raise Exception(error_msg)
+        yield df
+
+    def _iter_excel_chunks(self, file_path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+        """使用openpyxl只读模式按行读取第一个工作表（空行跳过，空单元格与空字符串按缺失值处理，同 pd.read_excel）"""
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+
+            def is_blank(values) -> bool:
+                return all(value is None or value == '' for value in values)
+
+            # 第一行非空行作为表头
+            header = next((row for row in rows if not is_blank(row)), None)
+            if header is None:
+                return
+            columns = self._build_excel_columns(header)
+            width = len(columns)
+
+            buffer = []
+            offset = 0
+            for row in rows:
+                if is_blank(row):
+                    continue
+                values = list(row[:width])
+                values.extend([None] * (width - len(values)))
+                buffer.append(values)
+
+                if len(buffer) >= chunk_rows:
+                    yield self._excel_rows_to_frame(buffer, columns, offset)
+                    offset += len(buffer)
+                    buffer = []
+
+            if buffer:
+                yield self._excel_rows_to_frame(buffer, columns, offset)
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def _build_excel_columns(header: tuple) -> List[Any]:
+        """构建Excel列名：去掉末尾空表头，空表头命名为 Unnamed: N，重复列名追加 .1/.2（同 pd.read_excel）"""
+        header = list(header)
+        while header and (header[-1] is None or header[-1] == ''):
+            header.pop()
+
+        columns = []
+        seen = {}
+        for i, name in enumerate(header):
+            if name is None or name == '':
+                name = f"Unnamed: {i}"
+            if name in seen:
+                seen[name] += 1
+                name = f"{name}.{seen[name]}"
+            else:
+                seen[name] = 0
+            columns.append(name)
+        return columns
+
+    @staticmethod
+    def _excel_rows_to_frame(rows: List[list], columns: List[Any], offset: int) -> pd.DataFrame:
+        """把一个分块的行数据转为DataFrame，行索引从 offset 开始"""
+        chunk = pd.DataFrame(rows, columns=columns, index=range(offset, offset + len(rows)))
+        return chunk.mask(chunk.isna() | (chunk == ''), np.nan)
+
     def clean_and_standardize_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         ODS层数据处理：仅做列名标准化，保留所有原始数据
@@ -232,10 +337,136 @@ class SimpleFileProcessor:
     
     # 必填字段验证方法已移除：数据验证由ETL过程（ODS→DWD）负责
     
-    def save_to_ods(self, df: pd.DataFrame, batch_id: str) -> Tuple[int, int]:
+    def save_to_ods(self, df: pd.DataFrame, batch_id: str, bulk_insert: bool = None,
+                    rows_per_statement: int = None) -> Tuple[int, int]:
         """
-        保存数据到ODS表（优化版 - 静默处理重复数据并输出汇总）
-        
+        保存数据到ODS表
+
+        默认使用批量写入模式：按分块构建参数化的多行INSERT，每个分块一个事务；
+        bulk_insert=False 时退回逐行插入模式
+
+        Args:
+            df: 标准化后的数据
+            batch_id: 上传批次ID
+            bulk_insert: 是否使用批量写入，默认读取环境变量 ODS_BULK_INSERT
+            rows_per_statement: 每条多行INSERT语句（即每个分块）的行数，默认读取环境变量 ODS_BULK_ROWS_PER_STATEMENT
+
+        Returns:
+            (success_count, error_count)
+        """
+        if bulk_insert is None:
+            bulk_insert = self.bulk_insert_enabled
+
+        if bulk_insert:
+            return self._save_to_ods_bulk(df, batch_id, rows_per_statement or self.bulk_rows_per_statement)
+
+        return self._save_to_ods_row_by_row(df, batch_id)
+
+    def _save_to_ods_bulk(self, df: pd.DataFrame, batch_id: str, rows_per_statement: int) -> Tuple[int, int]:
+        """
+        批量写入ODS表：每个分块一条多行INSERT + 一个事务
+
+        分块失败时整块回滚并计入失败数，不影响其他分块
+
+        Returns:
+            (success_count, error_count)
+        """
+        success_count = 0
+        error_count = 0
+        rows_per_statement = max(1, int(rows_per_statement))
+
+        try:
+            total_rows = len(df)
+            total_chunks = (total_rows + rows_per_statement - 1) // rows_per_statement
+            logger.info(f"开始批量插入 {total_rows} 条数据到ODS表（每块 {rows_per_statement} 行，共 {total_chunks} 块）...")
+
+            params_list = self._build_ods_params(df, batch_id)
+            sql = f"""
+                INSERT INTO ods_dash_social_comments
+                ({', '.join(self.ODS_INSERT_COLUMNS)})
+                VALUES ({', '.join(['%s'] * len(self.ODS_INSERT_COLUMNS))})
+            """
+
+            for chunk_no, start in enumerate(range(0, total_rows, rows_per_statement), start=1):
+                chunk = params_list[start:start + rows_per_statement]
+                try:
+                    self.db_config.execute_insert_many(sql, chunk)
+                    success_count += len(chunk)
+                    logger.info(f"ODS分块 {chunk_no}/{total_chunks} 写入成功：{len(chunk)} 条")
+                except Exception as e:
+                    error_count += len(chunk)
+                    logger.error(f"ODS分块 {chunk_no}/{total_chunks} 写入失败（第 {start} - {start + len(chunk) - 1} 行）：{e}")
+
+            logger.info(f"📊 ODS数据保存完成：成功 {success_count} 条，失败 {error_count} 条")
+            return success_count, error_count
+
+        except Exception as e:
+            logger.error(f"批量保存数据失败：{e}")
+            # 未处理的行计入失败
+            return success_count, len(df) - success_count
+
+    def _build_ods_params(self, df: pd.DataFrame, batch_id: str) -> List[tuple]:
+        """
+        按列构建ODS批量插入参数（顺序与 ODS_INSERT_COLUMNS 一致）
+
+        文本字段与逐行模式保持一致：缺失列写入空字符串，其余值统一转为字符串
+        """
+        row_count = len(df)
+
+        def text_column(name: str) -> List[str]:
+            if name not in df.columns:
+                return [''] * row_count
+            column = df[name]
+            # 重复列名时取第一列
+            if isinstance(column, pd.DataFrame):
+                column = column.iloc[:, 0]
+            return column.astype(str).tolist()
+
+        if 'last_update' in df.columns:
+            column = df['last_update']
+            if isinstance(column, pd.DataFrame):
+                column = column.iloc[:, 0]
+            last_updates = [self._format_ods_datetime(value) for value in column.tolist()]
+        else:
+            last_updates = [None] * row_count
+
+        now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        row_indexes = [int(index) for index in df.index]
+
+        return list(zip(
+            last_updates,
+            text_column('brand_label'),
+            text_column('author_name'),
+            text_column('channel'),
+            text_column('message_type'),
+            text_column('text'),
+            text_column('tags'),
+            text_column('post_link'),
+            text_column('sentiment'),
+            text_column('caption'),
+            [batch_id] * row_count,
+            row_indexes,
+            [now_str] * row_count,
+            [now_str] * row_count,
+            [0] * row_count
+        ))
+
+    @staticmethod
+    def _format_ods_datetime(value) -> Any:
+        """时间字段格式化（与逐行模式一致：NaT/无法格式化的值写入NULL）"""
+        if value is None:
+            return None
+        try:
+            if pd.isna(value):
+                return None
+            return value.strftime('%Y-%m-%d %H:%M:%S')
+        except (AttributeError, ValueError, TypeError):
+            return None
+
+    def _save_to_ods_row_by_row(self, df: pd.DataFrame, batch_id: str) -> Tuple[int, int]:
+        """
+        逐行保存数据到ODS表（优化版 - 静默处理重复数据并输出汇总）
+
         Returns:
             (success_count, error_count)
         """
@@ -343,7 +574,64 @@ class SimpleFileProcessor:
         
         return sql
     
-    def process_file(self, file_path: str, filename: str = None, user_id: str = None) -> Tuple[bool, str, Dict[str, Any]]:
+    def _ingest_streaming(self, file_path: str, batch_id: str, upload_log: FileUploadLog,
+                          progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> Tuple[int, int]:
+        """
+        流式导入：逐块读取 → 列名标准化 → 批量写入ODS，写完一块再读下一块
+
+        每块完成后更新上传日志中的行数统计，并回调 progress_callback 报告进度
+
+        Returns:
+            (success_count, error_count)
+        """
+        success_count = 0
+        error_count = 0
+        rows_read = 0
+        source_columns = None
+        standardized_columns = None
+
+        for chunk_no, chunk in enumerate(self.iter_file_chunks(file_path), start=1):
+            rows_read += len(chunk)
+
+            # 列名映射只依赖表头，首块计算后复用
+            if source_columns is None or list(chunk.columns) != source_columns:
+                source_columns = list(chunk.columns)
+                chunk = self._standardize_columns(chunk)
+                standardized_columns = list(chunk.columns)
+            else:
+                chunk.columns = standardized_columns
+
+            chunk_success, chunk_error = self.save_to_ods(chunk, batch_id, bulk_insert=True)
+            success_count += chunk_success
+            error_count += chunk_error
+
+            upload_log.original_rows = rows_read
+            upload_log.processed_rows = rows_read
+            upload_log.success_rows = success_count
+            upload_log.error_rows = error_count
+            self._update_upload_log(upload_log)
+
+            progress = {
+                'batch_id': batch_id,
+                'stage': 'ods',
+                'chunk': chunk_no,
+                'rows_read': rows_read,
+                'success_rows': success_count,
+                'error_rows': error_count
+            }
+            logger.info(f"流式导入分块 {chunk_no} 完成：已读取 {rows_read} 行，成功 {success_count} 条，失败 {error_count} 条")
+
+            if progress_callback:
+                try:
+                    progress_callback(progress)
+                except Exception as e:
+                    logger.warning(f"导入进度回调失败: {e}")
+
+        return success_count, error_count
+
+    def process_file(self, file_path: str, filename: str = None, user_id: str = None,
+                     streaming: bool = None,
+                     progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> Tuple[bool, str, Dict[str, Any]]:
         """
         处理文件的主入口（简化版）
         
@@ -351,10 +639,15 @@ class SimpleFileProcessor:
             file_path: 文件路径
             filename: 文件名
             user_id: 用户ID（支持多用户隔离）
+            streaming: 是否使用流式分块导入，默认读取环境变量 ODS_STREAMING_INGEST
+            progress_callback: 流式导入时每个分块完成后的进度回调
         
         Returns:
             (success, error_message, result_stats)
         """
+        if streaming is None:
+            streaming = self.streaming_enabled
+        
         try:
             # 生成批次ID
             batch_id = f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
@@ -389,33 +682,45 @@ class SimpleFileProcessor:
                 self._update_upload_log(upload_log)
                 return False, error_msg, {}
             
-            # 2. 读取文件
-            df, error_msg = self.read_file(file_path)
-            if df is None:
-                upload_log.status = 'failed'
-                upload_log.error_message = error_msg
-                upload_log.process_end_time = datetime.now()
-                upload_log.original_rows = 0
-                self._update_upload_log(upload_log)
-                return False, error_msg, {}
-            
-            upload_log.original_rows = len(df)
-            
-            # 3. 清洗数据
-            df_cleaned = self.clean_and_standardize_data(df)
-            upload_log.processed_rows = len(df_cleaned)
-            
-            if df_cleaned.empty:
-                upload_log.status = 'failed'
-                upload_log.error_message = "数据清洗后无有效数据"
-                upload_log.process_end_time = datetime.now()
-                upload_log.success_rows = 0
-                upload_log.error_rows = upload_log.original_rows
-                self._update_upload_log(upload_log)
-                return False, "数据清洗后无有效数据", {}
-            
-            # 4. 保存到ODS表
-            success_count, error_count = self.save_to_ods(df_cleaned, batch_id)
+            if streaming:
+                # 2-4. 流式分块读取、标准化并保存到ODS表
+                success_count, error_count = self._ingest_streaming(file_path, batch_id, upload_log, progress_callback)
+                
+                if upload_log.original_rows == 0:
+                    error_msg = "文件为空或无法读取有效数据"
+                    upload_log.status = 'failed'
+                    upload_log.error_message = error_msg
+                    upload_log.process_end_time = datetime.now()
+                    self._update_upload_log(upload_log)
+                    return False, error_msg, {}
+            else:
+                # 2. 读取文件
+                df, error_msg = self.read_file(file_path)
+                if df is None:
+                    upload_log.status = 'failed'
+                    upload_log.error_message = error_msg
+                    upload_log.process_end_time = datetime.now()
+                    upload_log.original_rows = 0
+                    self._update_upload_log(upload_log)
+                    return False, error_msg, {}
+                
+                upload_log.original_rows = len(df)
+                
+                # 3. 清洗数据
+                df_cleaned = self.clean_and_standardize_data(df)
+                upload_log.processed_rows = len(df_cleaned)
+                
+                if df_cleaned.empty:
+                    upload_log.status = 'failed'
+                    upload_log.error_message = "数据清洗后无有效数据"
+                    upload_log.process_end_time = datetime.now()
+                    upload_log.success_rows = 0
+                    upload_log.error_rows = upload_log.original_rows
+                    self._update_upload_log(upload_log)
+                    return False, "数据清洗后无有效数据", {}
+                
+                # 4. 保存到ODS表
+                success_count, error_count = self.save_to_ods(df_cleaned, batch_id)
             
             # 5. 更新上传日志
             upload_log.success_rows = success_count
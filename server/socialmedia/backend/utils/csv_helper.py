@@ -8,7 +8,7 @@ import os
 import logging
 import chardet
 import pandas as pd
-from typing import Tuple, Dict, Any, Optional
+from typing import Tuple, Dict, Any, Optional, Iterator
 
 logger = logging.getLogger(__name__)
 
@@ -257,6 +257,41 @@ class CSVHelper:
         
         return None, "所有简单读取方法都失败"
     
+    @staticmethod
+    def iter_csv_chunks(file_path: str, chunk_rows: int = 5000) -> Tuple[Optional[Iterator[pd.DataFrame]], str]:
+        """
+        流式分块读取CSV（内存占用与分块大小相关，与文件大小无关）
+
+        先用前100行探测编码和分隔符（规则同 read_csv_simple），再按 chunk_rows 返回分块迭代器；
+        分块的行索引在整个文件内连续
+
+        Returns:
+            (分块迭代器 or None, error_message)
+        """
+        encodings = ['utf-8', 'utf-8-sig', 'gbk', 'gb2312', 'gb18030', 'iso-8859-1', 'cp1252', 'latin1']
+        separators = [',', ';', '\t', '|']
+
+        for encoding in encodings:
+            for separator in separators:
+                try:
+                    sample = pd.read_csv(file_path, encoding=encoding, sep=separator, nrows=100)
+                    if len(sample) == 0 or len(sample.columns) <= 1:
+                        continue
+
+                    logger.info(f"流式CSV读取：编码={encoding}, 分隔符='{separator}', 每块 {chunk_rows} 行")
+                    read_params = {'encoding': encoding, 'sep': separator, 'chunksize': chunk_rows}
+                    try:
+                        # 探测只覆盖文件开头，后续出现的无法解码字符替换处理，避免读到一半失败
+                        return pd.read_csv(file_path, encoding_errors='replace', **read_params), ""
+                    except TypeError:
+                        # 旧版pandas不支持encoding_errors参数
+                        return pd.read_csv(file_path, **read_params), ""
+
+                except Exception:
+                    continue
+
+        return None, "无法探测CSV编码和分隔符"
+
     @staticmethod
     def read_csv_robust(file_path: str, max_attempts: int = 10) -> Tuple[Optional[pd.DataFrame], str]:
         """
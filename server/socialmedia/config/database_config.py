@@ -6,12 +6,216 @@
 """
 
 import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
 import yaml
 import pymysql
 import pandas as pd
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Callable
 from dotenv import load_dotenv
 
+
+class PoolTimeoutError(Exception):
+    """等待连接池空闲连接超时"""
+    pass
+
+
+class _PooledConnection:
+    """连接池中的连接及其元数据"""
+
+    __slots__ = ('connection', 'created_at', 'last_used_at', 'generation')
+
+    def __init__(self, connection, generation: int):
+        now = time.monotonic()
+        self.connection = connection
+        self.created_at = now
+        self.last_used_at = now
+        self.generation = generation
+
+
+class ConnectionPool:
+    """
+    有界、线程安全的数据库连接池
+
+    - 借出/归还（acquire/release），连接数不超过 max_size，满时等待空闲连接
+    - 连接空闲超过 pre_ping_idle_seconds 才在借出前 ping，避免每次借用都多一次往返
+    - 连接存活超过 max_lifetime_seconds 后回收重建（需小于服务端 wait_timeout）
+    - 记录借出次数、等待次数与等待耗时等指标
+    """
+
+    def __init__(self, creator: Callable[[], Any], max_size: int = 10, acquire_timeout: float = 30.0,
+                 pre_ping_idle_seconds: float = 30.0, max_lifetime_seconds: float = 1800.0):
+        self._creator = creator
+        self.max_size = max(1, int(max_size))
+        self.acquire_timeout = float(acquire_timeout)
+        self.pre_ping_idle_seconds = float(pre_ping_idle_seconds)
+        self.max_lifetime_seconds = float(max_lifetime_seconds)
+
+        self._cond = threading.Condition()
+        self._idle = deque()       # 空闲连接（后进先出，优先复用最近使用的连接）
+        self._in_use = {}          # id(connection) -> _PooledConnection
+        self._size = 0             # 已创建（含借出中）的连接数
+        self._generation = 0       # close_all 后递增，旧连接归还时直接关闭
+
+        self._stats = {
+            'checkouts': 0,
+            'connections_created': 0,
+            'connections_recycled': 0,
+            'ping_failures': 0,
+            'waits': 0,
+            'wait_timeouts': 0,
+            'total_wait_seconds': 0.0,
+            'max_wait_seconds': 0.0
+        }
+
+    def acquire(self, timeout: Optional[float] = None):
+        """借出一个连接，池满时最多等待 timeout 秒"""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        start = time.monotonic()
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    # 预占一个名额，在锁外创建连接
+                    self._size += 1
+                    entry = None
+                    break
+
+                remaining = timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._stats['wait_timeouts'] += 1
+                    raise PoolTimeoutError(f"获取数据库连接超时（{timeout:.0f}秒），连接池已满：{self.max_size}")
+                waited = True
+                self._cond.wait(remaining)
+
+            if waited:
+                wait_seconds = time.monotonic() - start
+                self._stats['waits'] += 1
+                self._stats['total_wait_seconds'] += wait_seconds
+                self._stats['max_wait_seconds'] = max(self._stats['max_wait_seconds'], wait_seconds)
+            generation = self._generation
+
+        try:
+            entry = self._prepare_entry(entry, generation)
+        except Exception:
+            # 创建失败，释放预占的名额
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._in_use[id(entry.connection)] = entry
+            self._stats['checkouts'] += 1
+        return entry.connection
+
+    def _prepare_entry(self, entry: Optional[_PooledConnection], generation: int) -> _PooledConnection:
+        """校验借出的空闲连接（超龄回收、空闲过久时ping），必要时新建连接"""
+        now = time.monotonic()
+
+        if entry is not None:
+            if entry.generation != generation or now - entry.created_at > self.max_lifetime_seconds:
+                self._close_quietly(entry.connection)
+                self._incr_stat('connections_recycled')
+                entry = None
+            elif now - entry.last_used_at > self.pre_ping_idle_seconds:
+                try:
+                    entry.connection.ping(reconnect=False)
+                except Exception as e:
+                    print(f"连接检查失败，重新创建连接: {e}")
+                    self._close_quietly(entry.connection)
+                    self._incr_stat('ping_failures')
+                    entry = None
+
+        if entry is None:
+            entry = _PooledConnection(self._creator(), generation)
+            self._incr_stat('connections_created')
+
+        return entry
+
+    def release(self, connection, discard: bool = False):
+        """归还连接；discard=True、连接已关闭或已超龄时直接关闭"""
+        with self._cond:
+            entry = self._in_use.pop(id(connection), None)
+            if entry is None:
+                # 非本池借出的连接
+                return
+
+            now = time.monotonic()
+            close_it = (
+                discard
+                or not getattr(connection, 'open', True)
+                or entry.generation != self._generation
+                or now - entry.created_at > self.max_lifetime_seconds
+            )
+            if close_it:
+                self._size -= 1
+            else:
+                entry.last_used_at = now
+                self._idle.append(entry)
+            self._cond.notify()
+
+        if close_it:
+            self._close_quietly(connection)
+
+    @contextmanager
+    def connection(self):
+        """借用连接的上下文管理器；连接级错误（断连等）时丢弃该连接"""
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def close_all(self):
+        """关闭所有空闲连接，借出中的连接在归还时关闭"""
+        with self._cond:
+            idle_entries = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle_entries)
+            self._generation += 1
+            self._cond.notify_all()
+
+        for entry in idle_entries:
+            self._close_quietly(entry.connection)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接池统计信息"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use)
+            })
+        stats['avg_wait_seconds'] = round(stats['total_wait_seconds'] / stats['waits'], 4) if stats['waits'] else 0.0
+        stats['total_wait_seconds'] = round(stats['total_wait_seconds'], 4)
+        stats['max_wait_seconds'] = round(stats['max_wait_seconds'], 4)
+        return stats
+
+    def _incr_stat(self, key: str):
+        with self._cond:
+            self._stats[key] += 1
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
 class DatabaseConfig:
     """数据库配置管理类"""
     
@@ -28,7 +232,16 @@ class DatabaseConfig:
         
         self.config_path = config_path or self._find_config_file()
         self.config = self._load_config()
-        self.connection = None
+        self._pymysql_params = None
+
+        # 连接池：并发请求、ETL和AI批处理各自借用独立连接
+        self.pool = ConnectionPool(
+            self._create_connection,
+            max_size=int(os.getenv('DB_POOL_SIZE', 10)),
+            acquire_timeout=float(os.getenv('DB_POOL_TIMEOUT', 30)),
+            pre_ping_idle_seconds=float(os.getenv('DB_POOL_PRE_PING_IDLE', 30)),
+            max_lifetime_seconds=float(os.getenv('DB_POOL_MAX_LIFETIME', 1800))
+        )
         
     def _find_config_file(self) -> str:
         """查找cfg.yaml配置文件"""
@@ -263,105 +476,122 @@ class DatabaseConfig:
         
         return env_config
     
-    def get_connection(self):
-        """获取数据库连接，支持自动重连和SSL"""
-        if self.connection is None or not self._is_connection_alive():
-            # 关闭旧连接
-            self.close_connection()
-            
-            # 创建新连接，增加超时和重连设置
-            db_config = self.get_database_config()
-            
-            # 获取SSL配置
-            ssl_config = self._get_ssl_config(db_config)
-            
-            # 创建连接参数
-            connection_params = self._create_safe_connection_params(db_config, ssl_config)
-            
-            # 确保charset有有效值
-            charset = connection_params.get('charset', 'utf8mb4')
-            if not charset:
-                charset = 'utf8mb4'
-                print("警告: 字符集配置无效，使用默认值: utf8mb4")
-            
-            # 准备PyMySQL连接参数
-            pymysql_params = {
-                'host': connection_params.get('host', 'localhost'),
-                'port': connection_params.get('port', 4000),
-                'user': connection_params.get('username', 'root'),
-                'password': connection_params.get('password', ''),
-                'database': connection_params.get('database', 'mkt'),
-                'charset': charset,
-                'autocommit': True,
-                'cursorclass': pymysql.cursors.DictCursor,
-                # 连接超时设置
-                'connect_timeout': 30,        # 连接超时30秒
-                'read_timeout': 60,           # 读取超时60秒
-                'write_timeout': 60,          # 写入超时60秒
-                # 保持连接活跃
-                'init_command': "SET SESSION wait_timeout=3600"  # 1小时会话超时
-            }
-            
-            # 添加SSL配置
-            if ssl_config:
-                if 'ssl' in ssl_config and ssl_config['ssl']:
-                    # 对于TiDB Cloud，使用基本的SSL配置
-                    # PyMySQL期望ssl参数是一个字典，而不是布尔值
-                    pymysql_params['ssl'] = {}
-                    print("添加SSL参数: ssl = {}")
-                
-                # 添加其他SSL参数（如果存在）
-                for key, value in ssl_config.items():
-                    if key.startswith('ssl_') and key != 'ssl':
-                        pymysql_params[key] = value
-                        print(f"添加SSL参数: {key} = {value}")
-            
-            # 只有在SSL模式不是DISABLED时才处理SSL参数
-            ssl_mode = os.getenv('DB_SSL_MODE', 'DISABLED').strip()
-            if ssl_mode != 'DISABLED':
-                # 特殊处理：如果环境变量中有SSL_CA，直接添加到连接参数
-                ssl_ca = os.getenv('DB_SSL_CA', '')
-                if ssl_ca:
-                    resolved_ca_path = self._resolve_ssl_path(ssl_ca)
-                    if resolved_ca_path and os.path.exists(resolved_ca_path):
-                        pymysql_params['ssl_ca'] = resolved_ca_path
-                        print(f"添加SSL参数: ssl_ca = {resolved_ca_path}")
-                    else:
-                        print(f"警告: CA证书文件不存在: {ssl_ca}")
-                
-                # 确保SSL参数存在（TiDB Cloud要求）
-                if 'ssl' not in pymysql_params:
-                    pymysql_params['ssl'] = {}
-                    print("强制添加SSL参数: ssl = {} (TiDB Cloud要求)")
-            else:
-                print("SSL已完全禁用，不添加任何SSL参数")
-            
-            # 调试：打印最终的连接参数（隐藏敏感信息）
-            debug_params = pymysql_params.copy()
-            if 'password' in debug_params:
-                debug_params['password'] = '***'
-            print(f"最终PyMySQL连接参数: {debug_params}")
-            
-            try:
-                self.connection = pymysql.connect(**pymysql_params)
-                print(f"数据库连接成功: {connection_params.get('host')}:{connection_params.get('port')}")
-            except Exception as e:
-                print(f"数据库连接失败: {e}")
-                print(f"连接参数: {debug_params}")
-                raise
-        return self.connection
-    
-    def _is_connection_alive(self):
-        """检查连接是否活跃"""
+    def _build_pymysql_params(self) -> Dict[str, Any]:
+        """构建PyMySQL连接参数（只在首次创建连接时计算并缓存）"""
+        if self._pymysql_params is not None:
+            return self._pymysql_params
+
+        db_config = self.get_database_config()
+
+        # 获取SSL配置
+        ssl_config = self._get_ssl_config(db_config)
+
+        # 创建连接参数
+        connection_params = self._create_safe_connection_params(db_config, ssl_config)
+
+        # 确保charset有有效值
+        charset = connection_params.get('charset', 'utf8mb4')
+        if not charset:
+            charset = 'utf8mb4'
+            print("警告: 字符集配置无效，使用默认值: utf8mb4")
+
+        # 准备PyMySQL连接参数
+        pymysql_params = {
+            'host': connection_params.get('host', 'localhost'),
+            'port': connection_params.get('port', 4000),
+            'user': connection_params.get('username', 'root'),
+            'password': connection_params.get('password', ''),
+            'database': connection_params.get('database', 'mkt'),
+            'charset': charset,
+            'autocommit': True,
+            'cursorclass': pymysql.cursors.DictCursor,
+            # 连接超时设置
+            'connect_timeout': 30,        # 连接超时30秒
+            'read_timeout': 60,           # 读取超时60秒
+            'write_timeout': 60,          # 写入超时60秒
+            # 保持连接活跃
+            'init_command': "SET SESSION wait_timeout=3600"  # 1小时会话超时
+        }
+
+        # 添加SSL配置
+        if ssl_config:
+            if 'ssl' in ssl_config and ssl_config['ssl']:
+                # 对于TiDB Cloud，使用基本的SSL配置
+                # PyMySQL期望ssl参数是一个字典，而不是布尔值
+                pymysql_params['ssl'] = {}
+                print("添加SSL参数: ssl = {}")
+
+            # 添加其他SSL参数（如果存在）
+            for key, value in ssl_config.items():
+                if key.startswith('ssl_') and key != 'ssl':
+                    pymysql_params[key] = value
+                    print(f"添加SSL参数: {key} = {value}")
+
+        # 只有在SSL模式不是DISABLED时才处理SSL参数
+        ssl_mode = os.getenv('DB_SSL_MODE', 'DISABLED').strip()
+        if ssl_mode != 'DISABLED':
+            # 特殊处理：如果环境变量中有SSL_CA，直接添加到连接参数
+            ssl_ca = os.getenv('DB_SSL_CA', '')
+            if ssl_ca:
+                resolved_ca_path = self._resolve_ssl_path(ssl_ca)
+                if resolved_ca_path and os.path.exists(resolved_ca_path):
+                    pymysql_params['ssl_ca'] = resolved_ca_path
+                    print(f"添加SSL参数: ssl_ca = {resolved_ca_path}")
+                else:
+                    print(f"警告: CA证书文件不存在: {ssl_ca}")
+
+            # 确保SSL参数存在（TiDB Cloud要求）
+            if 'ssl' not in pymysql_params:
+                pymysql_params['ssl'] = {}
+                print("强制添加SSL参数: ssl = {} (TiDB Cloud要求)")
+        else:
+            print("SSL已完全禁用，不添加任何SSL参数")
+
+        # 调试：打印最终的连接参数（隐藏敏感信息）
+        debug_params = pymysql_params.copy()
+        if 'password' in debug_params:
+            debug_params['password'] = '***'
+        print(f"最终PyMySQL连接参数: {debug_params}")
+
+        self._pymysql_params = pymysql_params
+        return pymysql_params
+
+    def _create_connection(self):
+        """创建一个新的数据库连接（由连接池调用）"""
+        pymysql_params = self._build_pymysql_params()
         try:
-            if self.connection is None:
-                return False
-            self.connection.ping(reconnect=False)
-            return True
+            return pymysql.connect(**pymysql_params)
         except Exception as e:
-            print(f"连接检查失败: {e}")
-            return False
-    
+            print(f"数据库连接失败: {pymysql_params.get('host')}:{pymysql_params.get('port')} - {e}")
+            raise
+
+    def get_connection(self):
+        """
+        从连接池借出一个数据库连接
+
+        调用方用完后必须通过 release_connection 归还；
+        优先使用 pooled_connection() 上下文管理器自动归还
+        """
+        return self.pool.acquire()
+
+    def release_connection(self, connection, discard: bool = False):
+        """
+        归还数据库连接到连接池
+
+        Args:
+            connection: get_connection 借出的连接
+            discard: 是否直接丢弃该连接（连接已损坏时使用）
+        """
+        self.pool.release(connection, discard=discard)
+
+    def pooled_connection(self):
+        """借用连接的上下文管理器，退出时自动归还（连接级错误时丢弃）"""
+        return self.pool.connection()
+
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """获取连接池统计信息（包括等待指标）"""
+        return self.pool.get_stats()
+
     def execute_query(self, sql: str, params: Optional[tuple] = None) -> pd.DataFrame:
         """
         执行SQL查询
@@ -374,29 +604,28 @@ class DatabaseConfig:
             查询结果DataFrame
         """
         try:
-            connection = self.get_connection()
-            
             # 在Docker环境中，pandas可能无法正确处理PyMySQL连接
             # 使用cursor执行查询，然后转换为DataFrame
-            with connection.cursor() as cursor:
-                cursor.execute(sql, params)
-                rows = cursor.fetchall()
-                
-                if not rows:
-                    # 如果没有结果，返回空的DataFrame
-                    return pd.DataFrame()
-                
-                # 获取列名
-                if cursor.description:
-                    columns = [desc[0] for desc in cursor.description]
-                else:
-                    # 如果没有列描述，使用默认列名
-                    columns = [f'col_{i}' for i in range(len(rows[0]) if rows else 0)]
-                
-                # 创建DataFrame
-                df = pd.DataFrame(rows, columns=columns)
-                return df
-                
+            with self.pooled_connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, params)
+                    rows = cursor.fetchall()
+
+                    if not rows:
+                        # 如果没有结果，返回空的DataFrame
+                        return pd.DataFrame()
+
+                    # 获取列名
+                    if cursor.description:
+                        columns = [desc[0] for desc in cursor.description]
+                    else:
+                        # 如果没有列描述，使用默认列名
+                        columns = [f'col_{i}' for i in range(len(rows[0]) if rows else 0)]
+
+                    # 创建DataFrame
+                    df = pd.DataFrame(rows, columns=columns)
+                    return df
+
         except Exception as e:
             print(f"SQL查询执行失败: {e}")
             raise
@@ -415,17 +644,16 @@ class DatabaseConfig:
         max_retries = 3
         for attempt in range(max_retries):
             try:
-                connection = self.get_connection()
-                with connection.cursor() as cursor:
-                    cursor.execute(sql, params)
-                    # 使用DictCursor，直接返回字典列表
-                    rows = cursor.fetchall()
-                    return rows
+                # 连接级错误时连接池会丢弃该连接，重试时自动换新连接
+                with self.pooled_connection() as connection:
+                    with connection.cursor() as cursor:
+                        cursor.execute(sql, params)
+                        # 使用DictCursor，直接返回字典列表
+                        rows = cursor.fetchall()
+                        return rows
             except Exception as e:
                 print(f"SQL查询执行失败 (尝试 {attempt + 1}/{max_retries}): {e}")
                 if attempt < max_retries - 1:
-                    # 重置连接，准备重试
-                    self.close_connection()
                     continue
                 else:
                     # 最后一次尝试失败，抛出异常
@@ -445,26 +673,66 @@ class DatabaseConfig:
         max_retries = 3
         for attempt in range(max_retries):
             try:
-                connection = self.get_connection()
-                with connection.cursor() as cursor:
-                    cursor.execute(sql, params)
+                with self.pooled_connection() as connection:
+                    with connection.cursor() as cursor:
+                        cursor.execute(sql, params)
                 return True
             except Exception as e:
-                error_message = str(e)
-                
-                # 如果仍然遇到重复约束错误，可能是旧约束未清理，记录日志
-                
                 print(f"SQL插入执行失败 (尝试 {attempt + 1}/{max_retries}): {e}")
                 if attempt < max_retries - 1:
-                    # 重置连接，准备重试
-                    self.close_connection()
                     continue
                 else:
                     # 最后一次尝试失败，返回False
                     return False
-    
 
-    
+    def execute_insert_many(self, sql: str, params_list: List[tuple]) -> int:
+        """
+        批量执行参数化插入（整批在一个事务中提交），支持自动重连
+
+        PyMySQL的executemany会把 INSERT ... VALUES (%s, ...) 改写为多行VALUES语句，
+        一次往返即可写入整个分块
+
+        Args:
+            sql: 参数化SQL语句，形如 INSERT INTO t (a, b) VALUES (%s, %s)
+            params_list: 参数元组列表（每个元组对应一行）
+
+        Returns:
+            影响的行数
+
+        Raises:
+            最后一次重试仍失败时抛出异常，由调用方按分块统计失败数
+        """
+        if not params_list:
+            return 0
+
+        max_retries = 3
+        for attempt in range(max_retries):
+            connection = None
+            discard = False
+            try:
+                connection = self.get_connection()
+                connection.begin()
+                with connection.cursor() as cursor:
+                    affected_rows = cursor.executemany(sql, params_list)
+                connection.commit()
+                return affected_rows or 0
+            except Exception as e:
+                # 回滚当前分块，避免部分写入；回滚失败说明连接已损坏
+                if connection is not None:
+                    try:
+                        connection.rollback()
+                    except Exception:
+                        discard = True
+
+                print(f"SQL批量插入执行失败 (尝试 {attempt + 1}/{max_retries}): {e}")
+                if attempt < max_retries - 1:
+                    continue
+                else:
+                    raise
+            finally:
+                if connection is not None:
+                    self.release_connection(connection, discard=discard)
+
     def test_connection(self) -> bool:
         """测试数据库连接"""
         try:
@@ -474,13 +742,11 @@ class DatabaseConfig:
             return False
     
     def close_connection(self):
-        """关闭数据库连接"""
-        if self.connection:
-            try:
-                self.connection.close()
-                self.connection = None
-            except:
-                pass
+        """关闭连接池中的空闲连接（借出中的连接在归还时关闭）"""
+        try:
+            self.pool.close_all()
+        except:
+            pass
 
 # 全局数据库配置实例
 db_config = DatabaseConfig()
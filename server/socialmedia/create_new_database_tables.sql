@@ -85,9 +85,16 @@ CREATE TABLE IF NOT EXISTS `dwd_dash_social_comments` (
     `ai_processing_status` VARCHAR(20) COLLATE utf8mb4_unicode_ci DEFAULT 'pending' COMMENT 'AI处理状态：pending/processing/completed/failed',
     `extreme_negative_processing_status` VARCHAR(20) COLLATE utf8mb4_unicode_ci DEFAULT 'pending' COMMENT '极端负面分析状态：pending/processing/completed/failed',
     
+    -- AI分析认领（租约）字段：processing 状态的记录由持有租约的工作进程处理，租约过期后可被其他进程重新认领
+    `ai_worker_id` VARCHAR(100) COLLATE utf8mb4_unicode_ci DEFAULT NULL COMMENT '认领该记录的AI分析工作进程（主机:进程号:认领ID）',
+    `ai_lease_expires_at` DATETIME DEFAULT NULL COMMENT 'AI分析租约到期时间',
+    `ai_attempts` INT NOT NULL DEFAULT '0' COMMENT 'AI分析认领次数（failed记录达到上限后不再自动认领）',
+    
     -- AI分析结果字段
     `ai_sentiment` VARCHAR(20) COLLATE utf8mb4_unicode_ci DEFAULT NULL COMMENT 'AI情感分析结果：positive/negative/neutral',
+    `extremely_negative` TINYINT(1) DEFAULT '0' COMMENT '是否为极端负面评论（极端负面分析完成后写入）',
     `ai_confidence` DECIMAL(5,4) DEFAULT NULL COMMENT 'AI分析置信度',
+    `ai_sentiment_source` VARCHAR(20) COLLATE utf8mb4_unicode_ci DEFAULT NULL COMMENT '情感标签来源：openai/prescreen（为空表示OpenAI）',
     `ai_processed_at` DATETIME DEFAULT NULL COMMENT 'AI分析处理时间',
     
     PRIMARY KEY (`record_id`) /*T![clustered_index] CLUSTERED */,
@@ -106,6 +113,8 @@ CREATE TABLE IF NOT EXISTS `dwd_dash_social_comments` (
     KEY `idx_dwd_ai_processing_status` (`ai_processing_status`),
     KEY `idx_extreme_negative_processing_status` (`extreme_negative_processing_status`),
     KEY `idx_ai_extreme_combined` (`ai_processing_status`,`extreme_negative_processing_status`),
+    KEY `idx_ai_claim` (`ai_processing_status`,`ai_lease_expires_at`,`record_id`),
+    KEY `idx_ai_worker_id` (`ai_worker_id`),
     UNIQUE KEY `uk_dwd_dedupe` (`dedupe_date`,`brand_label`,`author_name`,`channel`,`text`(255))
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci 
 COMMENT='DWD层-去重后的社交媒体数据';
@@ -246,7 +255,70 @@ CREATE TABLE IF NOT EXISTS `dwd_etl_processing_log` (
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='ETL处理日志表 - 记录ODS到DWD、DWD到AI的数据处理过程和统计信息';
 
 -- ================================================================
--- 6. 清理未使用字段和已废弃的约束
+-- 6. DWS 小时级情感汇总表（由 ETLProcessor.process_dwd_to_ai 增量维护）
+-- ================================================================
+
+CREATE TABLE IF NOT EXISTS `dws_dash_social_sentiment_hourly` (
+    `id` BIGINT(20) NOT NULL AUTO_INCREMENT COMMENT '主键ID',
+    `stat_date` DATE NOT NULL COMMENT '统计日期（DATE(last_update)）',
+    `stat_hour` TINYINT(4) NOT NULL COMMENT '统计小时（HOUR(last_update)，0-23）',
+    `channel` VARCHAR(50) COLLATE utf8mb4_unicode_ci NOT NULL DEFAULT '' COMMENT '渠道/平台（空值记为空字符串）',
+    `brand_label` VARCHAR(100) COLLATE utf8mb4_unicode_ci NOT NULL DEFAULT '' COMMENT '品牌标签（空值记为空字符串）',
+    `ai_sentiment` VARCHAR(20) COLLATE utf8mb4_unicode_ci NOT NULL DEFAULT '' COMMENT 'AI情感分析结果（空值记为空字符串）',
+    `extremely_negative` TINYINT(1) NOT NULL DEFAULT '0' COMMENT '是否为极端负面评论',
+    
+    -- 聚合指标
+    `comment_count` INT(11) NOT NULL DEFAULT '0' COMMENT '评论数',
+    `confidence_count` INT(11) NOT NULL DEFAULT '0' COMMENT '有AI置信度的评论数',
+    `confidence_sum` DOUBLE NOT NULL DEFAULT '0' COMMENT 'AI置信度之和（用于计算平均值）',
+    `low_confidence_count` INT(11) NOT NULL DEFAULT '0' COMMENT '低置信度（<0.5）评论数',
+    `high_confidence_count` INT(11) NOT NULL DEFAULT '0' COMMENT '高置信度（>=0.8）评论数',
+    
+    `updated_at` DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+    
+    PRIMARY KEY (`id`) /*T![clustered_index] CLUSTERED */,
+    UNIQUE KEY `uk_rollup_dimension` (`stat_date`,`stat_hour`,`channel`,`brand_label`,`ai_sentiment`,`extremely_negative`),
+    KEY `idx_stat_date_channel` (`stat_date`,`channel`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci 
+COMMENT='DWS层-按小时、渠道、品牌、情感预聚合的评论数';
+
+-- 汇总表一致性状态：全量重建成功后置为一致，增量累加失败时置为不一致；
+-- 看板只在状态为一致时读取汇总表，并以汇总表自身的评论数作为总数，不再逐次统计明细表
+CREATE TABLE IF NOT EXISTS `dws_dash_social_rollup_state` (
+    `rollup_name` VARCHAR(50) COLLATE utf8mb4_unicode_ci NOT NULL COMMENT '汇总表名称',
+    `is_consistent` TINYINT(1) NOT NULL DEFAULT '0' COMMENT '汇总表是否与明细一致',
+    `last_rebuild_at` DATETIME DEFAULT NULL COMMENT '最近一次全量重建时间',
+    `last_error` TEXT COLLATE utf8mb4_unicode_ci COMMENT '最近一次增量更新失败原因',
+    `updated_at` DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+    
+    PRIMARY KEY (`rollup_name`) /*T![clustered_index] CLUSTERED */
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci 
+COMMENT='DWS汇总表一致性状态';
+
+-- 首次上线或历史回填：调用 POST /api/etl/rebuild-rollup（可选 start_date/end_date）重建汇总表；
+-- 只有不带日期范围的全量重建会把汇总表标记为一致，之后看板才会读取汇总表
+
+-- ================================================================
+-- 7. ETL增量处理检查点表（由 ETLProcessor.process_ods_to_dwd 增量模式维护）
+-- ================================================================
+
+CREATE TABLE IF NOT EXISTS `dwd_etl_checkpoint` (
+    `pipeline_name` VARCHAR(50) COLLATE utf8mb4_unicode_ci NOT NULL COMMENT '流水线名称：ods_to_dwd',
+    `high_watermark` BIGINT NOT NULL DEFAULT '0' COMMENT '已成功处理的最大源记录ID，下次从其后继续',
+    `last_batch_id` VARCHAR(50) COLLATE utf8mb4_unicode_ci DEFAULT NULL COMMENT '最近一次推进水位的ETL批次ID',
+    `created_at` DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+    `updated_at` DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+    
+    PRIMARY KEY (`pipeline_name`) /*T![clustered_index] CLUSTERED */
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci 
+COMMENT='ETL增量处理水位表 - 水位只在对应范围的DWD写入成功后推进';
+
+-- 注意：TiDB多实例下AUTO_INCREMENT只保证单实例内递增，并发上传也会交错提交，提交较晚的小ID记录可能落在水位之下；
+-- 增量处理每次运行先自动补处理水位以下 processed_flag = 0 的记录（每次最多 catchup_batch_size 条，
+-- 环境变量 ETL_CATCHUP_BATCH_SIZE，默认1000，0 表示关闭），无需为此手动执行全量模式
+
+-- ================================================================
+-- 8. 清理未使用字段和已废弃的约束
 -- ================================================================
 
 -- 删除DWD_AI表中未使用的字段（确认后执行）
@@ -274,8 +346,39 @@ CREATE TABLE IF NOT EXISTS `dwd_etl_processing_log` (
 --        SUM(CASE WHEN ai_summary IS NOT NULL THEN 1 ELSE 0 END) as has_summary
 -- FROM dwd_dash_social_comments_ai;
 
+-- 已有DWD表补充极端负面结果字段（DWD → DWD_AI 同步直接读取该字段，不再重复调用AI）
+ALTER TABLE dwd_dash_social_comments 
+    ADD COLUMN IF NOT EXISTS `extremely_negative` TINYINT(1) DEFAULT '0' COMMENT '是否为极端负面评论（极端负面分析完成后写入）' AFTER `ai_sentiment`;
+
+-- 添加字段后执行一次：已同步的记录从DWD_AI回填结果，
+-- 已完成极端负面分析但尚未同步的负面记录重置为pending，由 BatchExtremeNegativeAnalyzer 重新分析并写入结果
+-- UPDATE dwd_dash_social_comments d
+-- JOIN dwd_dash_social_comments_ai ai ON d.record_id = ai.dwd_record_id
+-- SET d.extremely_negative = ai.extremely_negative;
+-- UPDATE dwd_dash_social_comments d
+-- LEFT JOIN dwd_dash_social_comments_ai ai ON d.record_id = ai.dwd_record_id
+-- SET d.extreme_negative_processing_status = 'pending'
+-- WHERE ai.dwd_record_id IS NULL
+--   AND d.ai_sentiment = 'negative'
+--   AND d.extreme_negative_processing_status = 'completed';
+
+-- 已有DWD表补充AI分析租约字段（多个AI分析进程并发认领记录，详见第10节）
+ALTER TABLE dwd_dash_social_comments 
+    ADD COLUMN IF NOT EXISTS `ai_worker_id` VARCHAR(100) COLLATE utf8mb4_unicode_ci DEFAULT NULL COMMENT '认领该记录的AI分析工作进程（主机:进程号:认领ID）' AFTER `extreme_negative_processing_status`,
+    ADD COLUMN IF NOT EXISTS `ai_lease_expires_at` DATETIME DEFAULT NULL COMMENT 'AI分析租约到期时间' AFTER `ai_worker_id`;
+ALTER TABLE dwd_dash_social_comments ADD INDEX IF NOT EXISTS `idx_ai_claim` (`ai_processing_status`,`ai_lease_expires_at`,`record_id`);
+ALTER TABLE dwd_dash_social_comments ADD INDEX IF NOT EXISTS `idx_ai_worker_id` (`ai_worker_id`);
+
+-- 已有DWD表补充AI分析认领次数字段（失败记录超过 AI_MAX_ATTEMPTS 次后不再自动认领）
+ALTER TABLE dwd_dash_social_comments 
+    ADD COLUMN IF NOT EXISTS `ai_attempts` INT NOT NULL DEFAULT '0' COMMENT 'AI分析认领次数（failed记录达到上限后不再自动认领）' AFTER `ai_lease_expires_at`;
+
+-- 已有DWD表补充情感标签来源字段（本地预筛给出的标签不参与预筛模型训练）
+ALTER TABLE dwd_dash_social_comments 
+    ADD COLUMN IF NOT EXISTS `ai_sentiment_source` VARCHAR(20) COLLATE utf8mb4_unicode_ci DEFAULT NULL COMMENT '情感标签来源：openai/prescreen（为空表示OpenAI）' AFTER `ai_confidence`;
+
 -- ================================================================
--- 7. 验证和查看表结构
+-- 9. 验证和查看表结构
 -- ================================================================
 
 -- 显示所有相关表及其统计信息
@@ -334,7 +437,7 @@ ORDER BY TABLE_NAME;
 -- LIMIT 10;
 
 -- ================================================================
--- 8. 数据架构说明和重要注意事项
+-- 10. 数据架构说明和重要注意事项
 -- ================================================================
 
 /*
@@ -347,7 +450,7 @@ ORDER BY TABLE_NAME;
 4. 日志表：完整的数据处理链路追踪
 
 📊 数据流向：
-原始数据 → ODS（直接保存）→ ETL（过滤+去重）→ DWD → AI分析 → DWD_AI
+原始数据 → ODS（直接保存）→ ETL（过滤+去重）→ DWD → AI分析 → DWD_AI → DWS小时级情感汇总
 
 🔄 去重机制：
 - 去重规则：DATE(last_update) + brand_label + author_name + channel + text(255)
@@ -361,6 +464,16 @@ ORDER BY TABLE_NAME;
 3. AI分析：sentiment分析→更新DWD层AI字段
 4. 数据同步：完成的AI分析结果→DWD_AI层
 
+🔐 AI分析认领（租约）：
+- 工作进程用一条 UPDATE ... ORDER BY record_id LIMIT n 把 pending/failed 或租约已过期的 processing 记录
+  置为 processing，并写入 ai_worker_id 和 ai_lease_expires_at，再按 ai_worker_id 读取本次认领的记录
+- 写回结果时带上 ai_worker_id 条件，租约过期后被其他进程重新认领的记录不会被旧进程覆盖
+- 租约时长由环境变量 AI_CLAIM_LEASE_SECONDS 控制（默认600秒），每处理完一个请求包续约一次
+- 每次认领累加 ai_attempts；failed 记录认领次数达到 AI_MAX_ATTEMPTS（默认3）后不再自动认领，
+  可通过 POST /api/ai/retry-failed 手动重置后重试
+- 极端负面分析整批置为 processing 后，写回失败会把该批记录置为 failed（下一轮重新领取）；
+  processing 状态的 updated_at 超过 EXTREME_PROCESSING_TIMEOUT_SECONDS（默认1800秒）视为进程已退出，记录可被重新领取
+
 ⚠️ 重要注意事项：
 1. ODS层接收所有原始数据，text和last_update可为空
 2. DWD层使用uk_dwd_dedupe唯一约束确保去重规则生效
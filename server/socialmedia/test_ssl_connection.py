@@ -45,7 +45,8 @@ def test_ssl_connection():
             result = db_config.execute_query("SELECT 1 as test")
             print(f"查询结果: {result}")
             
-            # 关闭连接
+            # 归还连接并关闭连接池中的空闲连接
+            db_config.release_connection(connection)
             db_config.close_connection()
             print("✅ 连接测试完成")
             
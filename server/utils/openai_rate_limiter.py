@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+OpenAI调用限流器（社交媒体分析与问卷分析服务共用）
+基于令牌桶同时限制每分钟请求数（RPM）和每分钟Token数（TPM），线程安全；
+收到429时按 Retry-After 暂停所有调用方并成倍降低速率，之后随成功请求逐步恢复（AIMD），
+取代各处写死的 time.sleep 间隔
+
+只依赖标准库，使用方把 server/utils 目录加入 sys.path 后 `import openai_rate_limiter`
+"""
+
+import os
+import time
+import random
+import threading
+import logging
+from typing import Dict, Any, Optional, Callable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的Token数
+
+    中文约1-1.5字符/Token，英文约4字符/Token，按2字符/Token折中估算
+    """
+    if not text:
+        return 0
+    return max(1, len(text) // 2)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """判断异常是否为429限流错误（兼容 openai.RateLimitError 及带 status_code 的HTTP异常）"""
+    if type(error).__name__ == 'RateLimitError':
+        return True
+    status_code = getattr(error, 'status_code', None)
+    if status_code is None:
+        status_code = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status_code == 429
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """从429响应头读取建议等待秒数（retry-after-ms / retry-after），没有时返回None"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        retry_after_ms = headers.get('retry-after-ms')
+        if retry_after_ms is not None:
+            return max(0.0, float(retry_after_ms) / 1000.0)
+        retry_after = headers.get('retry-after')
+        if retry_after is not None:
+            return max(0.0, float(retry_after))
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class RateLimiter:
+    """RPM/TPM 双令牌桶限流器，速率按429反馈自适应调整"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int,
+                 min_rate_factor: float = 0.1, increase_step: float = 0.02):
+        """
+        Args:
+            requests_per_minute: 每分钟请求数上限，<=0 表示不限制
+            tokens_per_minute: 每分钟Token数上限，<=0 表示不限制
+            min_rate_factor: 连续限流时速率最低降到配额的比例
+            increase_step: 每次成功请求恢复的速率比例（加性增）
+        """
+        self.requests_per_minute = max(0, int(requests_per_minute))
+        self.tokens_per_minute = max(0, int(tokens_per_minute))
+        self.min_rate_factor = min(1.0, max(0.01, float(min_rate_factor)))
+        self.increase_step = max(0.0, float(increase_step))
+
+        self._lock = threading.Lock()
+        self._request_bucket = float(self.requests_per_minute)
+        self._token_bucket = float(self.tokens_per_minute)
+        self._last_refill = time.monotonic()
+
+        # 自适应状态：当前速率系数、全局暂停截止时间、连续限流次数
+        self._rate_factor = 1.0
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._consecutive_rate_limits = 0
+
+        self._stats = {
+            'requests': 0,
+            'tokens': 0,
+            'waits': 0,
+            'total_wait_seconds': 0.0,
+            'rate_limited': 0
+        }
+
+    def _refill(self, now: float):
+        """按流逝时间和当前速率系数补充令牌（桶容量为一分钟的配额）"""
+        elapsed = now - self._last_refill
+        if elapsed <= 0:
+            return
+        if self.requests_per_minute:
+            self._request_bucket = min(
+                float(self.requests_per_minute),
+                self._request_bucket + elapsed * self.requests_per_minute * self._rate_factor / 60.0
+            )
+        if self.tokens_per_minute:
+            self._token_bucket = min(
+                float(self.tokens_per_minute),
+                self._token_bucket + elapsed * self.tokens_per_minute * self._rate_factor / 60.0
+            )
+        self._last_refill = now
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        阻塞直到获得一次请求配额及 tokens 个Token配额
+
+        Args:
+            tokens: 本次请求预计消耗的Token数（提示词 + 最大输出）
+
+        Returns:
+            本次等待的秒数
+        """
+        if self.tokens_per_minute:
+            # 单次请求超过整分钟配额时按整桶计算，避免永远等待
+            tokens = min(max(0, int(tokens)), self.tokens_per_minute)
+        else:
+            tokens = 0
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+
+                blocked_seconds = self._blocked_until - now
+                request_deficit = (1.0 - self._request_bucket) if self.requests_per_minute else 0.0
+                token_deficit = (tokens - self._token_bucket) if self.tokens_per_minute else 0.0
+
+                if blocked_seconds <= 0 and request_deficit <= 0 and token_deficit <= 0:
+                    if self.requests_per_minute:
+                        self._request_bucket -= 1.0
+                    if self.tokens_per_minute:
+                        self._token_bucket -= tokens
+                    self._stats['requests'] += 1
+                    self._stats['tokens'] += tokens
+                    if waited > 0:
+                        self._stats['waits'] += 1
+                        self._stats['total_wait_seconds'] += waited
+                    return waited
+
+                wait_seconds = max(blocked_seconds, 0.0)
+                if request_deficit > 0:
+                    wait_seconds = max(wait_seconds, request_deficit * 60.0 / (self.requests_per_minute * self._rate_factor))
+                if token_deficit > 0:
+                    wait_seconds = max(wait_seconds, token_deficit * 60.0 / (self.tokens_per_minute * self._rate_factor))
+
+            # 在锁外等待，分段睡眠以便及时响应其他线程释放的配额
+            sleep_seconds = min(max(wait_seconds, 0.01), 5.0)
+            time.sleep(sleep_seconds)
+            waited += sleep_seconds
+
+    def report_success(self):
+        """请求成功：速率系数加性恢复"""
+        with self._lock:
+            self._consecutive_rate_limits = 0
+            if self._rate_factor < 1.0:
+                self._rate_factor = min(1.0, self._rate_factor + self.increase_step)
+
+    def report_rate_limited(self, retry_after: Optional[float] = None) -> float:
+        """
+        请求被限流（429）：所有调用方暂停 retry_after 秒，速率系数减半
+
+        并发请求同时收到429时，一秒内只减半一次，避免速率被瞬间压到最低
+
+        Args:
+            retry_after: 服务端建议的等待秒数，没有时按连续限流次数指数退避
+
+        Returns:
+            实际暂停的秒数
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._consecutive_rate_limits += 1
+            self._stats['rate_limited'] += 1
+
+            if retry_after is None:
+                retry_after = min(60.0, 2.0 ** self._consecutive_rate_limits) + random.uniform(0, 1.0)
+            self._blocked_until = max(self._blocked_until, now + retry_after)
+
+            if now - self._last_decrease >= 1.0:
+                self._rate_factor = max(self.min_rate_factor, self._rate_factor / 2.0)
+                self._last_decrease = now
+                # 清空已积累的令牌，恢复后按降低后的速率重新发放
+                self._request_bucket = min(self._request_bucket, 0.0)
+                self._token_bucket = min(self._token_bucket, 0.0)
+
+            rate_factor = self._rate_factor
+
+        logger.warning(f"OpenAI请求被限流，暂停 {retry_after:.1f} 秒，速率降至配额的 {rate_factor:.0%}")
+        return retry_after
+
+    def call(self, func: Callable[[], T], tokens: int = 0, max_retries: int = None) -> T:
+        """
+        在限流器控制下执行一次OpenAI调用，429时按 Retry-After 等待后重试
+
+        Args:
+            func: 发起请求的无参函数
+            tokens: 本次请求预计消耗的Token数
+            max_retries: 429最大重试次数，默认读取环境变量 OPENAI_RATE_LIMIT_RETRIES
+
+        Returns:
+            func 的返回值；非429异常或重试耗尽时抛出原异常
+        """
+        if max_retries is None:
+            max_retries = int(os.getenv('OPENAI_RATE_LIMIT_RETRIES', 3))
+
+        attempt = 0
+        while True:
+            self.acquire(tokens)
+            try:
+                result = func()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= max_retries:
+                    raise
+                attempt += 1
+                self.report_rate_limited(get_retry_after(e))
+                continue
+
+            self.report_success()
+            return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取限流统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+            rate_factor = self._rate_factor
+        stats.update({
+            'requests_per_minute': self.requests_per_minute,
+            'tokens_per_minute': self.tokens_per_minute,
+            'rate_factor': round(rate_factor, 3),
+            'total_wait_seconds': round(stats['total_wait_seconds'], 3)
+        })
+        return stats
+
+
+_openai_rate_limiter = None
+_openai_rate_limiter_lock = threading.Lock()
+
+
+def get_openai_rate_limiter() -> RateLimiter:
+    """
+    获取进程内共享的OpenAI限流器
+
+    配额来自环境变量 OPENAI_RPM_LIMIT / OPENAI_TPM_LIMIT，
+    自适应参数来自 OPENAI_RATE_MIN_FACTOR / OPENAI_RATE_INCREASE_STEP
+    """
+    global _openai_rate_limiter
+    if _openai_rate_limiter is None:
+        with _openai_rate_limiter_lock:
+            if _openai_rate_limiter is None:
+                rpm = int(os.getenv('OPENAI_RPM_LIMIT', 300))
+                tpm = int(os.getenv('OPENAI_TPM_LIMIT', 150000))
+                _openai_rate_limiter = RateLimiter(
+                    rpm, tpm,
+                    min_rate_factor=float(os.getenv('OPENAI_RATE_MIN_FACTOR', 0.1)),
+                    increase_step=float(os.getenv('OPENAI_RATE_INCREASE_STEP', 0.02))
+                )
+                logger.info(f"OpenAI限流器初始化：RPM={rpm}，TPM={tpm}")
+    return _openai_rate_limiter